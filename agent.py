@@ -0,0 +1,86 @@
+"""
+Synchronous agent loop: call the model, execute its function calls, repeat
+"""
+
+import traceback
+
+from functions.config import WORKING_DIRECTORY
+from functions.metrics import recorder
+from functions.scheduler import execute_function_calls
+from history import ConversationHistory
+from transport import content_to_text
+
+
+def run_agent(model, user_prompt, max_iterations=5, working_directory=WORKING_DIRECTORY):
+    """
+    Run the agent loop until the model gives a final answer.
+
+    Args:
+        model: Anything with generate_content(messages), e.g. a genai.GenerativeModel
+            or one of the transports in transport.py
+        user_prompt (str): The user's request
+        max_iterations (int): Maximum number of model round-trips
+        working_directory (str): The base working directory injected into the tools
+
+    Returns:
+        ConversationHistory: The conversation
+    """
+    # Initialize the conversation; older large results get compacted as it grows
+    history = ConversationHistory(user_prompt)
+
+    # Loop to call the LLM repeatedly with a maximum of max_iterations (to reduce API calls)
+    for i in range(max_iterations):
+        try:
+            with recorder.span("iteration", iteration=i+1):
+                print(f"Iteration {i+1}")
+                # Generate content with the (compacted) conversation history
+                messages = history.messages()
+                with recorder.span("model", iteration=i+1) as record:
+                    record["request_chars"] = sum(len(part) for message in messages for part in message["parts"])
+                    response = model.generate_content(messages)
+            
+                # Add the model's response to the conversation
+                if response.candidates and response.candidates[0].content:
+                    history.add_model(content_to_text(response.candidates[0].content))
+            
+                # Check if there's a text response (final answer)
+                if hasattr(response, 'text') and response.text:
+                    print("Final response:")
+                    print(response.text)
+                    break
+            
+                # Check if there are function calls in the response
+                function_calls = []
+                if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+                    for part in response.candidates[0].content.parts:
+                        if hasattr(part, 'function_call') and part.function_call:
+                            function_call = part.function_call
+                            print(f"Calling function: {function_call.name}({function_call.args})")
+                            function_calls.append((function_call.name, function_call.args))
+                function_called = bool(function_calls)
+            
+                # Execute the calls (independent read-only calls run concurrently) and
+                # add the results to the conversation in the order they were requested
+                results = execute_function_calls(function_calls, working_directory)
+                for (name, args), result in zip(function_calls, results):
+                    print(result)
+                    history.add_result(name, args, result)
+            
+                # If no function was called and no text response, break
+                if not function_called and (not hasattr(response, 'text') or not response.text):
+                    print("No further actions or response generated.")
+                    break
+                
+        except Exception as e:
+            # Check if this is a rate limit error and try to use OpenRouter as fallback
+            if "429" in str(e) or "Resource exhausted" in str(e):
+                print("Gemini API rate limit exceeded. To use OpenRouter as fallback, please implement the fallback mechanism.")
+                print("Error details:", str(e))
+            else:
+                print(f"Error occurred: {e}")
+                traceback.print_exc()
+            break
+    else:
+        print("Reached maximum iterations without completing the task.")
+
+    return history
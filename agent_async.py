@@ -0,0 +1,99 @@
+"""
+Asyncio version of the agent loop, driven by streaming model responses
+"""
+
+import time
+import traceback
+
+from functions.config import WORKING_DIRECTORY
+from functions.metrics import recorder
+from functions.async_scheduler import AsyncCallScheduler
+from history import ConversationHistory
+from transport import content_to_text
+
+
+def _chunk_parts(chunk):
+    """Get the content parts of a streamed response chunk."""
+    if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+        return chunk.candidates[0].content.parts
+    return []
+
+
+async def run_agent_async(model, user_prompt, max_iterations=5, working_directory=WORKING_DIRECTORY):
+    """
+    Run the agent loop on asyncio with streamed model responses.
+
+    Each function call starts in a worker thread as soon as its part has arrived, so
+    tools run while the rest of the response is still streaming in, and text is
+    printed as it arrives instead of after the whole response.
+
+    Args:
+        model: A genai.GenerativeModel configured with the agent's tools
+        user_prompt (str): The user's request
+        max_iterations (int): Maximum number of model round-trips
+        working_directory (str): The base working directory injected into the tools
+
+    Returns:
+        ConversationHistory: The conversation
+    """
+    history = ConversationHistory(user_prompt)
+
+    for i in range(max_iterations):
+        scheduler = AsyncCallScheduler(working_directory)
+        try:
+            with recorder.span("iteration", iteration=i+1):
+                print(f"Iteration {i+1}")
+                function_calls = []
+                text_seen = False
+
+                messages = history.messages()
+                with recorder.span("model", iteration=i+1) as record:
+                    record["request_chars"] = sum(len(part) for message in messages for part in message["parts"])
+                    start = time.perf_counter()
+                    response = await model.generate_content_async(messages, stream=True)
+                    async for chunk in response:
+                        if "first_chunk_s" not in record:
+                            record["first_chunk_s"] = time.perf_counter() - start
+                        for part in _chunk_parts(chunk):
+                            if hasattr(part, 'function_call') and part.function_call:
+                                function_call = part.function_call
+                                print(f"Calling function: {function_call.name}({function_call.args})")
+                                scheduler.submit(function_call.name, function_call.args)
+                                function_calls.append((function_call.name, function_call.args))
+                            elif getattr(part, 'text', None):
+                                if not text_seen:
+                                    print("Final response:")
+                                    text_seen = True
+                                print(part.text, end="", flush=True)
+                if text_seen:
+                    print()
+
+                # The stream has been consumed, so the aggregated content is available
+                if response.candidates and response.candidates[0].content:
+                    history.add_model(content_to_text(response.candidates[0].content))
+
+                for (name, args), result in zip(function_calls, await scheduler.results()):
+                    print(result)
+                    history.add_result(name, args, result)
+
+                # Without function calls there is nothing left to feed back to the model
+                if not len(scheduler):
+                    if not text_seen:
+                        print("No further actions or response generated.")
+                    break
+
+        except Exception as e:
+            if "429" in str(e) or "Resource exhausted" in str(e):
+                print("Gemini API rate limit exceeded. To use OpenRouter as fallback, please implement the fallback mechanism.")
+                print("Error details:", str(e))
+            else:
+                print(f"Error occurred: {e}")
+                traceback.print_exc()
+            break
+        finally:
+            # A stream that fails midway leaves calls behind; none may outlive the loop
+            await scheduler.cancel()
+    else:
+        print("Reached maximum iterations without completing the task.")
+
+    return history
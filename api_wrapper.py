@@ -3,72 +3,84 @@
 API wrapper for the Coding Assistant to be used by editor extensions
 """
 
+import inspect
 import os
 import sys
-import json
-from dotenv import load_dotenv
-# pyright: reportMissingImports=false
-import google.generativeai as genai
-from google.generativeai import types
 
-# Add the functions directory to the path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'functions'))
-
-from functions.get_files_info import get_files_info
-from functions.get_file_content import get_file_content
-from functions.run_python_file import run_python_file
-from functions.write_file import write_file
-from functions.search_replace import search_replace
-from functions.git_status import git_status
-from functions.code_complexity import code_complexity
-from functions.find_duplicates import find_duplicates
+# Tool modules are imported by the registry on first call, and the Gemini SDK and
+# dotenv only when the model is first used, so list/read commands start fast
+from functions.registry import TOOLS, ToolArgumentError
+from transport import make_transport
 
 class CodingAssistantAPI:
-    def __init__(self, working_directory="."):
-        """Initialize the API wrapper"""
+    def __init__(self, working_directory=".", transport=None):
+        """Initialize the API wrapper (transport: optional model transport, see transport.py)"""
         self.working_directory = working_directory
+        self._model = transport
+        self._model_loaded = transport is not None
+
+    @property
+    def model(self):
+        """The model transport, created on first use (None without an API key)"""
+        if not self._model_loaded:
+            self._model = self._create_model()
+            self._model_loaded = True
+        return self._model
+
+    @staticmethod
+    def _create_model():
+        from dotenv import load_dotenv
         load_dotenv()
         api_key = os.environ.get("GEMINI_API_KEY")
-        
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-001')
-        else:
-            self.model = None
+        spec = os.environ.get("AGENT_TRANSPORT")
+
+        if spec and spec.startswith("replay:"):
+            return make_transport(spec, None)
+        if not api_key:
+            return None
+        # pyright: reportMissingImports=false
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return make_transport(spec, lambda: genai.GenerativeModel('gemini-2.0-flash-001'))
+
+    def _tool(self, name, **kwargs):
+        # Bound through the schema like a model's call, so command-line strings and
+        # JSON numbers are converted to the declared types (ToolArgumentError if not)
+        return TOOLS[name](self.working_directory, kwargs)
     
     def list_files(self, directory="."):
         """List files in a directory"""
-        return get_files_info(self.working_directory, directory)
+        return self._tool("get_files_info", directory=directory)
     
     def read_file(self, file_path):
         """Read the contents of a file"""
-        return get_file_content(self.working_directory, file_path)
+        return self._tool("get_file_content", file_path=file_path)
     
     def run_python(self, file_path, args=None):
         """Run a Python file"""
         if args is None:
             args = []
-        return run_python_file(self.working_directory, file_path, args)
+        return self._tool("run_python_file", file_path=file_path, args=args)
     
     def write_file_content(self, file_path, content):
         """Write content to a file"""
-        return write_file(self.working_directory, file_path, content)
+        return self._tool("write_file", file_path=file_path, content=content)
     
     def search_and_replace(self, file_path, search_text, replace_text):
         """Search and replace text in a file"""
-        return search_replace(self.working_directory, file_path, search_text, replace_text)
+        return self._tool("search_replace", file_path=file_path, search_text=search_text, replace_text=replace_text)
     
     def get_git_status(self, repo_path="."):
         """Get git status of a repository"""
-        return git_status(self.working_directory, repo_path)
+        return self._tool("git_status", repo_path=repo_path)
     
     def analyze_complexity(self, file_path):
         """Analyze code complexity"""
-        return code_complexity(self.working_directory, file_path)
+        return self._tool("code_complexity", file_path=file_path)
     
     def find_duplicates(self, file_path, min_lines=3):
         """Find duplicate code blocks"""
-        return find_duplicates(self.working_directory, file_path, min_lines)
+        return self._tool("find_duplicates", file_path=file_path, min_lines=min_lines)
     
     def ask_ai(self, prompt):
         """Ask the AI a question"""
@@ -81,11 +93,39 @@ class CodingAssistantAPI:
         except Exception as e:
             return f"Error communicating with AI: {str(e)}"
 
-# For testing the API
+# Methods editor extensions may call, over JSON-RPC or the command line
+API_METHODS = (
+    "list_files",
+    "read_file",
+    "run_python",
+    "write_file_content",
+    "search_and_replace",
+    "get_git_status",
+    "analyze_complexity",
+    "find_duplicates",
+    "ask_ai",
+)
+
 if __name__ == "__main__":
     api = CodingAssistantAPI()
     
-    # Example usage
-    print("Testing API wrapper...")
-    print(api.list_files())
-    print(api.ask_ai("What is 2+2?"))
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        # Long-lived JSON-RPC server on stdin/stdout, one per editor workspace
+        from rpc_server import JsonRpcServer
+        JsonRpcServer(api, API_METHODS, param_errors=(ToolArgumentError,)).serve()
+    elif len(sys.argv) > 1 and sys.argv[1] in API_METHODS:
+        # One-shot command: api_wrapper.py <method> [args...]
+        method, args = getattr(api, sys.argv[1]), sys.argv[2:]
+        try:
+            inspect.signature(method).bind(*args)
+        except TypeError as e:
+            sys.exit(f"Error: {e}")
+        try:
+            print(method(*args))
+        except ToolArgumentError as e:
+            sys.exit(f"Error: {e}")
+    else:
+        # Example usage
+        print("Testing API wrapper...")
+        print(api.list_files())
+        print(api.ask_ai("What is 2+2?"))
\ No newline at end of file
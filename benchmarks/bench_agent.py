@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the agent loop and the tools in functions/
+
+Generates synthetic repositories of increasing size, then measures:
+  - every tool in registry.TOOLS on sample files of each repository
+  - the agent loop driven by a scripted model (transport.ScriptedTransport)
+
+Latencies are split into the phases of an iteration: model wait, dispatch
+(argument binding, caching, scheduling), tool execution and result formatting
+(building the conversation for the next request). Results are written as JSON
+so two runs can be compared with --compare.
+
+Usage:
+    python benchmarks/bench_agent.py --sizes 100 1000 --output bench.json
+    python benchmarks/bench_agent.py --compare bench.json --output new.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import registry
+from functions.tool_cache import result_cache
+from history import ConversationHistory
+from agent import run_agent
+from transport import ScriptedTransport
+
+FILES_PER_DIRECTORY = 100
+
+# Calls per tool for the tools that start a process (interpreter, linter, test runner)
+PROCESS_SAMPLES = 3
+
+SOURCE_TEMPLATE = '''"""Synthetic module {index}"""
+import os
+
+
+class Model{index}:
+    def __init__(self, value):
+        self.value = value
+
+    def compute(self, items):
+        total = 0
+        for item in items:
+            if item > self.value and item % 2 == 0:
+                total += item
+            elif item < 0 or item == self.value:
+                total -= item
+        return total
+
+
+def helper_{index}(path):
+    # Read a file and count its words
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return len(f.read().split())
+'''
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "total_ms": sum(samples) * 1000,
+    }
+
+
+def generate_repository(root, file_count):
+    """Create file_count Python modules, FILES_PER_DIRECTORY per package directory."""
+    for index in range(file_count):
+        package = os.path.join(root, f"pkg{index // FILES_PER_DIRECTORY:04d}")
+        if index % FILES_PER_DIRECTORY == 0:
+            os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"module{index:06d}.py"), "w", encoding="utf-8") as f:
+            f.write(SOURCE_TEMPLATE.format(index=index))
+
+
+def sample_files(file_count, samples, seed=0):
+    rng = random.Random(seed)
+    indexes = rng.sample(range(file_count), min(samples, file_count))
+    return [f"pkg{index // FILES_PER_DIRECTORY:04d}/module{index:06d}.py" for index in indexes]
+
+
+class PhaseTimer:
+    """
+    Splits registry.dispatch time into tool execution and dispatch overhead, and
+    times ConversationHistory.messages() as result formatting, by wrapping them for
+    the duration of the benchmark.
+
+    The scheduler runs calls in parallel threads; a dispatch and its tool run in
+    the same thread, so tool time is accumulated per thread and each dispatch only
+    subtracts the tool time of its own thread.
+    """
+
+    def __init__(self):
+        self.phases = {"model_wait": [], "dispatch": [], "tool": [], "format": []}
+        self._saved = []
+        self._thread = threading.local()
+
+    def __enter__(self):
+        for tool in registry.TOOLS.values():
+            self._saved.append((tool, tool.func))
+            tool.func = self._timed_tool(tool.func)
+
+        original_dispatch = registry.dispatch
+        self._saved.append((registry, original_dispatch))
+
+        def timed_dispatch(*args, **kwargs):
+            before = getattr(self._thread, "tool_seconds", 0.0)
+            start = time.perf_counter()
+            result = original_dispatch(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            tool_time = getattr(self._thread, "tool_seconds", 0.0) - before
+            self.phases["dispatch"].append(elapsed - tool_time)
+            return result
+
+        registry.dispatch = timed_dispatch
+
+        original_messages = ConversationHistory.messages
+        self._saved.append((ConversationHistory, original_messages))
+
+        def timed_messages(history):
+            start = time.perf_counter()
+            messages = original_messages(history)
+            self.phases["format"].append(time.perf_counter() - start)
+            return messages
+
+        ConversationHistory.messages = timed_messages
+        return self
+
+    def _timed_tool(self, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._thread.tool_seconds = getattr(self._thread, "tool_seconds", 0.0) + elapsed
+                self.phases["tool"].append(elapsed)
+        return timed
+
+    def __exit__(self, *exc_info):
+        for owner, saved in reversed(self._saved):
+            if owner is registry:
+                registry.dispatch = saved
+            elif owner is ConversationHistory:
+                ConversationHistory.messages = saved
+            else:
+                owner.func = saved
+        return False
+
+
+class TimedTransport:
+    """Records how long the agent loop waits for each model response."""
+
+    def __init__(self, model, timer):
+        self.model = model
+        self.timer = timer
+
+    def generate_content(self, messages):
+        start = time.perf_counter()
+        response = self.model.generate_content(messages)
+        self.timer.phases["model_wait"].append(time.perf_counter() - start)
+        return response
+
+
+def _copies(root, files, label):
+    """Copies of the sample files under scratch/<label>, for the tools that modify files."""
+    copies = []
+    for i, path in enumerate(files):
+        copy = f"scratch/{label}/{i}_{os.path.basename(path)}"
+        os.makedirs(os.path.join(root, os.path.dirname(copy)), exist_ok=True)
+        shutil.copyfile(os.path.join(root, path), os.path.join(root, copy))
+        copies.append(copy)
+    return copies
+
+
+def _new_files(root, directory, count, label):
+    """Files created for the tools that remove or commit files, one per call."""
+    paths = []
+    for i in range(count):
+        path = f"{directory}/{label}_{i}.py"
+        with open(os.path.join(root, path), "w", encoding="utf-8") as f:
+            f.write(SOURCE_TEMPLATE.format(index=i))
+        paths.append(path)
+    return paths
+
+
+def prepare_fixtures(root, files):
+    """A git repository and a test suite next to the modules, for the git and test tools."""
+    repo = os.path.join(root, "gitrepo")
+    os.makedirs(repo)
+    for path in files:
+        shutil.copyfile(os.path.join(root, path), os.path.join(repo, os.path.basename(path)))
+    for command in (["init", "-q"], ["config", "user.name", "bench"], ["config", "user.email", "bench@example.com"],
+                    ["add", "."], ["commit", "-qm", "Initial commit"]):
+        subprocess.run(["git", *command], cwd=repo, check=True, stdout=subprocess.DEVNULL)
+
+    os.makedirs(os.path.join(root, "benchtests"))
+    with open(os.path.join(root, "benchtests", "test_bench.py"), "w", encoding="utf-8") as f:
+        f.write("import unittest\n\nclass Bench(unittest.TestCase):\n    def test_ok(self):\n        self.assertTrue(True)\n")
+
+
+# Arguments of the benchmarked calls of every tool, from (root, sample files, "cold" or
+# "warm"); tools that modify files get fresh copies or new files for each pass
+TOOL_CALLS = {
+    "get_files_info": lambda root, files, label: [{"directory": "."}] + [{"directory": d} for d in sorted({os.path.dirname(f) for f in files})],
+    "get_file_content": lambda root, files, label: [{"file_path": f} for f in files],
+    "run_python_file": lambda root, files, label: [{"file_path": f} for f in files[:PROCESS_SAMPLES]],
+    "write_file": lambda root, files, label: [{"file_path": f"scratch/{label}/new_{i}.py", "content": SOURCE_TEMPLATE.format(index=i)} for i in range(len(files))],
+    "search_replace": lambda root, files, label: [{"file_path": f, "search_text": "total", "replace_text": "subtotal"} for f in _copies(root, files, label)],
+    "delete_file": lambda root, files, label: [{"file_path": f} for f in _new_files(root, "scratch", len(files), f"delete_{label}")],
+    "create_directory": lambda root, files, label: [{"directory_path": f"scratch/{label}/dir_{i}"} for i in range(len(files))],
+    "regex_search": lambda root, files, label: [{"file_path": f, "pattern": r"def \w+"} for f in files] + [{"file_path": ".", "pattern": r"helper_\d+0\("}],
+    "git_status": lambda root, files, label: [{"repo_path": "gitrepo"}] * len(files),
+    "code_complexity": lambda root, files, label: [{"file_path": f} for f in files],
+    "find_duplicates": lambda root, files, label: [{"file_path": f} for f in files],
+    "find_clones": lambda root, files, label: [{"directory": d} for d in sorted({os.path.dirname(f) for f in files})],
+    "git_commit": lambda root, files, label: [{"repo_path": "gitrepo", "message": f"Add {os.path.basename(f)}", "files": [os.path.basename(f)]}
+                                              for f in _new_files(root, "gitrepo", PROCESS_SAMPLES, f"commit_{label}")],
+    "git_diff": lambda root, files, label: [{"repo_path": "gitrepo"}] * len(files),
+    "git_log": lambda root, files, label: [{"repo_path": "gitrepo"}] * len(files),
+    "count_lines": lambda root, files, label: [{"file_path": f} for f in files],
+    "run_tests": lambda root, files, label: [{"test_path": "benchtests"}] * PROCESS_SAMPLES,
+    "lint_code": lambda root, files, label: [{"file_path": f} for f in files[:PROCESS_SAMPLES]],
+    "extract_function": lambda root, files, label: [{"file_path": f, "function_name": "count_words", "start_line": 23, "end_line": 24}
+                                                    for f in _copies(root, files, f"extract_{label}")],
+    "rename_symbol": lambda root, files, label: [{"file_path": f, "old_name": "compute", "new_name": "evaluate"}
+                                                 for f in _copies(root, files, f"rename_{label}")],
+    "add_dependency": lambda root, files, label: [{"package_name": f"bench-package-{label}-{i}"} for i in range(len(files))],
+}
+
+
+def bench_tools(root, file_count, samples):
+    """Time every registered tool on sample files, with the result cache cleared (cold) and warm."""
+    missing = sorted(set(registry.TOOLS) - set(TOOL_CALLS))
+    if missing:
+        raise SystemExit(f"No benchmark calls defined for: {', '.join(missing)} (add them to TOOL_CALLS)")
+    files = sample_files(file_count, samples)
+    prepare_fixtures(root, files)
+    results = {}
+    for name in registry.TOOLS:
+        for label in ("cold", "warm"):
+            arg_list = TOOL_CALLS[name](root, files, label)
+            if label == "cold":
+                result_cache.invalidate()
+            timings = []
+            for args in arg_list:
+                start = time.perf_counter()
+                registry.dispatch(name, args, root)
+                timings.append(time.perf_counter() - start)
+            results[f"{name}.{label}"] = summarize(timings)
+    return results
+
+
+def bench_agent_loop(root, file_count, sessions, model_latency):
+    """Drive the agent loop with a scripted model reading, searching and analysing files."""
+    files = sample_files(file_count, 3, seed=1)
+    script = [
+        {"function_calls": [{"name": "get_files_info", "args": {"directory": "."}}]},
+        {"function_calls": [{"name": "get_file_content", "args": {"file_path": f}} for f in files]},
+        {"function_calls": [{"name": "regex_search", "args": {"file_path": f, "pattern": "if .*:"}} for f in files]
+                           + [{"name": "code_complexity", "args": {"file_path": f}} for f in files]},
+        "Summary of the findings.",
+    ]
+    timer = PhaseTimer()
+    session_times = []
+    with timer:
+        for _ in range(sessions):
+            result_cache.invalidate()
+            model = TimedTransport(ScriptedTransport(script, latency=model_latency), timer)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_agent(model, "Review the repository", max_iterations=len(script), working_directory=root)
+            session_times.append(time.perf_counter() - start)
+
+    results = {f"agent.{phase}": summarize(samples) for phase, samples in timer.phases.items()}
+    results["agent.session"] = summarize(session_times)
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Print p50/p95 changes against a baseline run and return the regressions."""
+    regressions = []
+    for size, metrics in current["results"].items():
+        for metric, values in metrics.items():
+            old = baseline.get("results", {}).get(size, {}).get(metric)
+            if not old:
+                continue
+            for key in ("p50_ms", "p95_ms"):
+                if old[key] <= 0:
+                    continue
+                change = (values[key] - old[key]) / old[key]
+                marker = ""
+                # Ignore sub-millisecond noise
+                if change > threshold and values[key] - old[key] > 0.1:
+                    marker = "  REGRESSION"
+                    regressions.append((size, metric, key, change))
+                print(f"  {size:>7} {metric:<28} {key}: {old[key]:9.3f} -> {values[key]:9.3f} ms ({change:+.0%}){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop and tools")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Repository sizes in files (e.g. 100 1000 10000 100000)")
+    parser.add_argument("--samples", type=int, default=50, help="Files sampled per tool")
+    parser.add_argument("--sessions", type=int, default=5, help="Agent loop sessions per size")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Simulated model latency in seconds")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative slowdown reported as a regression")
+    options = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": {},
+    }
+
+    for size in options.sizes:
+        root = tempfile.mkdtemp(prefix=f"bench_{size}_")
+        try:
+            start = time.perf_counter()
+            generate_repository(root, size)
+            print(f"Repository with {size} files generated in {time.perf_counter() - start:.1f}s")
+            results = bench_tools(root, size, options.samples)
+            results.update(bench_agent_loop(root, size, options.sessions, options.model_latency))
+            report["results"][str(size)] = results
+            for metric, values in results.items():
+                print(f"  {metric:<28} p50={values['p50_ms']:9.3f} ms  p95={values['p95_ms']:9.3f} ms  n={values['count']}")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {options.output}")
+
+    if options.compare:
+        with open(options.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparison with {options.compare}:")
+        regressions = compare(baseline, report, options.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {options.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
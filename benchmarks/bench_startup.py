@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark of the entry points, based on python -X importtime
+
+Imports each entry point in a fresh interpreter several times and reports the
+median cumulative import time together with the slowest imports of the last run.
+Exits with status 1 when an entry point exceeds its budget, so CI catches changes
+that pull the Gemini SDK or every tool module back into startup.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --budget-ms 150 --runs 9 --top 15
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ("main", "api_wrapper")
+
+# "import time: <self us> | <cumulative us> | <indented module name>"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr):
+    """
+    Parse the -X importtime report.
+
+    Returns:
+        tuple: (total cumulative microseconds of top-level imports, list of (cumulative us, module))
+    """
+    total = 0
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2))
+        module = match.group(4)
+        imports.append((cumulative, module))
+        # Top-level imports are indented by one space; nested ones by more
+        if len(match.group(3)) == 1:
+            total += cumulative
+    return total, imports
+
+
+def measure(module, runs):
+    """Import module in runs fresh interpreters; return the median total (us) and the last report."""
+    totals = []
+    imports = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        total, imports = parse_importtime(result.stderr)
+        totals.append(total)
+    return statistics.median(totals), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the entry points")
+    parser.add_argument("--modules", nargs="+", default=list(ENTRY_POINTS), help="Modules to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Maximum median import time per module")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    options = parser.parse_args()
+
+    over_budget = []
+    for module in options.modules:
+        median_us, imports = measure(module, options.runs)
+        median_ms = median_us / 1000
+        marker = "  OVER BUDGET" if median_ms > options.budget_ms else ""
+        print(f"{module}: {median_ms:.1f} ms (median of {options.runs}, budget {options.budget_ms:.0f} ms){marker}")
+        for cumulative, name in sorted(imports, reverse=True)[:options.top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+        if marker:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Startup budget exceeded by: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
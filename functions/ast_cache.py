@@ -0,0 +1,55 @@
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .config import AST_CACHE_FILES
+
+
+class ParsedSource:
+    """
+    A parsed module, shared by every file with the same content.
+
+    derived holds results computed from the tree (keyed by the analysis name), so
+    analyzing unchanged source again costs a hash and a dictionary lookup.
+    """
+
+    __slots__ = ("tree", "derived")
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.derived = {}
+
+
+class AstCache:
+    """LRU cache of parsed Python modules keyed by the sha1 of their source."""
+
+    def __init__(self, max_entries=AST_CACHE_FILES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, source, filename="<unknown>"):
+        """
+        Parse Python source, or reuse the tree of identical source parsed before.
+
+        Raises:
+            SyntaxError: If the source does not parse (failures are not cached)
+        """
+        digest = hashlib.sha1(source.encode("utf-8", errors="surrogatepass")).digest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                return entry
+        # Parse outside the lock; two threads parsing the same source both get a valid tree
+        entry = ParsedSource(ast.parse(source, filename))
+        with self._lock:
+            entry = self._entries.setdefault(digest, entry)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+ast_cache = AstCache()
@@ -0,0 +1,63 @@
+import asyncio
+
+from . import registry
+from .config import WORKING_DIRECTORY, MAX_PARALLEL_TOOLS
+from .scheduler import _conflicts
+
+# Kept apart from scheduler.py so the synchronous loop does not import asyncio
+
+
+class AsyncCallScheduler:
+    """
+    Schedules function calls as they stream in from the model, on asyncio.
+
+    Calls are submitted one at a time while the response is still arriving and start
+    immediately in a worker thread, subject to the same ordering rules as
+    execute_function_calls.
+    """
+
+    def __init__(self, working_directory=WORKING_DIRECTORY, max_workers=MAX_PARALLEL_TOOLS):
+        self.working_directory = working_directory
+        self._limit = asyncio.Semaphore(max_workers)
+        self._classified = []
+        self._tasks = []
+        self._started = set()
+
+    def submit(self, name, args):
+        """Start a function call once every earlier conflicting call has finished."""
+        tool = registry.TOOLS.get(name)
+        classified = None if tool is None else (tool.is_read_only(args),
+                                                tool.touched_paths(self.working_directory, args))
+        dependencies = []
+        if classified is not None:
+            for earlier, task in zip(self._classified, self._tasks):
+                if earlier is not None and _conflicts(earlier, classified):
+                    dependencies.append(task)
+        self._classified.append(classified)
+        self._tasks.append(asyncio.create_task(self._run(name, args, dependencies)))
+
+    async def _run(self, name, args, dependencies):
+        if dependencies:
+            await asyncio.wait(dependencies)
+        async with self._limit:
+            self._started.add(asyncio.current_task())
+            return await asyncio.to_thread(registry.dispatch, name, args, self.working_directory)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def results(self):
+        """Wait for all submitted calls and return their results in submission order."""
+        return list(await asyncio.gather(*self._tasks))
+
+    async def cancel(self):
+        """
+        Cancel the calls that have not started yet and wait for the running ones.
+
+        A call already in its worker thread cannot be stopped, so it is awaited rather
+        than left to finish unobserved after the caller has moved on.
+        """
+        for task in self._tasks:
+            if task not in self._started:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
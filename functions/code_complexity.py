@@ -1,13 +1,275 @@
+import ast
 import os
 import re
+from collections import namedtuple
 
-def code_complexity(working_directory, file_path):
+from .ast_cache import ast_cache
+from .config import METRICS_TOP_N
+from .project_metrics import collect_metrics, group_by_package, top
+
+# Functions and classes listed in a report, most complex first
+MAX_COMPLEXITY_SCOPES = 25
+
+
+class Scope:
+    """Complexity metrics of one function or class."""
+
+    __slots__ = ("kind", "name", "lineno", "end_lineno", "decisions", "cognitive", "nesting")
+
+    def __init__(self, kind, name, lineno, end_lineno):
+        self.kind = kind
+        self.name = name
+        self.lineno = lineno
+        self.end_lineno = end_lineno
+        self.decisions = 0
+        self.cognitive = 0
+        self.nesting = 0
+
+    @property
+    def cyclomatic(self):
+        return self.decisions + 1
+
+    @property
+    def length(self):
+        return self.end_lineno - self.lineno + 1
+
+    def format(self):
+        return (f"{self.kind} {self.name} (lines {self.lineno}-{self.end_lineno}): cyclomatic {self.cyclomatic}, "
+                f"cognitive {self.cognitive}, nesting {self.nesting}, {self.length} lines")
+
+
+class _Analyzer(ast.NodeVisitor):
+    """
+    Collect the metrics of every function and class in one walk of the tree.
+
+    Cyclomatic complexity counts decision points (branches, loops, except clauses,
+    boolean operators, comprehension clauses, match cases). Cognitive complexity
+    follows the SonarSource rules: structures that break the linear flow cost 1 plus
+    their nesting level, and else/elif branches and boolean operator sequences cost 1.
+    Methods count towards their class; nested functions are reported on their own.
+    """
+
+    def __init__(self):
+        self.scopes = []
+        self.decisions = 0
+        self._stack = []
+        self._nesting = 0
+        self._depth = 0
+        self._methods = {}
+
+    def visit(self, node):
+        # NodeVisitor looks the method up by name on every node; cache it per node type
+        method = self._methods.get(node.__class__)
+        if method is None:
+            method = self._methods[node.__class__] = getattr(self, "visit_" + node.__class__.__name__,
+                                                              self.generic_visit)
+        return method(node)
+
+    def generic_visit(self, node):
+        for child in ast.iter_child_nodes(node):
+            self.visit(child)
+
+    def _leaf(self, node):
+        """Names, constants and the like contain no decisions."""
+
+    visit_Name = visit_Constant = visit_Load = visit_Store = visit_Del = _leaf
+
+    def _owners(self):
+        """The innermost scope and the classes enclosing it, up to the next function."""
+        for i, scope in enumerate(reversed(self._stack)):
+            if i and scope.kind == "function":
+                break
+            yield scope
+
+    def _count(self, decisions=0, cognitive=0):
+        self.decisions += decisions
+        for scope in self._owners():
+            scope.decisions += decisions
+            scope.cognitive += cognitive
+
+    def _nested(self, nodes, nesting=1, depth=1):
+        self._nesting += nesting
+        self._depth += depth
+        for scope in self._owners():
+            scope.nesting = max(scope.nesting, self._depth)
+        for node in nodes:
+            self.visit(node)
+        self._nesting -= nesting
+        self._depth -= depth
+
+    def _scope(self, node, kind):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        parent = self._stack[-1] if self._stack else None
+        name = f"{parent.name}.{node.name}" if parent else node.name
+        scope = Scope(kind, name, node.lineno, getattr(node, "end_lineno", None) or node.lineno)
+        self.scopes.append(scope)
+        saved = self._nesting, self._depth
+        # Functions nested in functions are one level deeper, as in the SonarSource rules
+        self._nesting = saved[0] + 1 if parent is not None and parent.kind == "function" else 0
+        self._depth = 0
+        self._stack.append(scope)
+        for child in ast.iter_child_nodes(node):
+            if child not in node.decorator_list:
+                self.visit(child)
+        self._stack.pop()
+        self._nesting, self._depth = saved
+
+    def visit_FunctionDef(self, node):
+        self._scope(node, "function")
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._scope(node, "class")
+
+    def visit_If(self, node, is_elif=False):
+        self._count(1, 1 if is_elif else 1 + self._nesting)
+        self.visit(node.test)
+        self._nested(node.body)
+        if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+            self.visit_If(node.orelse[0], is_elif=True)
+        elif node.orelse:
+            self._count(cognitive=1)
+            self._nested(node.orelse)
+
+    def _visit_loop(self, node):
+        self._count(1, 1 + self._nesting)
+        for child in (node.target, node.iter) if hasattr(node, "iter") else (node.test,):
+            self.visit(child)
+        self._nested(node.body)
+        if node.orelse:
+            self._count(cognitive=1)
+            self._nested(node.orelse)
+
+    visit_For = visit_AsyncFor = visit_While = _visit_loop
+
+    def visit_Try(self, node):
+        self._nested(node.body, nesting=0)
+        for handler in node.handlers:
+            self._count(1, 1 + self._nesting)
+            if handler.type is not None:
+                self.visit(handler.type)
+            self._nested(handler.body)
+        self._nested(node.orelse, nesting=0)
+        self._nested(node.finalbody, nesting=0)
+
+    visit_TryStar = visit_Try
+
+    def visit_With(self, node):
+        for item in node.items:
+            self.visit(item)
+        self._nested(node.body, nesting=0)
+
+    visit_AsyncWith = visit_With
+
+    def visit_Match(self, node):
+        cases = [case for case in node.cases
+                 if not (isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None)]
+        self._count(len(cases), 1 + self._nesting)
+        self.visit(node.subject)
+        self._nested(node.cases)
+
+    def visit_IfExp(self, node):
+        self._count(1, 1 + self._nesting)
+        self._nested((node.test, node.body, node.orelse), depth=0)
+
+    def visit_BoolOp(self, node):
+        self._count(len(node.values) - 1, 1)
+        self.generic_visit(node)
+
+    def visit_comprehension(self, node):
+        self._count(1 + len(node.ifs), 1 + len(node.ifs))
+        self.generic_visit(node)
+
+    def visit_Lambda(self, node):
+        self._nested((node.body,), depth=0)
+
+    def visit_Call(self, node):
+        # Recursion costs 1 in cognitive complexity
+        function = next((scope for scope in reversed(self._stack) if scope.kind == "function"), None)
+        if (function is not None and isinstance(node.func, ast.Name) and
+                function.name.rpartition(".")[2] == node.func.id):
+            self._count(cognitive=1)
+        self.generic_visit(node)
+
+
+def analyze_tree(tree):
+    """
+    Measure the functions and classes of a parsed module.
+
+    Returns:
+        tuple: (list of Scope in source order, decision points in the whole module)
     """
-    Analyze the complexity of a Python file by counting lines, functions, and cyclomatic complexity.
+    analyzer = _Analyzer()
+    analyzer.visit(tree)
+    return analyzer.scopes, analyzer.decisions
+
+
+# Summary of one file for directory reports; scopes holds its most complex functions
+FileComplexity = namedtuple("FileComplexity", "lines functions classes cyclomatic scopes")
+
+
+def _analyze(content, filename):
+    """Analyze Python source through the AST cache; raises SyntaxError."""
+    parsed = ast_cache.parse(content, filename)
+    analysis = parsed.derived.get("complexity")
+    if analysis is None:
+        analysis = parsed.derived["complexity"] = analyze_tree(parsed.tree)
+    return analysis
+
+
+def measure_files(files):
+    """
+    Summarize the complexity of Python files (runs in the worker processes).
+
+    Args:
+        files (list): (relative path, absolute path) tuples
+
+    Returns:
+        list: (relative path, FileComplexity or None for files that do not parse)
+    """
+    results = []
+    for rel_path, abs_path in files:
+        try:
+            with open(abs_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            scopes, decisions = _analyze(content, rel_path)
+        except (UnicodeDecodeError, OSError, SyntaxError, ValueError, RecursionError):
+            results.append((rel_path, None))
+            continue
+        functions = [scope for scope in scopes if scope.kind == "function"]
+        worst, _ = top(functions, lambda scope: (scope.cyclomatic, scope.cognitive), MAX_COMPLEXITY_SCOPES)
+        results.append((rel_path, FileComplexity(len(content.split('\n')), len(functions),
+                                                 len(scopes) - len(functions), decisions + 1, worst)))
+    return results
+
+
+def _rating(highest):
+    if highest > 20:
+        return "  Complexity rating: HIGH - Consider refactoring\n"
+    elif highest > 10:
+        return "  Complexity rating: MEDIUM - May need refactoring\n"
+    else:
+        return "  Complexity rating: LOW - Code is relatively simple\n"
+
+
+def code_complexity(working_directory, file_path, include=None, exclude=None, top_n=None, use_gitignore=True):
+    """
+    Analyze the complexity of a Python file and of each of its functions and classes.
+
+    The file is parsed with ast (parses are cached by content), so keywords in
+    strings and comments are not counted. For a directory, every Python file below
+    it is analyzed in parallel worker processes (unchanged files reuse their
+    previous results) and the most complex functions, files and packages are listed.
     
     Args:
         working_directory (str): The base working directory
-        file_path (str): Relative path to the file within the working directory
+        file_path (str): Relative path to the file (or directory) within the working directory
+        include (list): Glob patterns of the files analyzed in a directory
+        exclude (list): Glob patterns of files and directories skipped in a directory
+        top_n (int): Functions, files and packages listed for a directory (default: METRICS_TOP_N)
+        use_gitignore (bool): Skip files ignored by .gitignore in a directory
         
     Returns:
         str: Complexity analysis or error message
@@ -23,6 +285,13 @@ def code_complexity(working_directory, file_path):
         # Check if the path is within the working directory boundaries
         if not abs_full_path.startswith(abs_working_dir):
             return f'Error: Cannot access "{file_path}" as it is outside the permitted working directory'
+
+        if os.path.isdir(abs_full_path):
+            top_n = top_n or METRICS_TOP_N
+            if top_n < 1:
+                return 'Error: top_n must be at least 1'
+            return _analyze_directory(abs_working_dir, abs_full_path, file_path, include, exclude, top_n,
+                                      use_gitignore)
         
         # Check if the path is a file
         if not os.path.isfile(abs_full_path):
@@ -39,36 +308,16 @@ def code_complexity(working_directory, file_path):
         except OSError as e:
             return f'Error: Unable to read "{file_path}": {str(e)}'
         
-        # Analyze complexity metrics
-        lines = content.split('\n')
-        line_count = len(lines)
-        
-        # Count functions
-        function_pattern = r'^\s*def\s+\w+\s*\('
-        function_count = len(re.findall(function_pattern, content, re.MULTILINE))
-        
-        # Count classes
-        class_pattern = r'^\s*class\s+\w+'
-        class_count = len(re.findall(class_pattern, content, re.MULTILINE))
-        
-        # Count control structures for cyclomatic complexity approximation
-        control_patterns = [
-            r'\bif\b',
-            r'\bfor\b',
-            r'\bwhile\b',
-            r'\belif\b',
-            r'\bexcept\b',
-            r'\band\b',
-            r'\bor\b'
-        ]
-        
-        control_count = 0
-        for pattern in control_patterns:
-            control_count += len(re.findall(pattern, content))
-        
-        # Estimate cyclomatic complexity (simplified)
-        cyclomatic_complexity = control_count + 1
-        
+        # Parse once; unchanged content reuses the tree and the analysis
+        try:
+            scopes, decisions = _analyze(content, file_path)
+        except SyntaxError as e:
+            return f'Error: Unable to parse "{file_path}" as Python: {e.msg} (line {e.lineno})'
+        line_count = len(content.split('\n'))
+
+        functions = [scope for scope in scopes if scope.kind == "function"]
+        class_count = len(scopes) - len(functions)
+
         # Count comments
         comment_pattern = r'^\s*#'
         comment_count = len(re.findall(comment_pattern, content, re.MULTILINE))
@@ -76,34 +325,100 @@ def code_complexity(working_directory, file_path):
         # Prepare result
         result = f"Code Complexity Analysis for '{file_path}':\n"
         result += f"  Lines of code: {line_count}\n"
-        result += f"  Functions: {function_count}\n"
+        result += f"  Functions: {len(functions)}\n"
         result += f"  Classes: {class_count}\n"
-        result += f"  Estimated cyclomatic complexity: {cyclomatic_complexity}\n"
+        result += f"  Cyclomatic complexity: {decisions + 1}\n"
         result += f"  Comments: {comment_count}\n"
         
-        # Provide complexity rating
-        if cyclomatic_complexity > 20:
-            result += "  Complexity rating: HIGH - Consider refactoring\n"
-        elif cyclomatic_complexity > 10:
-            result += "  Complexity rating: MEDIUM - May need refactoring\n"
-        else:
-            result += "  Complexity rating: LOW - Code is relatively simple\n"
+        # Rate the most complex function (or the module code when there is none)
+        result += _rating(max((scope.cyclomatic for scope in functions), default=decisions + 1))
+
+        if scopes:
+            ranked = sorted(scopes, key=lambda scope: (-scope.cyclomatic, -scope.cognitive, scope.lineno))
+            result += "\nFunctions and classes (most complex first):\n"
+            for scope in ranked[:MAX_COMPLEXITY_SCOPES]:
+                result += f"  {scope.format()}\n"
+            if len(ranked) > MAX_COMPLEXITY_SCOPES:
+                result += f"  ... and {len(ranked) - MAX_COMPLEXITY_SCOPES} more\n"
         
         return result
             
     except Exception as e:
         return f'Error: An unexpected error occurred: {str(e)}'
 
+def _is_python(rel_path):
+    return rel_path.endswith((".py", ".pyi"))
+
+def _analyze_directory(abs_working_dir, abs_dir, dir_path, include, exclude, top_n, use_gitignore):
+    rows = collect_metrics("code_complexity", measure_files, abs_working_dir, abs_dir, include, exclude,
+                           use_gitignore, accept=_is_python)
+    if not rows:
+        return f"No parsable Python files found under '{dir_path}'"
+
+    functions = [(rel_path, scope) for rel_path, metrics in rows for scope in metrics.scopes]
+    result = f"Code Complexity Analysis for '{dir_path}' ({len(rows)} Python files):\n"
+    result += f"  Lines of code: {sum(metrics.lines for _, metrics in rows)}\n"
+    result += f"  Functions: {sum(metrics.functions for _, metrics in rows)}\n"
+    result += f"  Classes: {sum(metrics.classes for _, metrics in rows)}\n"
+    result += f"  Cyclomatic complexity: {sum(metrics.cyclomatic for _, metrics in rows)}\n"
+    result += _rating(max((scope.cyclomatic for _, scope in functions), default=1))
+
+    # Files only report their most complex functions, which are enough for the top ones
+    ranked, _ = top(functions, lambda item: (item[1].cyclomatic, item[1].cognitive), top_n)
+    if ranked:
+        result += "\nMost complex functions:\n"
+        for rel_path, scope in ranked:
+            result += f"  {rel_path}: {scope.format()}\n"
+        more = sum(metrics.functions for _, metrics in rows) - len(ranked)
+        if more:
+            result += f"  ... and {more} more functions\n"
+
+    ranked, more = top(rows, lambda row: row[1].cyclomatic, top_n)
+    result += "\nMost complex files (total cyclomatic complexity):\n"
+    for rel_path, metrics in ranked:
+        result += (f"  {rel_path}: cyclomatic {metrics.cyclomatic}, {metrics.functions} functions, "
+                   f"{metrics.lines} lines\n")
+    if more:
+        result += f"  ... and {more} more files\n"
+
+    packages = group_by_package(rows, ("cyclomatic", "functions", "lines"))
+    ranked, more = top(packages.items(), lambda item: item[1]["cyclomatic"], top_n)
+    result += "\nMost complex packages:\n"
+    for package, sums in ranked:
+        result += (f"  {package}: cyclomatic {sums['cyclomatic']}, {sums['functions']} functions, "
+                   f"{sums['lines']} lines in {sums['files']} files\n")
+    if more:
+        result += f"  ... and {more} more packages\n"
+    return result
+
 # Function declaration schema for LLM
 schema_code_complexity = {
     "name": "code_complexity",
-    "description": "Analyze the complexity of a Python file by counting lines, functions, classes, and estimating cyclomatic complexity.",
+    "description": "Analyze the complexity of a Python file: line, function and class counts, and the cyclomatic complexity, cognitive complexity, nesting depth and length of each function and class, most complex first. Given a directory, summarizes the whole project in one call.",
     "parameters": {
         "type": "object",
         "properties": {
             "file_path": {
                 "type": "string",
-                "description": "The path to the Python file to analyze, relative to the working directory.",
+                "description": "The path to the Python file to analyze, or to a directory to summarize every Python file below it, relative to the working directory.",
+            },
+            "include": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of the files analyzed in a directory.",
+            },
+            "exclude": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of files and directories skipped in a directory.",
+            },
+            "top_n": {
+                "type": "integer",
+                "description": f"Number of functions, files and packages listed for a directory, most complex first (default: {METRICS_TOP_N}).",
+            },
+            "use_gitignore": {
+                "type": "boolean",
+                "description": "Skip files ignored by .gitignore in a directory (default: true).",
             },
         },
         "required": ["file_path"],
@@ -1,2 +1,91 @@
 # Configuration constants for the functions
-MAX_FILE_CHARS = 10000
\ No newline at end of file
+import os
+
+MAX_FILE_CHARS = 10000
+
+# Directory the agent's tools are confined to (injected into every tool call)
+WORKING_DIRECTORY = "calculator"
+
+# Maximum number of tool calls from one model turn executed concurrently
+MAX_PARALLEL_TOOLS = 8
+
+# Conversation history budget (characters, roughly 4 per token) sent to the model
+# per iteration, and how many of the latest function results are always kept verbatim
+HISTORY_MAX_CHARS = 40000
+HISTORY_KEEP_RECENT_RESULTS = 4
+# Older function results longer than this are replaced by a short digest
+HISTORY_COMPACT_MIN_CHARS = 500
+
+# Memory budget (bytes) of the cache of read-only tool results
+TOOL_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Number of files whose line-offset index is kept for ranged reads
+LINE_INDEX_CACHE_FILES = 64
+
+# Number of parsed Python modules kept, keyed by content, for the AST-based tools
+AST_CACHE_FILES = 128
+
+# Entries per page of a recursive directory listing
+MAX_LIST_ENTRIES = 1000
+
+# Directory for persistent caches such as the workspace index
+CACHE_DIR = os.environ.get("AGENT_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "coding-agent")
+
+# Keep an index of the files in the working directory (functions/workspace_index.py),
+# updated from inotify events, or by re-walking at most this often without inotify
+WORKSPACE_INDEX = os.environ.get("AGENT_WORKSPACE_INDEX", "").lower() in ("1", "true", "yes")
+WORKSPACE_INDEX_POLL_SECONDS = 2.0
+
+# Directory-wide regex_search: default cap on reported matches
+MAX_SEARCH_MATCHES = 500
+
+# Clone classes reported by find_clones, largest first
+MAX_CLONE_CLASSES = 20
+
+# Directory mode of code_complexity and count_lines: rows listed per section, and
+# the number of files whose metrics are kept for reuse while they are unchanged
+METRICS_TOP_N = 20
+METRICS_CACHE_FILES = 100000
+
+# Directory-wide tools (regex_search, find_clones, code_complexity, count_lines) spread their work over a
+# process pool from this many files
+PROCESS_MIN_FILES = 64
+
+# Narrow directory-wide regex_search to candidate files with a persisted trigram index
+SEARCH_INDEX = os.environ.get("AGENT_SEARCH_INDEX", "").lower() in ("1", "true", "yes")
+
+# Run Python files in processes forked from a pre-initialized interpreter
+# (functions/fork_server.py) instead of starting a new interpreter for every run
+FORK_SERVER = os.environ.get("AGENT_FORK_SERVER", "").lower() in ("1", "true", "yes")
+
+# Modules the fork server imports once, before forking any run
+FORK_SERVER_PRELOAD = (
+    "argparse", "collections", "dataclasses", "datetime", "decimal", "fractions", "functools",
+    "itertools", "json", "logging", "math", "operator", "pathlib", "random", "re", "statistics",
+    "string", "textwrap", "typing", "unittest",
+)
+
+# Output kept per stream of run_python_file, run_tests and lint_code
+# (functions/subprocess_runner.py): the first and the last bytes, with the middle
+# of longer output left out
+OUTPUT_HEAD_BYTES = 16 * 1024
+OUTPUT_TAIL_BYTES = 48 * 1024
+
+# Echo the output of those commands to stderr as it arrives
+STREAM_OUTPUT = os.environ.get("AGENT_STREAM_OUTPUT", "").lower() in ("1", "true", "yes")
+
+# Managed execution of run_python_file (functions/sandbox.py): resource limits, a
+# process group killed as a whole, and a report of the resources each run used
+SANDBOX = os.environ.get("AGENT_SANDBOX", "").lower() in ("1", "true", "yes")
+SANDBOX_MEMORY_BYTES = 2 * 1024 * 1024 * 1024
+SANDBOX_FILE_BYTES = 256 * 1024 * 1024
+SANDBOX_OPEN_FILES = 1024
+
+# Delegated cgroup v2 directory under which each sandboxed run gets its own group,
+# capped at SANDBOX_MEMORY_BYTES, SANDBOX_CPU_QUOTA CPUs and SANDBOX_MAX_PROCESSES
+SANDBOX_CGROUP = os.environ.get("AGENT_SANDBOX_CGROUP", "")
+SANDBOX_CPU_QUOTA = 1.0
+SANDBOX_MAX_PROCESSES = 256
+
+# Failing tests listed, with their tracebacks, in the summary of a sharded run_tests
+MAX_LISTED_TEST_PROBLEMS = 20
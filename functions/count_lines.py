@@ -1,80 +1,380 @@
 import os
+import re
+from collections import namedtuple
+from itertools import repeat
 
-def count_lines(working_directory, file_path):
+from .config import METRICS_TOP_N
+from .project_metrics import collect_metrics, group_by_package, top
+from .workspace_index import language_of
+
+# Line counts of one file (or the sum over several)
+LineCounts = namedtuple("LineCounts", "total non_empty comments code")
+
+
+# Bytes read at a time; memory use does not depend on the file size
+COUNT_CHUNK_BYTES = 1024 * 1024
+
+# Bytes of a file checked for NUL characters to skip binary files
+BINARY_SNIFF_BYTES = 8192
+
+# Start kept of a line longer than a chunk: enough to tell blank, comment and code apart
+LONG_LINE_HEAD_BYTES = 64
+
+# Comment syntax by language (as named by workspace_index.language_of): line
+# comment prefixes and (start, end) block comment delimiters
+COMMENT_SYNTAX = {
+    "python": ((b"#",), ()),
+    "shell": ((b"#",), ()),
+    "ruby": ((b"#",), ((b"=begin", b"=end"),)),
+    "r": ((b"#",), ()),
+    "yaml": ((b"#",), ()),
+    "toml": ((b"#",), ()),
+    "ini": ((b";", b"#"), ()),
+    "make": ((b"#",), ()),
+    "docker": ((b"#",), ()),
+    "cmake": ((b"#",), ()),
+    "javascript": ((b"//",), ((b"/*", b"*/"),)),
+    "typescript": ((b"//",), ((b"/*", b"*/"),)),
+    "java": ((b"//",), ((b"/*", b"*/"),)),
+    "kotlin": ((b"//",), ((b"/*", b"*/"),)),
+    "scala": ((b"//",), ((b"/*", b"*/"),)),
+    "c": ((b"//",), ((b"/*", b"*/"),)),
+    "cpp": ((b"//",), ((b"/*", b"*/"),)),
+    "csharp": ((b"//",), ((b"/*", b"*/"),)),
+    "go": ((b"//",), ((b"/*", b"*/"),)),
+    "rust": ((b"//",), ((b"/*", b"*/"),)),
+    "swift": ((b"//",), ((b"/*", b"*/"),)),
+    "php": ((b"//", b"#"), ((b"/*", b"*/"),)),
+    "css": ((), ((b"/*", b"*/"),)),
+    "sql": ((b"--",), ((b"/*", b"*/"),)),
+    "lua": ((b"--",), ((b"--[[", b"]]"),)),
+    "html": ((), ((b"<!--", b"-->"),)),
+    "xml": ((), ((b"<!--", b"-->"),)),
+    "markdown": ((), ((b"<!--", b"-->"),)),
+    "json": ((), ()),
+}
+# Other files keep the historical "#" comments
+DEFAULT_COMMENT_SYNTAX = ((b"#",), ())
+
+_WHITESPACE = b" \t\r\f\v"
+_NOT_WHITESPACE = re.compile(rb"[^ \t\r\f\v]")
+
+
+def _scan_line(line, prefixes, blocks, block_end, partial=False):
+    """
+    Classify one line of a language with block comments.
+
+    The line is walked by offset, each search starting where the last one ended,
+    so a line holding many comments is still scanned in linear time.
+
+    Args:
+        block_end (bytes): Delimiter closing the block comment the line starts in, or None
+        partial (bool): line is only the start of a line too long to hold; the bytes
+            a delimiter continuing past its end may start in are left unscanned
+
+    Returns:
+        tuple: (whether the line has code outside comments, delimiter closing the
+            block comment still open at the end of the line or None, offset the
+            rest of a partial line is scanned from or None if it is a line comment)
+    """
+    has_code = False
+    length = len(line)
+    longest = max(map(len, prefixes + tuple(delimiter for block in blocks for delimiter in block))) if partial else 0
+    position = 0
+    while True:
+        if block_end is not None:
+            end = line.find(block_end, position)
+            if end < 0:
+                return has_code, block_end, max(position, length - len(block_end) + 1)
+            position = end + len(block_end)
+            block_end = None
+        if not position:
+            position = length - len(line.lstrip(_WHITESPACE))
+        elif position < length and line[position] in _WHITESPACE:
+            text = _NOT_WHITESPACE.search(line, position)
+            position = text.start() if text else length
+        if partial and length - position < longest:
+            return has_code, None, position
+        if position == length:
+            return has_code, None, length
+        # Block delimiters first: Lua's "--[[" starts with the "--" line comment
+        for start, end in blocks:
+            if line.startswith(start, position):
+                position += len(start)
+                block_end = end
+                break
+        else:
+            if prefixes and line.startswith(prefixes, position):
+                return has_code, None, None
+            # Code; a comment may still start further on (strings are not parsed)
+            has_code = True
+            opened = [(line.find(start, position), start, end) for start, end in blocks]
+            opened = [found for found in opened if found[0] >= 0]
+            if not opened:
+                if not partial:
+                    return True, None, length
+                # The last bytes of a partial line may start a delimiter
+                rest = length - longest + 1
+                if any(0 <= line.find(prefix, position) < rest for prefix in prefixes):
+                    return True, None, None
+                return True, None, rest
+            found, start, block_end = min(opened)
+            # Only a line comment starting before the block comment ends the line
+            if any(line.find(prefix, position, found + len(prefix) - 1) >= 0 for prefix in prefixes):
+                return True, None, None
+            position = found + len(start)
+
+
+def count_stream(f, language=None):
+    """
+    Count the lines of a binary file object, one chunk at a time.
+
+    Lines are split on b"\\n" and classified with bytes operations: blank lines and
+    lines starting with a line comment are counted with C-level map() and count()
+    calls over each chunk, and only languages with block comments walk the lines in
+    Python. Of a line longer than a chunk, only what decides its class is kept
+    (its start, or the comment state for block comments), so the work stays
+    linear. Bytes that are not valid UTF-8 are counted like any other.
+
+    Args:
+        f: File opened in binary mode
+        language (str): Language whose COMMENT_SYNTAX applies
+
+    Returns:
+        LineCounts: The counts
+    """
+    prefixes, blocks = COMMENT_SYNTAX.get(language, DEFAULT_COMMENT_SYNTAX)
+    total = blank = comments = 0
+    block_end = None
+    # (has code, is not blank, rest is a line comment) of the scanned start of a long line
+    pending = None
+    carry = b""
+    while True:
+        chunk = f.read(COUNT_CHUNK_BYTES)
+        data = carry + chunk if carry else chunk
+        if chunk:
+            # Only whole lines are counted; the partial last line moves to the next chunk
+            cut = data.rfind(b"\n") + 1
+            carry = data[cut:]
+            data = data[:cut]
+            if len(carry) > COUNT_CHUNK_BYTES and not blocks:
+                carry = carry.lstrip(_WHITESPACE)[:LONG_LINE_HEAD_BYTES] or b" "
+        elif data or pending is not None:
+            # End of file: a last line without a newline still counts
+            data += b"\n"
+
+        if data:
+            lines = data.split(b"\n")
+            lines.pop()
+            total += len(lines)
+            if not blocks:
+                # map() and list.count() keep the per-line work in C
+                stripped = list(map(bytes.lstrip, lines))
+                blank += stripped.count(b"")
+                if prefixes:
+                    comments += sum(map(bytes.startswith, stripped, repeat(prefixes)))
+            else:
+                for line in lines:
+                    has_code = commented = False
+                    not_blank = bool(line.strip(_WHITESPACE))
+                    if pending is not None:
+                        # The rest of a long line
+                        has_code, started, commented = pending
+                        not_blank = not_blank or started
+                        pending = None
+                    if commented:
+                        block_end = None
+                    elif block_end is not None or not_blank:
+                        code, block_end, _ = _scan_line(line, prefixes, blocks, block_end)
+                        has_code = has_code or code
+                    if not has_code:
+                        if not_blank:
+                            comments += 1
+                        else:
+                            blank += 1
+
+        if chunk and blocks and len(carry) > COUNT_CHUNK_BYTES:
+            # Scan the start of the long line now (block_end is its state) and keep the rest
+            has_code, started, commented = pending or (False, False, False)
+            started = started or bool(carry.strip(_WHITESPACE))
+            if not commented:
+                code, block_end, rest = _scan_line(carry, prefixes, blocks, block_end, partial=True)
+                has_code = has_code or code
+                commented = rest is None
+            carry = b"" if commented else carry[rest:]
+            pending = (has_code, started, commented)
+        if not chunk:
+            break
+
+    return LineCounts(total, total - blank, comments, total - blank - comments)
+
+
+def count_file(path):
+    """
+    Count the lines of a file in constant memory.
+
+    Returns:
+        LineCounts: The counts, or None if the file looks binary
     """
-    Count lines of code in a file.
-    
+    with open(path, "rb") as f:
+        if b"\0" in f.read(BINARY_SNIFF_BYTES):
+            return None
+        f.seek(0)
+        return count_stream(f, language_of(path))
+
+
+def count_files(files):
+    """
+    Count the lines of files (runs in the worker processes).
+
+    Args:
+        files (list): (relative path, absolute path) tuples
+
+    Returns:
+        list: (relative path, LineCounts or None for binary and unreadable files)
+    """
+    results = []
+    for rel_path, abs_path in files:
+        try:
+            counts = count_file(abs_path)
+        except OSError:
+            counts = None
+        results.append((rel_path, counts))
+    return results
+
+
+def count_lines(working_directory, file_path, include=None, exclude=None, top_n=None, use_gitignore=True):
+    """
+    Count lines of code in a file, or in every file below a directory.
+
+    For a directory, files are counted in parallel worker processes (unchanged
+    files reuse their previous counts) and the totals are broken down by language
+    and by package, with the largest files and packages first.
+
     Args:
         working_directory (str): The base working directory
-        file_path (str): Relative path to the file within the working directory
-        
+        file_path (str): Relative path to the file (or directory) within the working directory
+        include (list): Glob patterns of the files counted in a directory
+        exclude (list): Glob patterns of files and directories skipped in a directory
+        top_n (int): Files and packages listed for a directory (default: METRICS_TOP_N)
+        use_gitignore (bool): Skip files ignored by .gitignore in a directory
+
     Returns:
         str: Line count information or error message
     """
     try:
         # Create the full path
         full_path = os.path.join(working_directory, file_path)
-        
+
         # Get absolute paths for comparison
         abs_working_dir = os.path.abspath(working_directory)
         abs_full_path = os.path.abspath(full_path)
-        
+
         # Check if the path is within the working directory boundaries
         if not abs_full_path.startswith(abs_working_dir):
             return f'Error: Cannot access "{file_path}" as it is outside the permitted working directory'
-        
+
+        if os.path.isdir(abs_full_path):
+            top_n = top_n or METRICS_TOP_N
+            if top_n < 1:
+                return 'Error: top_n must be at least 1'
+            return _count_directory(abs_working_dir, abs_full_path, file_path, include, exclude, top_n,
+                                    use_gitignore)
+
         # Check if the path is a file
         if not os.path.isfile(abs_full_path):
             return f'Error: File not found or is not a regular file: "{file_path}"'
-        
+
         # Read the file and count lines
         try:
-            with open(abs_full_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            
-            total_lines = len(lines)
-            
-            # Count non-empty lines and comment lines (for Python files)
-            non_empty_lines = 0
-            comment_lines = 0
-            
-            for line in lines:
-                stripped_line = line.strip()
-                if stripped_line:  # Non-empty line
-                    non_empty_lines += 1
-                    if stripped_line.startswith('#'):  # Comment line
-                        comment_lines += 1
-            
+            counts = count_file(abs_full_path)
+            if counts is None:
+                return f'Error: Unable to read "{file_path}" - file may be binary'
+
             result = f"Line count for '{file_path}':\n"
-            result += f"  Total lines: {total_lines}\n"
-            result += f"  Non-empty lines: {non_empty_lines}\n"
-            result += f"  Comment lines: {comment_lines}\n"
-            result += f"  Code lines: {non_empty_lines - comment_lines}\n"
-            
+            result += f"  Total lines: {counts.total}\n"
+            result += f"  Non-empty lines: {counts.non_empty}\n"
+            result += f"  Comment lines: {counts.comments}\n"
+            result += f"  Code lines: {counts.code}\n"
+
             return result
-            
-        except UnicodeDecodeError:
-            return f'Error: Unable to read "{file_path}" - file may be binary'
+
         except PermissionError:
             return f'Error: Permission denied to read "{file_path}"'
         except OSError as e:
             return f'Error: Unable to read "{file_path}": {str(e)}'
-            
+
     except Exception as e:
         return f'Error: An unexpected error occurred: {str(e)}'
 
+def _count_directory(abs_working_dir, abs_dir, dir_path, include, exclude, top_n, use_gitignore):
+    rows = collect_metrics("count_lines", count_files, abs_working_dir, abs_dir, include, exclude, use_gitignore)
+    if not rows:
+        return f"No text files found under '{dir_path}'"
+
+    totals = LineCounts(*map(sum, zip(*(counts for _, counts in rows))))
+    result = f"Line count for '{dir_path}' ({len(rows)} files):\n"
+    result += f"  Total lines: {totals.total}\n"
+    result += f"  Non-empty lines: {totals.non_empty}\n"
+    result += f"  Comment lines: {totals.comments}\n"
+    result += f"  Code lines: {totals.code}\n"
+
+    languages = {}
+    for rel_path, counts in rows:
+        language = language_of(rel_path) or "other"
+        previous = languages.get(language, (0, 0))
+        languages[language] = (previous[0] + 1, previous[1] + counts.code)
+    ranked, _ = top(languages.items(), lambda item: item[1][1], top_n)
+    result += "\nBy language (code lines):\n"
+    for language, (files, code) in ranked:
+        result += f"  {language}: {code} in {files} files\n"
+
+    ranked, more = top(rows, lambda row: row[1].code, top_n)
+    result += "\nLargest files (code lines):\n"
+    for rel_path, counts in ranked:
+        result += f"  {rel_path}: {counts.code} code, {counts.comments} comment, {counts.total} total\n"
+    if more:
+        result += f"  ... and {more} more files\n"
+
+    packages = group_by_package(rows, ("code", "total"))
+    ranked, more = top(packages.items(), lambda item: item[1]["code"], top_n)
+    result += "\nLargest packages (code lines):\n"
+    for package, sums in ranked:
+        result += f"  {package}: {sums['code']} code, {sums['total']} total in {sums['files']} files\n"
+    if more:
+        result += f"  ... and {more} more packages\n"
+    return result
+
 # Function declaration schema for LLM
 schema_count_lines = {
     "name": "count_lines",
-    "description": "Count lines of code in a file, including total lines, non-empty lines, comment lines, and code lines.",
+    "description": "Count lines of code in a file, including total lines, non-empty lines, comment lines, and code lines. Given a directory, summarizes every file below it by language, file and package.",
     "parameters": {
         "type": "object",
         "properties": {
             "file_path": {
                 "type": "string",
-                "description": "The path to the file to analyze, relative to the working directory.",
+                "description": "The path to the file or directory to analyze, relative to the working directory.",
+            },
+            "include": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of the files counted in a directory, such as \"*.py\".",
+            },
+            "exclude": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of files and directories skipped in a directory.",
+            },
+            "top_n": {
+                "type": "integer",
+                "description": f"Number of files, packages and languages listed for a directory (default: {METRICS_TOP_N}).",
+            },
+            "use_gitignore": {
+                "type": "boolean",
+                "description": "Skip files ignored by .gitignore in a directory (default: true).",
             },
         },
         "required": ["file_path"],
     },
-}
\ No newline at end of file
+}
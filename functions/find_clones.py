@@ -0,0 +1,323 @@
+import io
+import keyword
+import os
+import re
+import tokenize
+import zlib
+from collections import deque
+
+from .config import MAX_CLONE_CLASSES
+from .find_duplicates import _window_hashes
+from .regex_search import _list_files
+from .worker_pool import map_chunks
+from .workspace_index import language_of
+
+# Each winnowing window of this many k-grams keeps its smallest hash, so clones
+# at least min_tokens + WINNOW_WINDOW - 1 tokens long are always found
+WINNOW_WINDOW = 8
+
+# Copies listed per clone class
+MAX_LISTED_COPIES = 10
+
+# Languages tokenized with the C-like tokenizer (Python uses the tokenize module)
+C_LIKE_LANGUAGES = {"javascript", "typescript", "java", "kotlin", "scala", "c", "cpp", "csharp", "go", "rust",
+                    "swift", "php"}
+
+# Keywords of the C-like languages kept as they are; other identifiers are normalized
+C_LIKE_KEYWORDS = {
+    "break", "case", "catch", "class", "const", "continue", "default", "do", "else", "enum", "export", "extends",
+    "final", "finally", "fn", "for", "func", "function", "if", "import", "interface", "let", "match", "new",
+    "package", "private", "protected", "public", "return", "static", "struct", "switch", "this", "throw", "try",
+    "var", "void", "while",
+}
+
+_C_LIKE_TOKEN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)
+  | (?P<number>\d[\w.]*)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<op>\S)
+""", re.DOTALL | re.VERBOSE)
+
+# Python tokens that carry no code (layout and comments)
+_PYTHON_SKIPPED = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+                   tokenize.ENDMARKER, tokenize.ENCODING}
+_PYTHON_STRINGS = {tokenize.STRING}
+for _name in ("FSTRING_START", "FSTRING_MIDDLE", "FSTRING_END"):
+    if hasattr(tokenize, _name):
+        _PYTHON_STRINGS.add(getattr(tokenize, _name))
+
+
+def _python_tokens(text):
+    """Normalized (token, line) pairs of Python source: identifiers and literals lose their values."""
+    tokens = []
+    for token in tokenize.generate_tokens(io.StringIO(text).readline):
+        if token.type in _PYTHON_SKIPPED:
+            continue
+        if token.type == tokenize.NAME:
+            value = token.string if keyword.iskeyword(token.string) else "$id"
+        elif token.type == tokenize.NUMBER:
+            value = "$num"
+        elif token.type in _PYTHON_STRINGS:
+            value = "$str"
+        else:
+            value = token.string
+        tokens.append((value, token.start[0]))
+    return tokens
+
+
+def _c_like_tokens(text):
+    """Normalized (token, line) pairs of C-like source."""
+    tokens = []
+    line = 1
+    position = 0
+    for match in _C_LIKE_TOKEN.finditer(text):
+        line += text.count("\n", position, match.start())
+        position = match.start()
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if kind == "name":
+            value = match.group() if match.group() in C_LIKE_KEYWORDS else "$id"
+        elif kind == "number":
+            value = "$num"
+        elif kind == "string":
+            value = "$str"
+        else:
+            value = match.group()
+        tokens.append((value, line))
+    return tokens
+
+
+def _tokens(path):
+    """Normalized tokens of a source file, or [] if its language is not supported."""
+    language = language_of(path)
+    if language != "python" and language not in C_LIKE_LANGUAGES:
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except (UnicodeDecodeError, OSError):
+        return []
+    if language == "python":
+        try:
+            return _python_tokens(text)
+        except (tokenize.TokenError, SyntaxError):
+            pass  # Unbalanced or partial code still has comparable tokens
+    return _c_like_tokens(text)
+
+
+def _winnow(hashes, window):
+    """Positions of the rightmost minimal hash of every window, each reported once."""
+    selected = []
+    minima = deque()  # Positions in the current window, with increasing hashes
+    last = len(hashes) - 1
+    for i, value in enumerate(hashes):
+        while minima and hashes[minima[-1]] >= value:
+            minima.pop()
+        minima.append(i)
+        if minima[0] <= i - window:
+            minima.popleft()
+        if (i >= window - 1 or i == last) and (not selected or selected[-1] != minima[0]):
+            selected.append(minima[0])
+    return selected
+
+
+def fingerprint_files(files, min_tokens):
+    """
+    Fingerprint source files (runs in the worker processes).
+
+    Tokens are normalized and hashed, every run of min_tokens tokens gets a rolling
+    hash, and winnowing keeps a few of those hashes per file as its fingerprints.
+
+    Args:
+        files (list): (relative path, absolute path) tuples
+        min_tokens (int): Tokens per fingerprinted run
+
+    Returns:
+        list: (relative path, [(hash, token position, first line, last line)]) per
+            file, for the files that could be tokenized
+    """
+    token_ids = {}
+    results = []
+    for rel_path, abs_path in files:
+        tokens = _tokens(abs_path)
+        if not tokens:
+            continue
+        ids = []
+        for value, _ in tokens:
+            token_id = token_ids.get(value)
+            if token_id is None:
+                # crc32 rather than hash(): ids must agree across worker processes
+                token_id = token_ids[value] = zlib.crc32(value.encode("utf-8"))
+            ids.append(token_id)
+        hashes = _window_hashes(ids, min_tokens)
+        fingerprints = [(hashes[pos], pos, tokens[pos][1], tokens[pos + min_tokens - 1][1])
+                        for pos in _winnow(hashes, WINNOW_WINDOW)]
+        results.append((rel_path, fingerprints))
+    return results
+
+
+def clone_classes(fingerprinted, min_tokens):
+    """
+    Group shared fingerprints into clone classes.
+
+    Fingerprints found in several places are seeds; seeds with the same files whose
+    runs overlap or touch in every copy are merged into one class.
+
+    Args:
+        fingerprinted (list): As returned by fingerprint_files
+        min_tokens (int): Tokens per fingerprinted run
+
+    Returns:
+        list: Classes as lists of (relative path, first line, last line), largest first
+    """
+    index = {}
+    for file_id, (_, fingerprints) in enumerate(fingerprinted):
+        for value, pos, first_line, last_line in fingerprints:
+            index.setdefault(value, []).append((file_id, pos, first_line, last_line))
+
+    seeds = []
+    for locations in index.values():
+        if len(locations) < 2:
+            continue
+        kept = []
+        for location in sorted(locations):
+            # Overlapping copies within one file are one repetitive region, not clones
+            if kept and kept[-1][0] == location[0] and location[1] < kept[-1][1] + min_tokens:
+                continue
+            kept.append(location)
+        if len(kept) >= 2:
+            seeds.append((tuple(location[0] for location in kept), kept))
+    seeds.sort(key=lambda seed: (seed[0], seed[1][0][1]))
+
+    classes = []
+    current = None
+    for files, locations in seeds:
+        if (current is not None and current[0] == files and
+                all(pos <= end + 1 for (_, pos, _, _), (_, _, end, _, _) in zip(locations, current[1]))):
+            current[1] = [
+                (file_id, start, max(end, pos + min_tokens - 1), first, max(last, last_line))
+                for (file_id, start, end, first, last), (_, pos, _, last_line) in zip(current[1], locations)
+            ]
+            continue
+        current = [files, [(file_id, pos, pos + min_tokens - 1, first_line, last_line)
+                           for file_id, pos, first_line, last_line in locations]]
+        classes.append(current)
+
+    result = [[(fingerprinted[file_id][0], first, last) for file_id, _, _, first, last in copies]
+              for _, copies in classes]
+    result.sort(key=lambda copies: (-(copies[0][2] - copies[0][1] + 1) * len(copies), copies))
+    return result
+
+
+def find_clones(working_directory, directory=".", min_tokens=50, include=None, exclude=None, max_classes=None,
+                use_gitignore=True):
+    """
+    Find code repeated across the files below a directory.
+
+    Source is tokenized and identifiers and literals are normalized, so copies
+    that differ only in layout, comments, names or constants are still found.
+    Files are fingerprinted in parallel worker processes and the fingerprints
+    are matched through one shared index.
+
+    Args:
+        working_directory (str): The base working directory
+        directory (str): Relative path to the directory within the working directory
+        min_tokens (int): Minimum length of a clone in tokens
+        include (list): Glob patterns of the files analyzed
+        exclude (list): Glob patterns of files and directories skipped
+        max_classes (int): Maximum number of clone classes reported (default: MAX_CLONE_CLASSES)
+        use_gitignore (bool): Skip files ignored by .gitignore
+
+    Returns:
+        str: Clone classes with the location of every copy, or error message
+    """
+    try:
+        # Create the full path
+        full_path = os.path.join(working_directory, directory)
+
+        # Get absolute paths for comparison
+        abs_working_dir = os.path.abspath(working_directory)
+        abs_full_path = os.path.abspath(full_path)
+
+        # Check if the path is within the working directory boundaries
+        if not abs_full_path.startswith(abs_working_dir):
+            return f'Error: Cannot access "{directory}" as it is outside the permitted working directory'
+
+        # Check if the path is a directory
+        if not os.path.isdir(abs_full_path):
+            return f'Error: "{directory}" is not a directory'
+
+        max_classes = max_classes or MAX_CLONE_CLASSES
+        if min_tokens < 1 or max_classes < 1:
+            return 'Error: min_tokens and max_classes must be at least 1'
+
+        files = _list_files(abs_working_dir, abs_full_path, include, exclude, use_gitignore)
+        files = [file for file in files if _supported(file[0])]
+        fingerprinted = []
+        for results in map_chunks(fingerprint_files, files, min_tokens):
+            fingerprinted.extend(results)
+        classes = clone_classes(fingerprinted, min_tokens)
+
+        if not classes:
+            return f'No clones (of {min_tokens}+ tokens) found in {len(fingerprinted)} file(s) under "{directory}"'
+
+        output = [f'Found {len(classes)} clone class(es) of {min_tokens}+ tokens in {len(fingerprinted)} file(s) '
+                  f'under "{directory}":']
+        for i, copies in enumerate(classes[:max_classes], 1):
+            rel_path, first, last = copies[0]
+            output.append(f"\nClone class {i}: {len(copies)} copies of about {last - first + 1} lines")
+            output.extend(f"  {rel_path}:{first}-{last}" for rel_path, first, last in copies[:MAX_LISTED_COPIES])
+            if len(copies) > MAX_LISTED_COPIES:
+                output.append(f"  ... and {len(copies) - MAX_LISTED_COPIES} more copies")
+        if len(classes) > max_classes:
+            output.append(f"\n... and {len(classes) - max_classes} more clone classes")
+        return "\n".join(output)
+
+    except Exception as e:
+        return f'Error: An unexpected error occurred: {str(e)}'
+
+
+def _supported(path):
+    language = language_of(path)
+    return language == "python" or language in C_LIKE_LANGUAGES
+
+
+# Function declaration schema for LLM
+schema_find_clones = {
+    "name": "find_clones",
+    "description": "Find code duplicated across the files below a directory (Python and C-like languages), including copies that differ only in formatting, comments, names or literals. Reports clone classes with the location of every copy.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "directory": {
+                "type": "string",
+                "description": "The directory to analyze, relative to the working directory (default: \".\").",
+            },
+            "min_tokens": {
+                "type": "integer",
+                "description": "Minimum length of a reported clone in tokens. Defaults to 50.",
+            },
+            "include": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of the files analyzed, such as \"*.py\".",
+            },
+            "exclude": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of files and directories skipped.",
+            },
+            "max_classes": {
+                "type": "integer",
+                "description": f"Maximum number of clone classes reported, largest first (default: {MAX_CLONE_CLASSES}).",
+            },
+            "use_gitignore": {
+                "type": "boolean",
+                "description": "Skip files ignored by .gitignore (default: true).",
+            },
+        },
+        "required": [],
+    },
+}
@@ -1,6 +1,75 @@
 import os
 import re
 
+# Rolling hash parameters: a Mersenne prime modulus keeps collisions negligible
+_HASH_BASE = 1000003
+_HASH_MOD = (1 << 61) - 1
+
+# Earlier occurrences of a window tried when looking for the longest run
+MAX_CANDIDATES = 8
+
+
+def _line_ids(lines):
+    """Map every line to a small integer, equal lines (ignoring line endings) to equal ids."""
+    ids = {}
+    return [ids.setdefault(line.rstrip("\r\n"), len(ids)) for line in lines]
+
+
+def _window_hashes(ids, size):
+    """Polynomial hashes of every window of size consecutive ids, in one pass."""
+    if len(ids) < size:
+        return []
+    top = pow(_HASH_BASE, size - 1, _HASH_MOD)
+    value = 0
+    for line_id in ids[:size]:
+        value = (value * _HASH_BASE + line_id + 1) % _HASH_MOD
+    hashes = [value]
+    for i in range(size, len(ids)):
+        value = ((value - (ids[i - size] + 1) * top) * _HASH_BASE + ids[i] + 1) % _HASH_MOD
+        hashes.append(value)
+    return hashes
+
+
+def _duplicate_runs(ids, min_lines):
+    """
+    Find maximal runs of lines that repeat earlier in the file.
+
+    Windows of min_lines lines are bucketed by rolling hash. Scanning forward, a
+    window that occurred before starts a run, which is extended as far as the lines
+    keep matching; the scan then resumes after the run, so a long duplicate is
+    reported once rather than as each of its overlapping windows.
+
+    Returns:
+        list: (first line of the earlier copy, first line of the later copy, length)
+            tuples with 0-based line numbers
+    """
+    line_count = len(ids)
+    hashes = _window_hashes(ids, min_lines)
+    seen = {}
+    runs = []
+    j = 0
+    while j < len(hashes):
+        best_start = best_length = 0
+        previous = seen.get(hashes[j], ())
+        for i in previous[-MAX_CANDIDATES:]:
+            if ids[i:i + min_lines] != ids[j:j + min_lines]:
+                continue  # Hash collision
+            length = min_lines
+            while j + length < line_count and ids[i + length] == ids[j + length]:
+                length += 1
+            if length > best_length:
+                best_start, best_length = i, length
+        if best_length:
+            runs.append((best_start, j, best_length))
+            end = j + best_length
+        else:
+            end = j + 1
+        # Windows inside the run stay available as earlier copies of later duplicates
+        for k in range(j, min(end, len(hashes))):
+            seen.setdefault(hashes[k], []).append(k)
+        j = end
+    return runs
+
 def find_duplicates(working_directory, file_path, min_lines=3):
     """
     Find duplicate code blocks in a file.
@@ -40,35 +109,18 @@ def find_duplicates(working_directory, file_path, min_lines=3):
         except OSError as e:
             return f'Error: Unable to read "{file_path}": {str(e)}'
         
-        # Find duplicate blocks
+        if min_lines < 1:
+            return 'Error: min_lines must be at least 1'
+
+        # Find maximal duplicate runs
         duplicates = []
-        line_count = len(lines)
-        
-        # Check each possible block
-        for i in range(line_count - min_lines + 1):
-            for j in range(i + 1, line_count - min_lines + 1):
-                # Compare blocks of min_lines or more
-                block1 = lines[i:i + min_lines]
-                block2 = lines[j:j + min_lines]
-                
-                # If initial blocks match, check if longer blocks match
-                if block1 == block2:
-                    # Extend the block as long as lines match
-                    length = min_lines
-                    while (i + length < line_count and 
-                           j + length < line_count and 
-                           lines[i + length] == lines[j + length]):
-                        length += 1
-                    
-                    # Only report if the block is at least min_lines long
-                    if length >= min_lines:
-                        block_content = ''.join(lines[i:i + length])
-                        duplicates.append({
-                            'line1': i + 1,
-                            'line2': j + 1,
-                            'length': length,
-                            'content': block_content
-                        })
+        for line1, line2, length in _duplicate_runs(_line_ids(lines), min_lines):
+            duplicates.append({
+                'line1': line1 + 1,
+                'line2': line2 + 1,
+                'length': length,
+                'content': ''.join(lines[line1:line1 + length])
+            })
         
         # Prepare result
         if duplicates:
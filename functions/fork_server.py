@@ -0,0 +1,186 @@
+import atexit
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from .config import FORK_SERVER_PRELOAD, STREAM_OUTPUT
+from .subprocess_runner import CompletedRun, OutputBuffer, ResourceUsage, echo_output, read_streams
+
+ZYGOTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote.py")
+
+# Seconds allowed for the zygote to import its modules and start listening
+STARTUP_TIMEOUT = 10
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class ForkServerError(Exception):
+    """The fork server could not start a run; the caller falls back to a cold interpreter."""
+
+
+class ForkServer:
+    """
+    Client of a zygote process (functions/zygote.py) that forks every run from an
+    interpreter with FORK_SERVER_PRELOAD already imported.
+
+    A run costs two fork() calls instead of starting and initializing a new
+    interpreter. The script still runs in a fresh process of its own, in a new
+    session, with the requested cwd, argv, environment and rlimits; stdin is
+    /dev/null.
+    """
+
+    def __init__(self, python, preload=FORK_SERVER_PRELOAD):
+        self._dir = tempfile.mkdtemp(prefix="agent-fork-server-")
+        self.socket_path = os.path.join(self._dir, "zygote.sock")
+        self._process = subprocess.Popen(
+            [python, ZYGOTE_PATH, self.socket_path, *preload],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while not os.path.exists(self.socket_path):
+            if self._process.poll() is not None or time.monotonic() > deadline:
+                self.close()
+                raise ForkServerError("the zygote process did not start")
+            time.sleep(0.005)
+
+    def alive(self):
+        return self._process.poll() is None
+
+    def close(self):
+        if self._process.poll() is None:
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._process.wait()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        for _ in range(100):
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except ConnectionRefusedError:
+                # Bound but not listening yet
+                time.sleep(0.001)
+            except OSError as e:
+                sock.close()
+                raise ForkServerError(f"cannot reach the zygote process: {e}") from e
+        sock.close()
+        raise ForkServerError("the zygote process is not accepting runs")
+
+    def run(self, argv, cwd, timeout, env=None, rlimits=None, on_output=None, cgroup_procs=None, kill_group=False):
+        """
+        Run a Python script in a process forked from the zygote.
+
+        Args:
+            argv (list): Absolute path of the script followed by its arguments
+            cwd (str): Working directory of the script
+            timeout (float): Seconds before the script's process group is killed
+            env (dict): Environment of the script (default: this process's)
+            rlimits (dict): resource.RLIMIT_* name -> (soft, hard) set in the script process
+            on_output (callable): Progress callback, as in subprocess_runner.run_command
+            cgroup_procs (str): cgroup.procs file of the cgroup the script process joins
+            kill_group (bool): Kill what is left of the script's process group once it exits
+
+        Returns:
+            CompletedRun: Return code, the head and tail of the text output and the resources
+                used, as subprocess_runner.run_command returns them
+
+        Raises:
+            subprocess.TimeoutExpired: If the script ran longer than timeout
+            ForkServerError: If the zygote did not take the run
+        """
+        request = json.dumps({
+            "argv": list(argv),
+            "cwd": cwd,
+            "env": dict(os.environ if env is None else env),
+            "timeout": timeout,
+            "rlimits": rlimits or {},
+            "cgroup_procs": cgroup_procs,
+            "kill_group": kill_group,
+        }).encode("utf-8") + b"\n"
+
+        if on_output is None and STREAM_OUTPUT:
+            on_output = echo_output
+        stdout = OutputBuffer()
+        stderr = OutputBuffer()
+        start = time.monotonic()
+        deadline = start + timeout
+        sock = self._connect()
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        try:
+            try:
+                sent = socket.send_fds(sock, [request], [out_w, err_w])
+                sock.sendall(request[sent:])
+            except OSError as e:
+                raise ForkServerError(f"cannot send the run to the zygote process: {e}") from e
+            finally:
+                os.close(out_w)
+                os.close(err_w)
+
+            replies = sock.makefile("rb")
+            reply = replies.readline()
+            if not reply:
+                raise ForkServerError("the zygote process did not start the run")
+            pid = json.loads(reply)["pid"]
+
+            streams = {out_r: ("stdout", stdout), err_r: ("stderr", stderr)}
+            # The pipes close when the script exits (or closes them itself)
+            finished = read_streams(streams, deadline, on_output)
+            if finished:
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                try:
+                    reply = replies.readline()
+                except socket.timeout:
+                    finished = False
+            if not finished:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                raise subprocess.TimeoutExpired(argv, timeout, stdout.text(), stderr.text())
+            if not reply:
+                raise ForkServerError("the zygote process lost the run")
+            wall_seconds = time.monotonic() - start
+            reply = json.loads(reply)
+        finally:
+            sock.close()
+            os.close(out_r)
+            os.close(err_r)
+
+        usage = ResourceUsage(wall_seconds, reply["user_seconds"], reply["system_seconds"], reply["max_rss_kb"] * 1024)
+        return CompletedRun(argv, reply["returncode"], stdout.text(), stderr.text(), usage)
+
+
+def get_server():
+    """Shared fork server, started on first use and restarted if its zygote died."""
+    global _server
+    with _server_lock:
+        if _server is None or not _server.alive():
+            if _server is not None:
+                _server.close()
+                _server = None
+            python = shutil.which("python")
+            if python is None:
+                raise ForkServerError("no python interpreter on PATH")
+            _server = ForkServer(python)
+            atexit.register(_server.close)
+        return _server
+
+
+def run(argv, cwd, timeout, env=None, rlimits=None, on_output=None, cgroup_procs=None, kill_group=False):
+    """Run a Python script with the shared fork server (see ForkServer.run)."""
+    return get_server().run(argv, cwd, timeout, env, rlimits, on_output, cgroup_procs, kill_group)
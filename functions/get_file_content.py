@@ -1,13 +1,32 @@
+import codecs
 import os
 from .config import MAX_FILE_CHARS
+from .line_index import read_lines, read_bytes
 
-def get_file_content(working_directory, file_path):
+# Lines shown before and after around_line when no context is given
+DEFAULT_CONTEXT_LINES = 20
+
+# UTF-8 encodes a character in at most 4 bytes
+MAX_CHAR_BYTES = 4
+
+def get_file_content(working_directory, file_path, start_line=None, end_line=None,
+                     around_line=None, context=None, offset=None, length=None):
     """
     Get the content of a file within a working directory.
+
+    Without a range the file is read from the start. Line ranges are served from a
+    memory map through a cached line-offset index, and byte ranges from the memory
+    map directly, so reads deep into large files never read the prefix.
     
     Args:
         working_directory (str): The base working directory
         file_path (str): Relative path to the file within the working directory
+        start_line (int): First line to read (1-based)
+        end_line (int): Last line to read, inclusive (defaults to as many as fit)
+        around_line (int): Read the lines around this line instead
+        context (int): Lines shown before and after around_line
+        offset (int): Byte offset to read from instead of a line range
+        length (int): Number of bytes to read from offset
         
     Returns:
         str: File content as string or error message
@@ -30,22 +49,21 @@ def get_file_content(working_directory, file_path):
         
         # Read the file content
         try:
-            with open(abs_full_path, "r", encoding="utf-8") as f:
-                file_content = f.read(MAX_FILE_CHARS + 1)  # Read one extra char to check if truncation needed
-                
-                # If file is longer than MAX_FILE_CHARS, truncate and add message
-                if len(file_content) > MAX_FILE_CHARS:
-                    file_content = file_content[:MAX_FILE_CHARS] + f'[...File "{file_path}" truncated at {MAX_FILE_CHARS} characters]'
-                
-                return file_content
-        except UnicodeDecodeError:
-            # Try reading as binary and decode with error handling
-            with open(abs_full_path, "rb") as f:
-                file_content = f.read(MAX_FILE_CHARS + 1)
-                if len(file_content) > MAX_FILE_CHARS:
-                    return file_content[:MAX_FILE_CHARS].decode('utf-8', errors='ignore') + f'[...File "{file_path}" truncated at {MAX_FILE_CHARS} characters]'
-                else:
-                    return file_content.decode('utf-8', errors='ignore')
+            if offset is not None or length is not None:
+                if start_line is not None or end_line is not None or around_line is not None:
+                    return 'Error: Use either a byte range (offset, length) or a line range, not both'
+                return _read_byte_range(abs_full_path, file_path, offset or 0, length)
+            if around_line is not None:
+                if start_line is not None or end_line is not None:
+                    return 'Error: Use either around_line or start_line/end_line, not both'
+                if context is None:
+                    context = DEFAULT_CONTEXT_LINES
+                if around_line < 1 or context < 0:
+                    return 'Error: around_line must be at least 1 and context must not be negative'
+                return _read_line_range(abs_full_path, file_path, max(1, around_line - context), around_line + context)
+            if start_line is not None or end_line is not None:
+                return _read_line_range(abs_full_path, file_path, start_line or 1, end_line)
+            return _read_prefix(abs_full_path, file_path)
         except PermissionError:
             return f'Error: Permission denied to read "{file_path}"'
         except OSError as e:
@@ -54,10 +72,75 @@ def get_file_content(working_directory, file_path):
     except Exception as e:
         return f'Error: An unexpected error occurred: {str(e)}'
 
+def _read_prefix(abs_path, file_path):
+    """Read the start of the file, decoding it from a single binary read."""
+    # Enough bytes for MAX_FILE_CHARS + 1 characters, to tell whether truncation is needed
+    with open(abs_path, "rb") as f:
+        data = f.read((MAX_FILE_CHARS + 1) * MAX_CHAR_BYTES)
+        at_end = len(data) < (MAX_FILE_CHARS + 1) * MAX_CHAR_BYTES
+    try:
+        # An incremental decoder tolerates a character cut at the end of the read
+        file_content = codecs.getincrementaldecoder("utf-8")().decode(data, final=at_end)
+    except UnicodeDecodeError:
+        # Not valid UTF-8: keep the first MAX_FILE_CHARS bytes and drop undecodable ones
+        if len(data) > MAX_FILE_CHARS:
+            return data[:MAX_FILE_CHARS].decode('utf-8', errors='ignore') + f'[...File "{file_path}" truncated at {MAX_FILE_CHARS} characters]'
+        return data.decode('utf-8', errors='ignore')
+
+    # Same newline translation as reading in text mode
+    file_content = file_content.replace("\r\n", "\n").replace("\r", "\n")
+
+    # If file is longer than MAX_FILE_CHARS, truncate and add message
+    if len(file_content) > MAX_FILE_CHARS:
+        file_content = file_content[:MAX_FILE_CHARS] + f'[...File "{file_path}" truncated at {MAX_FILE_CHARS} characters]'
+    return file_content
+
+def _read_line_range(abs_path, file_path, first, last):
+    """Read lines first..last (inclusive; None for as many as fit) with a header naming the range."""
+    if first < 1 or (last is not None and last < first):
+        return f'Error: Invalid line range {first}-{last if last is not None else ""}'
+
+    data, total, at_end = read_lines(abs_path, first, last, max_bytes=(MAX_FILE_CHARS + 1) * MAX_CHAR_BYTES)
+    if not data and first > 1:
+        return f'Error: Line {first} is past the end of "{file_path}" ({total} lines)'
+    if not data:
+        return f'No lines in "{file_path}" (0 lines)'
+    content = data.decode('utf-8', errors='ignore')
+
+    truncated = len(content) > MAX_FILE_CHARS
+    if truncated:
+        content = content[:MAX_FILE_CHARS]
+    shown_last = first + content.count("\n") - (1 if content.endswith("\n") else 0)
+    if last is not None and not truncated:
+        shown_last = min(last, shown_last)
+
+    header = f'Lines {first}-{shown_last} of "{file_path}"'
+    if total is not None:
+        header += f' ({total} lines)'
+    result = f'{header}:\n{content}'
+    if truncated or (last is None and not at_end):
+        # The last line shown may be partial, so continue from it
+        result += f'[...Range truncated at {MAX_FILE_CHARS} characters; continue with start_line={shown_last}]'
+    return result
+
+def _read_byte_range(abs_path, file_path, offset, length):
+    """Read a byte range with a header naming it; bytes cut mid-character are dropped."""
+    if length is None:
+        length = MAX_FILE_CHARS
+    if offset < 0 or length < 0:
+        return 'Error: offset and length must not be negative'
+    data, size = read_bytes(abs_path, offset, min(length, MAX_FILE_CHARS * MAX_CHAR_BYTES))
+    content = data.decode('utf-8', errors='ignore')
+    end = offset + len(data)
+    if len(content) > MAX_FILE_CHARS:
+        content = content[:MAX_FILE_CHARS]
+        end = offset + len(content.encode('utf-8'))
+    return f'Bytes {offset}-{end} of {size} in "{file_path}":\n{content}'
+
 # Function declaration schema for LLM
 schema_get_file_content = {
     "name": "get_file_content",
-    "description": "Read the contents of a file within the working directory.",
+    "description": f"Read the contents of a file within the working directory. Without a range, returns up to the first {MAX_FILE_CHARS} characters; use start_line/end_line, around_line or offset/length to read further into large files.",
     "parameters": {
         "type": "object",
         "properties": {
@@ -65,6 +148,30 @@ schema_get_file_content = {
                 "type": "string",
                 "description": "The path to the file to read, relative to the working directory.",
             },
+            "start_line": {
+                "type": "integer",
+                "description": "First line to read (1-based).",
+            },
+            "end_line": {
+                "type": "integer",
+                "description": "Last line to read, inclusive. Defaults to as many lines as fit.",
+            },
+            "around_line": {
+                "type": "integer",
+                "description": "Read the lines around this line (1-based).",
+            },
+            "context": {
+                "type": "integer",
+                "description": f"Lines shown before and after around_line (default: {DEFAULT_CONTEXT_LINES}).",
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Byte offset to read from, instead of a line range.",
+            },
+            "length": {
+                "type": "integer",
+                "description": f"Number of bytes to read from offset (default: {MAX_FILE_CHARS}).",
+            },
         },
         "required": ["file_path"],
     },
@@ -1,12 +1,28 @@
 import os
+import stat
+from .config import MAX_LIST_ENTRIES, WORKSPACE_INDEX
+from .gitignore import load_gitignore, matches_any
 
-def get_files_info(working_directory, directory="."):
+def get_files_info(working_directory, directory=".", recursive=False, max_depth=None, include=None,
+                   exclude=None, use_gitignore=True, page_size=None, cursor=None, tree=False):
     """
     Get information about files in a directory.
+
+    Without options, lists one level in directory order. Any of the other options
+    switch to a sorted walk: entries come in path order, depth first, and pages
+    continue after the path given as cursor.
     
     Args:
         working_directory (str): The base working directory
         directory (str): Relative path within the working directory (default: ".")
+        recursive (bool): List subdirectories too
+        max_depth (int): Levels listed below directory (1 lists its entries only)
+        include (list): Glob patterns; only matching files are listed
+        exclude (list): Glob patterns of files and directories to skip
+        use_gitignore (bool): Skip entries ignored by .gitignore files
+        page_size (int): Maximum number of entries returned (default: MAX_LIST_ENTRIES)
+        cursor (str): Path of the last entry of the previous page
+        tree (bool): Compact indented tree of names instead of one line per entry
         
     Returns:
         str: Formatted string with file information or error message
@@ -29,30 +45,139 @@ def get_files_info(working_directory, directory="."):
         
         # List directory contents
         try:
-            entries = os.listdir(abs_full_path)
+            with os.scandir(abs_full_path) as it:
+                entries = list(it)
         except PermissionError:
             return f'Error: Permission denied to access "{directory}"'
         except OSError as e:
             return f'Error: Unable to access "{directory}": {str(e)}'
-        
-        # Build the result string
+
+        if not (recursive or max_depth or include or exclude or page_size or cursor or tree):
+            # Build the result string
+            return "\n".join(_format_entry(entry.name, entry) for entry in entries)
+
+        if recursive:
+            depth_limit = max_depth if max_depth else None
+        else:
+            depth_limit = max_depth or 1
+        page_size = page_size or MAX_LIST_ENTRIES
+        if page_size < 1 or (depth_limit is not None and depth_limit < 1):
+            return 'Error: page_size and max_depth must be at least 1'
+        cursor_parts = tuple(part for part in cursor.replace(os.sep, "/").split("/") if part not in ("", ".")) if cursor else None
+        ignore = load_gitignore(abs_full_path, abs_working_dir) if use_gitignore else None
+
+        # A live workspace index already knows the file sizes, which saves a stat per file
+        index = None
+        if WORKSPACE_INDEX and not tree:
+            from .workspace_index import get_index
+            index = get_index(working_directory)
+            if index is not None and index.live:
+                index.sync()
+            else:
+                index = None
+
+        walk = _walk(entries, (), 1, depth_limit, ignore, list(include or ()), list(exclude or ()), cursor_parts)
         result_lines = []
-        for entry in entries:
-            entry_path = os.path.join(abs_full_path, entry)
-            try:
-                file_size = os.path.getsize(entry_path)
-                is_dir = os.path.isdir(entry_path)
-                result_lines.append(f"- {entry}: file_size={file_size} bytes, is_dir={is_dir}")
-            except OSError:
-                # If we can't get file size, still include the entry with unknown size
-                is_dir = os.path.isdir(entry_path)
-                result_lines.append(f"- {entry}: file_size=unknown bytes, is_dir={is_dir}")
-        
+        last = None
+        for parts, entry in walk:
+            if len(result_lines) == page_size:
+                result_lines.append(f'[...Listing truncated at {page_size} entries; continue with cursor="{last}"]')
+                break
+            last = "/".join(parts)
+            if tree:
+                suffix = "/" if _is_dir(entry) else ""
+                result_lines.append(f"{'  ' * (len(parts) - 1)}{entry.name}{suffix}")
+            else:
+                record = index.lookup(entry.path, sync=False) if index is not None else None
+                result_lines.append(_format_entry(last, entry, record))
+
+        if not result_lines:
+            return f'No matching entries in "{directory}"'
         return "\n".join(result_lines)
         
     except Exception as e:
         return f'Error: An unexpected error occurred: {str(e)}'
 
+def _is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def _format_entry(name, entry, record=None):
+    """Format one entry from a single stat call (DirEntry.stat follows symlinks like os.path.getsize)."""
+    if record is not None:
+        return f"- {name}: file_size={record.size} bytes, is_dir=False"
+    try:
+        st = entry.stat()
+    except OSError:
+        # If we can't get file size, still include the entry with unknown size
+        return f"- {name}: file_size=unknown bytes, is_dir={_is_dir(entry)}"
+    return f"- {name}: file_size={st.st_size} bytes, is_dir={stat.S_ISDIR(st.st_mode)}"
+
+def _walk(entries, parts, depth, max_depth, ignore, include, exclude, cursor):
+    """
+    Yield (path parts, DirEntry) for entries and their subdirectories, sorted by path.
+
+    Names are sorted per directory and subdirectories are visited right after their
+    own entry, so the order equals that of the path tuples; a subtree that sorts
+    entirely before the cursor is skipped without being read. With include patterns,
+    a directory is only listed if it has an included file below it (searched past
+    max_depth if needed), right before the first one.
+    """
+    for entry in sorted(entries, key=lambda e: e.name):
+        child = parts + (entry.name,)
+        if cursor is not None and child < cursor[:len(child)]:
+            continue
+        try:
+            # Symlinked directories are listed but not entered, which also avoids cycles
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+        rel_path = "/".join(child)
+        if is_dir and entry.name == ".git":
+            continue
+        if matches_any(exclude, rel_path):
+            continue
+        if ignore is not None and ignore.ignored(rel_path, is_dir):
+            continue
+
+        # The cursor itself and its ancestors were returned on an earlier page
+        past_cursor = cursor is None or child > cursor[:len(child)]
+        if not is_dir:
+            if past_cursor and (not include or matches_any(include, rel_path)):
+                yield child, entry
+            continue
+
+        entered = max_depth is None or depth < max_depth
+        if not include:
+            if past_cursor:
+                yield child, entry
+            if not entered:
+                continue
+        try:
+            with os.scandir(entry.path) as it:
+                sub_entries = list(it)
+        except OSError:
+            continue
+        sub_ignore = ignore.child(entry.path, rel_path) if ignore is not None else None
+        if not entered:
+            # Below the listed depth: only whether an included file exists matters
+            if past_cursor and next(_walk(sub_entries, child, depth + 1, None, sub_ignore, include, exclude, None),
+                                    None) is not None:
+                yield child, entry
+            continue
+        subtree = _walk(sub_entries, child, depth + 1, max_depth, sub_ignore, include, exclude,
+                        None if past_cursor else cursor)
+        if include:
+            first = next(subtree, None)
+            if first is None:
+                continue
+            if past_cursor:
+                yield child, entry
+            yield first
+        yield from subtree
+
 # Function declaration schema for LLM
 schema_get_files_info = {
     "name": "get_files_info",
@@ -64,6 +189,40 @@ schema_get_files_info = {
                 "type": "string",
                 "description": "The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
             },
+            "recursive": {
+                "type": "boolean",
+                "description": "List the whole tree below the directory, sorted by path. Directories ignored by .gitignore and .git are skipped.",
+            },
+            "max_depth": {
+                "type": "integer",
+                "description": "Number of levels listed below the directory (1 lists its own entries only).",
+            },
+            "include": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns such as \"*.py\"; only matching files are listed. Patterns containing \"/\" match the relative path.",
+            },
+            "exclude": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of files and directories to skip.",
+            },
+            "use_gitignore": {
+                "type": "boolean",
+                "description": "Skip entries ignored by .gitignore files (default: true).",
+            },
+            "page_size": {
+                "type": "integer",
+                "description": f"Maximum number of entries returned (default: {MAX_LIST_ENTRIES}).",
+            },
+            "cursor": {
+                "type": "string",
+                "description": "Continue a truncated listing after this path, as given at the end of the previous page.",
+            },
+            "tree": {
+                "type": "boolean",
+                "description": "Return a compact indented tree of names instead of one line per entry with its size.",
+            },
         },
     },
 }
\ No newline at end of file
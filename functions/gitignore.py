@@ -0,0 +1,200 @@
+import fnmatch
+import os
+import re
+
+
+def _translate(pattern):
+    """Translate the glob part of a .gitignore pattern into a regular expression."""
+    i = 0
+    parts = []
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body}]")
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts)
+
+
+def parse_gitignore(text, base=""):
+    """
+    Parse the lines of a .gitignore file.
+
+    Args:
+        text (str): Content of the file
+        base (str): Directory of the file, relative to the top directory of the rules ("" for the top)
+
+    Returns:
+        list: Rules as (base, compiled regex, negated, directories only) tuples
+    """
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but at the end anchors the pattern to the .gitignore directory
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regex = _translate(line)
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        rules.append((base, re.compile(regex + r"\Z"), negated, dir_only))
+    return rules
+
+
+def _join(base, path):
+    return f"{base}/{path}" if base and path else base or path
+
+
+class GitIgnore:
+    """
+    The .gitignore rules in effect for one directory of a walk.
+
+    Rule bases are relative to the top directory the rules were collected from, and
+    root is the listing root relative to it, so ignored() takes paths relative to the
+    listing root with "/" separators. Like git, the last matching rule wins, and
+    files below an ignored directory are never visited.
+    """
+
+    def __init__(self, rules=(), root=""):
+        self.rules = list(rules)
+        self.root = root
+
+    def child(self, abs_dir, rel_dir):
+        """Rules for a subdirectory of the listing root, adding its own .gitignore if it has one."""
+        try:
+            with open(os.path.join(abs_dir, ".gitignore"), "r", encoding="utf-8", errors="ignore") as f:
+                rules = parse_gitignore(f.read(), _join(self.root, rel_dir))
+        except OSError:
+            return self
+        return GitIgnore(self.rules + rules, self.root) if rules else self
+
+    def ignored(self, rel_path, is_dir):
+        full_path = _join(self.root, rel_path)
+        ignored = False
+        for base, regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not full_path.startswith(base + "/"):
+                    continue
+                path = full_path[len(base) + 1:]
+            else:
+                path = full_path
+            if regex.match(path):
+                ignored = not negated
+        return ignored
+
+
+def load_gitignore(abs_root, abs_top=None):
+    """
+    Collect the .gitignore rules that apply to the files below abs_root.
+
+    Args:
+        abs_root (str): Directory being listed
+        abs_top (str): Ancestor whose .gitignore files (down to abs_root) also apply,
+            typically the working directory
+
+    Returns:
+        GitIgnore: Rules for abs_root
+    """
+    abs_top = abs_top or abs_root
+    if abs_root != abs_top and not abs_root.startswith(abs_top.rstrip(os.sep) + os.sep):
+        abs_top = abs_root
+
+    chain = [abs_root]
+    while chain[-1] != abs_top:
+        chain.append(os.path.dirname(chain[-1]))
+
+    rules = []
+    for directory in reversed(chain):
+        base = os.path.relpath(directory, abs_top).replace(os.sep, "/")
+        try:
+            with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8", errors="ignore") as f:
+                rules.extend(parse_gitignore(f.read(), "" if base == "." else base))
+        except OSError:
+            continue
+    root = os.path.relpath(abs_root, abs_top).replace(os.sep, "/")
+    return GitIgnore(rules, "" if root == "." else root)
+
+
+def matches_any(patterns, rel_path):
+    """Match the basename against patterns without "/", and the relative path against the others."""
+    name = rel_path.rpartition("/")[2]
+    return any(fnmatch.fnmatch(rel_path if "/" in pattern else name, pattern) for pattern in patterns)
+
+
+def walk_files(abs_root, abs_top=None, include=None, exclude=None, use_gitignore=True):
+    """
+    Yield the regular files below a directory in path order.
+
+    The .git directory, symlinks and, with use_gitignore, entries ignored by the
+    .gitignore files from abs_top down are skipped.
+
+    Args:
+        abs_root (str): Directory to walk
+        abs_top (str): Ancestor whose .gitignore files also apply (e.g. the working directory)
+        include (list): Glob patterns; only matching files are yielded
+        exclude (list): Glob patterns of files and directories to skip
+
+    Yields:
+        tuple: (path relative to abs_root with "/" separators, absolute path)
+    """
+    ignore = load_gitignore(abs_root, abs_top) if use_gitignore else None
+    include = list(include or ())
+    exclude = list(exclude or ())
+
+    def walk(abs_dir, rel_dir, ignore):
+        try:
+            with os.scandir(abs_dir) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return
+        for entry in entries:
+            rel_path = _join(rel_dir, entry.name)
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = not is_dir and entry.is_file(follow_symlinks=False)
+            except OSError:
+                continue
+            if (is_dir and entry.name == ".git") or matches_any(exclude, rel_path):
+                continue
+            if ignore is not None and ignore.ignored(rel_path, is_dir):
+                continue
+            if is_dir:
+                yield from walk(entry.path, rel_path, ignore.child(entry.path, rel_path) if ignore is not None else None)
+            elif is_file and (not include or matches_any(include, rel_path)):
+                yield rel_path, entry.path
+
+    yield from walk(abs_root, "", ignore)
@@ -0,0 +1,309 @@
+import ast
+import hashlib
+import json
+import os
+import posixpath
+import threading
+
+from .ast_cache import ast_cache
+from .config import CACHE_DIR, WORKSPACE_INDEX
+from .regex_search import _list_files
+from .sharding import run_sharded
+from .tool_cache import file_fingerprint
+
+# Directories and files never compared between runs: caches the test run itself writes
+SNAPSHOT_EXCLUDE = ["__pycache__", "*.pyc", ".pytest_cache", ".mypy_cache", ".tox", ".git"]
+
+# Changed files that cannot change a test result
+IGNORED_SUFFIXES = (".md", ".rst")
+
+# Python files that affect every test below them without being imported
+GLOBAL_PYTHON_FILES = ("conftest.py", "setup.py")
+
+# Directories, relative to the working directory, from which absolute imports are resolved
+# (besides the importing file's own directory and the directory the tests run in)
+IMPORT_ROOTS = ("", "src")
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class ImpactState:
+    """
+    What test impact analysis keeps between runs of one test command, persisted
+    under cache_dir: the fingerprint of every file at the last green run, and the
+    local imports of every Python file, reused while the file is unchanged.
+    """
+
+    def __init__(self, root, key, cache_dir=CACHE_DIR):
+        self.root = root
+        self.key = key
+        self.baseline = None
+        self.imports = {}
+        self.cache_path = _state_path(root, key, cache_dir)
+        if self.cache_path:
+            try:
+                with open(self.cache_path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("root") == root and data.get("key") == key:
+                    self.baseline = data["baseline"]
+                    self.imports = data["imports"]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+    def save(self):
+        if not self.cache_path:
+            return
+        data = {"root": self.root, "key": self.key, "baseline": self.baseline, "imports": self.imports}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+
+def snapshot(abs_root):
+    """
+    Fingerprint every file below abs_root that is not ignored.
+
+    Returns:
+        dict: Relative path -> fingerprint (sha1 and size with the workspace index,
+            else mtime, size and inode) as a JSON-friendly list
+    """
+    files = _list_files(abs_root, abs_root, None, SNAPSHOT_EXCLUDE, True)
+    index = None
+    if WORKSPACE_INDEX:
+        from .workspace_index import get_index
+        index = get_index(abs_root)
+    fingerprints = {}
+    for rel_path, abs_path in files:
+        record = index.lookup(abs_path, sync=False) if index is not None else None
+        fingerprint = (record.sha1, record.size) if record is not None else file_fingerprint(abs_path)
+        if fingerprint is not None:
+            fingerprints[rel_path] = list(fingerprint)
+    return fingerprints
+
+
+def _resolve(module, base, files):
+    """Local files executed by importing a dotted module from base: package __init__s and the module."""
+    found = []
+    path = base
+    for part in module.split("."):
+        path = posixpath.join(path, part) if path else part
+        for candidate in (f"{path}.py", f"{path}/__init__.py"):
+            if candidate in files:
+                found.append(candidate)
+    return found
+
+
+def local_imports(rel_path, abs_path, files, bases):
+    """
+    Local files a Python file imports, statically: import statements anywhere in the
+    file, resolved against its own directory (and parents, for relative imports)
+    and the import roots. Dynamic imports are not seen.
+
+    Args:
+        rel_path (str): Path of the file relative to the working directory
+        abs_path (str): Absolute path of the file
+        files (set): Relative paths of every file in the working directory
+        bases (tuple): Directories absolute imports are resolved from
+
+    Returns:
+        list: Relative paths of the imported local files
+    """
+    try:
+        with open(abs_path, "rb") as f:
+            source = f.read().decode("utf-8", errors="replace")
+        tree = ast_cache.parse(source, abs_path).tree
+    except (OSError, SyntaxError, ValueError):
+        return []
+    directory = posixpath.dirname(rel_path)
+    bases = (directory,) + tuple(base for base in bases if base != directory)
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                for base in bases:
+                    found.update(_resolve(alias.name, base, files))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                package = directory
+                for _ in range(node.level - 1):
+                    package = posixpath.dirname(package)
+                targets = [(node.module or "", package)]
+            else:
+                targets = [(node.module, base) for base in bases]
+            for module, base in targets:
+                # "from a import b" imports a, and b if it is a submodule
+                if module:
+                    found.update(_resolve(module, base, files))
+                for alias in node.names:
+                    found.update(_resolve(f"{module}.{alias.name}" if module else alias.name, base, files))
+    found.discard(rel_path)
+    return sorted(found)
+
+
+class ImportGraph:
+    """Local imports of the Python files of the working directory, computed on demand."""
+
+    def __init__(self, abs_root, fingerprints, state, bases):
+        self.abs_root = abs_root
+        self.fingerprints = fingerprints
+        self.files = set(fingerprints)
+        self.state = state
+        self.bases = bases
+        self._closures = {}
+
+    def imports(self, rel_path):
+        fingerprint = self.fingerprints.get(rel_path)
+        cached = self.state.imports.get(rel_path)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        abs_path = os.path.join(self.abs_root, *rel_path.split("/"))
+        imports = local_imports(rel_path, abs_path, self.files, self.bases)
+        self.state.imports[rel_path] = [fingerprint, imports]
+        return imports
+
+    def closure(self, rel_path):
+        """Every local file rel_path depends on through imports, itself included."""
+        closure = self._closures.get(rel_path)
+        if closure is None:
+            closure = {rel_path}
+            pending = [rel_path]
+            while pending:
+                for dependency in self.imports(pending.pop()):
+                    if dependency not in closure:
+                        closure.add(dependency)
+                        pending.append(dependency)
+            self._closures[rel_path] = closure
+        return closure
+
+
+def _full_run_reason(changed, baseline, fingerprints):
+    """Why a change affects every test (a removed module, a non-Python file, conftest.py), or None."""
+    for rel_path in changed:
+        name = posixpath.basename(rel_path)
+        if rel_path.endswith(".py"):
+            if rel_path not in fingerprints:
+                return f"{rel_path} was removed"
+            if name in GLOBAL_PYTHON_FILES:
+                return f"{rel_path} changed"
+            if rel_path not in baseline and any(path.endswith(f"/{name}") or path == name for path in baseline):
+                return f"{rel_path} was added and may shadow a module"
+        elif not rel_path.endswith(IGNORED_SUFFIXES):
+            return f"{rel_path} changed"
+    return None
+
+
+def start_green_run(abs_root, cwd, cmd, cache_dir=CACHE_DIR):
+    """
+    Fingerprint the files before a full run of a test command whose changed_only
+    runs have a state to keep up to date; other commands skip the snapshot.
+
+    Returns:
+        dict: Fingerprints for record_green_run once the run passed, or None
+    """
+    path = _state_path(abs_root, _state_key(abs_root, cwd, cmd), cache_dir)
+    return snapshot(abs_root) if path and os.path.exists(path) else None
+
+
+def record_green_run(abs_root, cwd, cmd, fingerprints, cache_dir=CACHE_DIR):
+    """Remember the files a test command passed on, as taken by start_green_run, as the base for run_impacted."""
+    if fingerprints is None:
+        return
+    key = _state_key(abs_root, cwd, cmd)
+    with _lock_for(abs_root, key):
+        state = ImpactState(abs_root, key, cache_dir)
+        state.baseline = fingerprints
+        state.save()
+
+
+def run_impacted(test_path, cmd, cwd, abs_root, shards, timeout, test_timeout=None, cache_dir=CACHE_DIR):
+    """
+    Run only the tests affected by the files changed since the last green run.
+
+    Files are compared by fingerprint with the last green run of the same command,
+    so edits made through the tools, by git or by anything else are all seen. A
+    test is affected if its file, or a local file it imports directly or
+    indirectly, changed. Every test runs when there is no green run yet, or a
+    change cannot be traced through imports (removed modules, conftest.py,
+    non-Python files other than documentation).
+
+    Args:
+        test_path (str): Test path as given to run_tests, for the heading
+        cmd (list): The pytest or unittest command the suite would run with
+        cwd (str): Directory the tests run in
+        abs_root (str): Working directory whose files are tracked
+        shards (int): Number of worker processes
+        timeout (float): Seconds allowed for the discovery and for each shard
+        test_timeout (float): Seconds allowed for each test, or None
+        cache_dir (str): Directory where the state is persisted, or None
+
+    Returns:
+        str: Which tests were selected and why, followed by the test results
+    """
+    key = _state_key(abs_root, cwd, cmd)
+    with _lock_for(abs_root, key):
+        state = ImpactState(abs_root, key, cache_dir)
+        fingerprints = snapshot(abs_root)
+        cwd_rel = os.path.relpath(cwd, abs_root).replace(os.sep, "/")
+        bases = tuple(dict.fromkeys(("" if cwd_rel == "." else cwd_rel,) + IMPORT_ROOTS))
+
+        select = None
+        if state.baseline is None:
+            heading = "no green run recorded yet; running every test"
+        else:
+            changed = sorted(rel_path for rel_path in fingerprints.keys() | state.baseline.keys()
+                             if fingerprints.get(rel_path) != state.baseline.get(rel_path))
+            reason = _full_run_reason(changed, state.baseline, fingerprints)
+            changed_python = {rel_path for rel_path in changed if rel_path.endswith(".py")}
+            listed = ", ".join(changed[:10]) + (f" and {len(changed) - 10} more" if len(changed) > 10 else "")
+            if reason is not None:
+                heading = f"{reason} since the last green run; running every test"
+            elif not changed_python:
+                state.baseline = fingerprints
+                state.save()
+                changes = f"only {listed} changed" if changed else "no files changed"
+                return (f"Test impact: {changes} since the last green run of '{test_path}'; no tests to run "
+                        f"(run without changed_only for the full suite)\n")
+            else:
+                graph = ImportGraph(abs_root, fingerprints, state, bases)
+                selection = {}
+
+                def select(tests):
+                    selected = []
+                    for test_id, abs_file in tests:
+                        rel_file = os.path.relpath(abs_file, abs_root).replace(os.sep, "/") if abs_file else None
+                        if rel_file is None or rel_file not in fingerprints or graph.closure(rel_file) & changed_python:
+                            selected.append(test_id)
+                    selection["counts"] = (len(selected), len(tests))
+                    return selected
+
+                heading = f"{len(changed)} file(s) changed since the last green run: {listed}"
+
+        run = run_sharded(test_path, cmd, cwd, shards, timeout, test_timeout, cache_dir, select)
+        if select is not None and "counts" in selection:
+            heading = f"selected {selection['counts'][0]} of {selection['counts'][1]} tests; {heading}"
+        if run.clean:
+            state.baseline = fingerprints
+        state.save()
+    return f"Test impact: {heading}\n{run.output}"
+
+
+def _state_key(abs_root, cwd, cmd):
+    return f"{os.path.relpath(cwd, abs_root)}\0{' '.join(cmd)}"
+
+
+def _state_path(root, key, cache_dir):
+    if not cache_dir:
+        return None
+    name = hashlib.sha1(f"{root}\0{key}".encode("utf-8", errors="surrogateescape")).hexdigest()[:16]
+    return os.path.join(cache_dir, "test_impact", f"{name}.json")
+
+
+def _lock_for(*key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
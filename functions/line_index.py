@@ -0,0 +1,143 @@
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+
+from .config import LINE_INDEX_CACHE_FILES
+from .tool_cache import file_fingerprint
+
+_NEWLINE = re.compile(b"\n")
+
+# Bytes scanned for newlines per step when an index is extended
+_SCAN_CHUNK = 1024 * 1024
+
+
+class LineIndex:
+    """
+    Byte offsets of the line starts of a file.
+
+    The index is built lazily: it only covers the file up to the furthest line
+    requested so far, so reading near the top of a huge log never scans the rest.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.starts = array("q", [0])
+        self.complete = size == 0
+        self.lock = threading.Lock()
+        self._scanned = 0
+
+    def extend(self, data, line):
+        """Scan data (the mapped file) until the start of the line after `line` is known."""
+        while not self.complete and len(self.starts) <= line:
+            end = min(self._scanned + _SCAN_CHUNK, self.size)
+            self.starts.extend(match.end() for match in _NEWLINE.finditer(data, self._scanned, end))
+            self._scanned = end
+            self.complete = end == self.size
+
+    def line_count(self):
+        """Number of lines in the file, or None while the index is incomplete."""
+        if not self.complete:
+            return None
+        if self.size == 0:
+            return 0
+        # A trailing newline does not start another line
+        return len(self.starts) - (1 if self.starts[-1] == self.size else 0)
+
+    def offset(self, line):
+        """Byte offset where line (1-based) starts, or the file size past the last line."""
+        return self.starts[line - 1] if line <= len(self.starts) else self.size
+
+
+class LineIndexCache:
+    """LRU cache of line indexes keyed by path and invalidated by file fingerprint."""
+
+    def __init__(self, max_files=LINE_INDEX_CACHE_FILES):
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, fingerprint):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(path)
+                return entry[1]
+            index = LineIndex(fingerprint[1])
+            self._entries[path] = (fingerprint, index)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+            return index
+
+
+line_index_cache = LineIndexCache()
+
+
+def _mapped(path):
+    """Open path and map it read-only; returns (file, mmap), mmap is None for empty files."""
+    f = open(path, "rb")
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            return f, None
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        f.close()
+        raise
+
+
+def read_lines(path, first, last=None, max_bytes=None):
+    """
+    Read a range of lines through the cached line index.
+
+    Args:
+        path (str): Absolute path of a regular file
+        first (int): First line to read (1-based)
+        last (int): Last line to read, inclusive; None reads up to max_bytes
+        max_bytes (int): Upper bound on the bytes returned
+
+    Returns:
+        tuple: (data bytes, total line count or None if not known yet, whether the data reaches the end of the file)
+    """
+    fingerprint = file_fingerprint(path)
+    if fingerprint is None:
+        raise FileNotFoundError(path)
+    index = line_index_cache.get(path, fingerprint)
+
+    f, data = _mapped(path)
+    try:
+        if data is None:
+            return b"", 0, True
+        # Extending the index mutates it, so callers reading the same file serialize here
+        with index.lock:
+            index.extend(data, last if last is not None else first)
+            start = index.offset(first)
+            end = index.offset(last + 1) if last is not None else index.size
+            total = index.line_count()
+        if max_bytes is not None:
+            end = min(end, start + max_bytes)
+        return data[start:end], total, end >= len(data)
+    finally:
+        if data is not None:
+            data.close()
+        f.close()
+
+
+def read_bytes(path, offset, length):
+    """
+    Read length bytes at offset from a memory map of the file.
+
+    Returns:
+        tuple: (data bytes, file size)
+    """
+    f, data = _mapped(path)
+    try:
+        if data is None:
+            return b"", 0
+        return data[offset:offset + length], len(data)
+    finally:
+        if data is not None:
+            data.close()
+        f.close()
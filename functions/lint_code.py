@@ -1,6 +1,8 @@
 import os
 import subprocess
 
+from .subprocess_runner import run_command
+
 def lint_code(working_directory, file_path=".", lint_command=None):
     """
     Run code linters on files.
@@ -57,14 +59,8 @@ def lint_code(working_directory, file_path=".", lint_command=None):
         
         # Execute the lint command
         try:
-            result = subprocess.run(
-                cmd,
-                cwd=cwd if 'cwd' in locals() else abs_full_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=60  # Longer timeout for linting
-            )
+            # Longer timeout for linting; only the head and tail of long output are kept
+            result = run_command(cmd, cwd if 'cwd' in locals() else abs_full_path, 60)
             
             output = f"Lint results for '{file_path}':\n"
             output += f"Command: {' '.join(cmd)}\n"
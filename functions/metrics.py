@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Per-thread I/O counters (Linux); rchar/wchar include pipe and socket traffic
+_THREAD_IO_PATH = "/proc/thread-self/io"
+
+_local = threading.local()
+_audit_hook_installed = False
+
+
+def _audit_hook(event, args):
+    if event == "subprocess.Popen":
+        _local.subprocesses = getattr(_local, "subprocesses", 0) + 1
+
+
+def _thread_io():
+    """Get (bytes read, bytes written) by the current thread, or None if unavailable."""
+    try:
+        with open(_THREAD_IO_PATH, "rb") as f:
+            counters = dict(line.split(b":", 1) for line in f.read().splitlines() if b":" in line)
+        return int(counters[b"rchar"]), int(counters[b"wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class MetricsRecorder:
+    """
+    Collects timing and resource metrics for tool calls, model requests and iterations.
+
+    Each span records wall time, CPU time of the calling thread, CPU time of finished
+    child processes, bytes read and written by the thread, and the number of
+    subprocesses it spawned. Recording is off until enable() is called, so the
+    instrumentation in the hot path costs one attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        global _audit_hook_installed
+        if not _audit_hook_installed:
+            # Audit hooks cannot be removed, so install it once per process
+            sys.addaudithook(_audit_hook)
+            _audit_hook_installed = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+
+    @contextmanager
+    def span(self, kind, **labels):
+        """
+        Measure the enclosed block.
+
+        Args:
+            kind (str): "tool", "model" or "iteration"
+            **labels: Extra fields stored with the record (e.g. tool name, iteration)
+
+        Yields:
+            dict: The record, so the block can add fields such as result_bytes
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        record = {"kind": kind, **labels}
+        io_before = _thread_io()
+        subprocesses_before = getattr(_local, "subprocesses", 0)
+        children_cpu_before = _children_cpu()
+        cpu_before = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - start
+            record["cpu_s"] = time.thread_time() - cpu_before
+            # Children of other threads that finished meanwhile are counted too
+            record["children_cpu_s"] = _children_cpu() - children_cpu_before
+            record["subprocesses"] = getattr(_local, "subprocesses", 0) - subprocesses_before
+            io_after = _thread_io()
+            if io_before is not None and io_after is not None:
+                record["bytes_read"] = io_after[0] - io_before[0]
+                record["bytes_written"] = io_after[1] - io_before[1]
+            record["timestamp"] = time.time()
+            with self._lock:
+                self.records.append(record)
+
+    def to_json_lines(self):
+        with self._lock:
+            return "".join(json.dumps(record) + "\n" for record in self.records)
+
+    def to_prometheus(self):
+        """Aggregate the records into Prometheus text exposition format."""
+        fields = ("wall_s", "cpu_s", "children_cpu_s", "bytes_read", "bytes_written", "subprocesses", "result_bytes")
+        totals = {}
+        with self._lock:
+            for record in self.records:
+                label = record.get("tool", "")
+                key = (record["kind"], label)
+                entry = totals.setdefault(key, {"count": 0})
+                entry["count"] += 1
+                for field in fields:
+                    if field in record:
+                        entry[field] = entry.get(field, 0) + record[field]
+
+        lines = []
+        for (kind, label), entry in sorted(totals.items()):
+            labels = f'{{tool="{label}"}}' if label else ""
+            lines.append(f"agent_{kind}_total{labels} {entry['count']}")
+            for field in fields:
+                if field in entry:
+                    name = field[:-2] + "_seconds" if field.endswith("_s") else field
+                    lines.append(f"agent_{kind}_{name}_sum{labels} {entry[field]}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the metrics to path: Prometheus text for *.prom, JSON lines otherwise."""
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json_lines()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+# Shared recorder used by the registry and the agent loops
+recorder = MetricsRecorder()
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+
+from .config import METRICS_CACHE_FILES, WORKSPACE_INDEX
+from .regex_search import _list_files
+from .tool_cache import file_fingerprint
+from .worker_pool import map_chunks
+
+
+class MetricsCache:
+    """
+    LRU cache of per-file metrics, keyed by the kind of metrics and the file path.
+
+    Entries are validated with the file fingerprint (or the content hash when the
+    workspace index is enabled), so only changed files are measured again.
+    """
+
+    def __init__(self, max_files=METRICS_CACHE_FILES):
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, fingerprint, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != fingerprint:
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, fingerprint, metrics):
+        with self._lock:
+            self._entries[key] = (fingerprint, metrics)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+
+metrics_cache = MetricsCache()
+
+# Cache miss marker; files that cannot be measured are cached as None
+_MISSING = object()
+
+
+def collect_metrics(kind, measure, abs_working_dir, abs_dir, include=None, exclude=None, use_gitignore=True,
+                    accept=None):
+    """
+    Measure every file below a directory, reusing the metrics of unchanged files.
+
+    Files not in the cache are measured in chunks on the process pool.
+
+    Args:
+        kind (str): Name of the metrics, part of the cache key
+        measure (callable): Module-level function taking [(relative path, absolute path)]
+            and returning [(relative path, metrics or None)]; runs in the worker processes
+        abs_working_dir (str): The base working directory
+        abs_dir (str): Directory to measure
+        include (list): Glob patterns of the files measured
+        exclude (list): Glob patterns of files and directories skipped
+        use_gitignore (bool): Skip files ignored by .gitignore
+        accept (callable): Predicate on the relative path selecting the files to measure
+
+    Returns:
+        list: (relative path, metrics) in path order, for the files with metrics
+    """
+    files = _list_files(abs_working_dir, abs_dir, include, exclude, use_gitignore)
+    if accept is not None:
+        files = [file for file in files if accept(file[0])]
+
+    index = None
+    if WORKSPACE_INDEX and use_gitignore:
+        from .workspace_index import get_index
+        index = get_index(abs_working_dir)
+
+    results = {}
+    fingerprints = {}
+    pending = []
+    for rel_path, abs_path in files:
+        record = index.lookup(abs_path, sync=False) if index is not None else None
+        fingerprint = (record.sha1, record.size) if record is not None else file_fingerprint(abs_path)
+        cached = metrics_cache.get((kind, abs_path), fingerprint, _MISSING) if fingerprint is not None else _MISSING
+        if cached is not _MISSING:
+            results[rel_path] = cached
+        else:
+            fingerprints[rel_path] = (abs_path, fingerprint)
+            pending.append((rel_path, abs_path))
+
+    for chunk in map_chunks(measure, pending):
+        for rel_path, metrics in chunk:
+            abs_path, fingerprint = fingerprints[rel_path]
+            if fingerprint is not None:
+                metrics_cache.put((kind, abs_path), fingerprint, metrics)
+            results[rel_path] = metrics
+
+    return [(rel_path, results[rel_path]) for rel_path, _ in files if results.get(rel_path) is not None]
+
+
+def package_of(rel_path):
+    """Directory of a file relative to the measured directory, with a trailing "/" ("./" at the top)."""
+    directory = rel_path.rpartition("/")[0]
+    return f"{directory}/" if directory else "./"
+
+
+def group_by_package(rows, fields):
+    """
+    Sum per-file metrics by package.
+
+    Args:
+        rows (list): (relative path, metrics) as returned by collect_metrics
+        fields (tuple): Names of the metrics attributes summed
+
+    Returns:
+        dict: Package -> {"files": count, field: sum, ...}
+    """
+    packages = {}
+    for rel_path, metrics in rows:
+        totals = packages.get(package_of(rel_path))
+        if totals is None:
+            totals = packages[package_of(rel_path)] = dict.fromkeys(("files",) + tuple(fields), 0)
+        totals["files"] += 1
+        for field in fields:
+            totals[field] += getattr(metrics, field)
+    return packages
+
+
+def top(items, key, top_n):
+    """The top_n items with the highest key, and how many were left out."""
+    ranked = sorted(items, key=key, reverse=True)
+    return ranked[:top_n], max(0, len(ranked) - top_n)
+
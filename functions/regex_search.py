@@ -1,81 +1,416 @@
+import mmap
 import os
 import re
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
 
-def regex_search(working_directory, file_path, pattern):
+from .config import MAX_SEARCH_MATCHES, PROCESS_MIN_FILES, SEARCH_INDEX, WORKSPACE_INDEX
+from .gitignore import matches_any, walk_files
+from .worker_pool import chunk_size, process_pool, reset_pool
+
+# Lines longer than this are cut in directory results (e.g. minified files)
+MAX_LINE_CHARS = 300
+
+# Bytes of a file checked for NUL characters to skip binary files
+BINARY_SNIFF_BYTES = 8192
+
+# Bytes of a mapped file copied at a time to count the lines skipped over
+COUNT_CHUNK_BYTES = 1 << 20
+
+# Bytes that make the bytes pattern or "\n" line splitting disagree with the str
+# pattern on text-mode lines (non-ASCII characters, "\r" newlines)
+_TEXT_MODE_BYTES = re.compile(rb"[\x80-\xff\r]")
+
+def regex_search(working_directory, file_path, pattern, include=None, exclude=None, context=0,
+                 max_matches=None, use_gitignore=True):
     """
     Search for a regex pattern in a file and return matching lines.
-    
+
+    If file_path is a directory, every file below it is searched: files are read
+    by a pool of worker processes and results are collected in path order, so the
+    search stops reading as soon as max_matches is reached.
+
     Args:
         working_directory (str): The base working directory
-        file_path (str): Relative path to the file within the working directory
+        file_path (str): Relative path to the file (or directory) within the working directory
         pattern (str): Regular expression pattern to search for
-        
+        include (list): Glob patterns of the files searched in a directory
+        exclude (list): Glob patterns of files and directories skipped in a directory
+        context (int): Lines shown before and after each match
+        max_matches (int): Stop after this many matches (default: MAX_SEARCH_MATCHES for directories)
+        use_gitignore (bool): Skip files ignored by .gitignore when searching a directory
+
     Returns:
         str: Matching lines or error message
     """
     try:
         # Create the full path
         full_path = os.path.join(working_directory, file_path)
-        
+
         # Get absolute paths for comparison
         abs_working_dir = os.path.abspath(working_directory)
         abs_full_path = os.path.abspath(full_path)
-        
+
         # Check if the path is within the working directory boundaries
         if not abs_full_path.startswith(abs_working_dir):
             return f'Error: Cannot access "{file_path}" as it is outside the permitted working directory'
-        
+
+        if context < 0 or (max_matches is not None and max_matches < 1):
+            return 'Error: context must not be negative and max_matches must be at least 1'
+
+        if os.path.isdir(abs_full_path):
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                return f'Error: Invalid regex pattern "{pattern}": {str(e)}'
+            return _search_directory(abs_working_dir, abs_full_path, file_path, pattern, include, exclude,
+                                     context, max_matches or MAX_SEARCH_MATCHES, use_gitignore)
+
         # Check if the path is a file
         if not os.path.isfile(abs_full_path):
             return f'Error: File not found or is not a regular file: "{file_path}"'
-        
+
         # Compile the regex pattern
         try:
             regex = re.compile(pattern)
         except re.error as e:
             return f'Error: Invalid regex pattern "{pattern}": {str(e)}'
-        
-        # Read the file content
+
+        # Search the file line by line as it is read
         try:
             with open(abs_full_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
+                count, entries, _ = _scan_lines(f, regex, context, max_matches)
         except UnicodeDecodeError:
             return f'Error: Unable to read "{file_path}" - file may be binary'
         except PermissionError:
             return f'Error: Permission denied to read "{file_path}"'
         except OSError as e:
             return f'Error: Unable to read "{file_path}": {str(e)}'
-        
-        # Search for matches
-        matches = []
-        for i, line in enumerate(lines, 1):
-            if regex.search(line):
-                matches.append(f"Line {i}: {line.rstrip()}")
-        
+        matches = _format_entries(entries, context)
+
         if matches:
-            return f'Found {len(matches)} match(es) for pattern "{pattern}" in "{file_path}":\n' + '\n'.join(matches)
+            return f'Found {count} match(es) for pattern "{pattern}" in "{file_path}":\n' + '\n'.join(matches)
         else:
             return f'No matches found for pattern "{pattern}" in "{file_path}"'
-            
+
     except Exception as e:
         return f'Error: An unexpected error occurred: {str(e)}'
 
+def _scan_lines(lines, regex, context, limit):
+    """
+    Search an iterable of lines.
+
+    Returns:
+        tuple: (number of matches, (line number, is match, text) for the matching and
+            context lines, whether the limit was reached)
+    """
+    entries = []
+    before = deque(maxlen=context)
+    count = 0
+    after = 0
+    stopped = False
+    for number, line in enumerate(lines, 1):
+        if not stopped and regex.search(line):
+            count += 1
+            first = number - len(before)
+            entries.extend((first + offset, False, previous.rstrip()) for offset, previous in enumerate(before))
+            before.clear()
+            entries.append((number, True, line.rstrip()))
+            after = context
+            stopped = limit is not None and count >= limit
+        elif after:
+            entries.append((number, False, line.rstrip()))
+            after -= 1
+        elif stopped:
+            break
+        elif context:
+            before.append(line)
+    return count, entries, stopped
+
+def _scan_mapped(data, regex, prefilter, context, limit):
+    """
+    Search a memory-mapped ASCII file without "\r" with the same results as _scan_lines.
+
+    The bytes prefilter, run over the whole mapping, finds the next line that may
+    match; only that line and the context lines around matches are decoded and
+    checked with the str pattern, so memory stays bounded whatever the file size.
+    """
+    entries = []
+    count = 0
+    stopped = False
+    size = len(data)
+    start = 0           # Offset of the line being looked at
+    number = 1          # Its line number
+    emitted = 0         # Last line number already in entries
+
+    def line_end(offset):
+        # Offset just past the line's newline
+        end = data.find(b"\n", offset)
+        return size if end == -1 else end + 1
+
+    def text(offset, end):
+        # The line with its newline, as iterating over a text file gives it
+        return data[offset:end].decode("ascii")
+
+    while start < size and not stopped:
+        found = prefilter.search(data, start)
+        if found is None:
+            break
+        # Skip to the line the candidate match starts on
+        candidate = max(start, data.rfind(b"\n", start, found.start()) + 1)
+        if candidate == size:
+            break  # An empty match after the final newline, which ends no line
+        for offset in range(start, candidate, COUNT_CHUNK_BYTES):
+            number += data[offset:min(offset + COUNT_CHUNK_BYTES, candidate)].count(b"\n")
+        start = candidate
+        end = line_end(start)
+        line = text(start, end)
+        if not regex.search(line):
+            start, number = end, number + 1
+            continue
+
+        # Context before: the preceding lines not already shown
+        before = []
+        offset = start
+        for previous in range(number - 1, max(emitted, number - context - 1), -1):
+            offset_end = offset
+            offset = data.rfind(b"\n", 0, offset_end - 1) + 1
+            before.append((previous, False, text(offset, offset_end).rstrip()))
+        entries.extend(reversed(before))
+
+        count += 1
+        entries.append((number, True, line.rstrip()))
+        stopped = limit is not None and count >= limit
+        start, number = end, number + 1
+
+        # Context after: a later line within it may be a match that extends it
+        after = context
+        while after and start < size:
+            end = line_end(start)
+            line = text(start, end)
+            if not stopped and regex.search(line):
+                count += 1
+                entries.append((number, True, line.rstrip()))
+                after = context
+                stopped = limit is not None and count >= limit
+            else:
+                entries.append((number, False, line.rstrip()))
+                after -= 1
+            start, number = end, number + 1
+        emitted = number - 1
+    return count, entries, stopped
+
+def _format_entries(entries, context, max_line_chars=None):
+    """Format matches as "Line N: text" and context as "Line N- text", with "--" between groups."""
+    output = []
+    previous = None
+    for number, is_match, text in entries:
+        if context and previous is not None and number > previous + 1:
+            output.append("--")
+        if max_line_chars and len(text) > max_line_chars:
+            text = text[:max_line_chars] + "..."
+        output.append(f"Line {number}{':' if is_match else '-'} {text}")
+        previous = number
+    return output
+
+def _trim(entries, limit):
+    """Keep the entries up to the limit-th match and the context lines right after it."""
+    count = 0
+    for i, (number, is_match, _) in enumerate(entries):
+        if is_match:
+            count += 1
+            if count == limit:
+                end = i + 1
+                while end < len(entries) and not entries[end][1] and entries[end][0] == entries[end - 1][0] + 1:
+                    end += 1
+                return entries[:end]
+    return entries
+
+def _can_prefilter(pattern):
+    # Searching the whole text at once finds a superset of the per-line matches,
+    # except for anchors to the start/end of the text, "$" (which also matches after
+    # the newline ending a line on its own) and negative assertions that look past
+    # the end of a line
+    return not any(token in pattern for token in ("\\A", "\\Z", "\\B", "$", "(?<", "(?!"))
+
+def search_files(files, pattern, context=0, limit=None):
+    """
+    Search files for a pattern (runs in the worker processes).
+
+    Args:
+        files (list): (relative path, absolute path) tuples
+        pattern (str): Regular expression pattern
+        context (int): Lines shown before and after each match
+        limit (int): Stop after this many matches in total
+
+    Returns:
+        list: (relative path, number of matches, entries as returned by _scan_lines) for files with matches
+    """
+    regex = re.compile(pattern)
+    prefilter = None
+    if _can_prefilter(pattern):
+        try:
+            prefilter = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+        except re.error:
+            pass
+    results = []
+    for rel_path, abs_path in files:
+        try:
+            with open(abs_path, "rb") as f:
+                if f.read(BINARY_SNIFF_BYTES).find(b"\0") != -1:
+                    continue
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    continue  # Empty file
+                with data:
+                    if prefilter is not None and not _TEXT_MODE_BYTES.search(data):
+                        count, entries, stopped = _scan_mapped(data, regex, prefilter, context, limit)
+                    else:
+                        # The bytes pattern could miss lines the str pattern
+                        # matches, so every line is decoded
+                        f.seek(0)
+                        with open(f.fileno(), "r", encoding="utf-8", closefd=False) as text:
+                            count, entries, stopped = _scan_lines(text, regex, context, limit)
+        except (UnicodeDecodeError, OSError):
+            continue
+        if count:
+            results.append((rel_path, count, entries))
+            if limit is not None:
+                limit -= count
+                if stopped or limit <= 0:
+                    break
+    return results
+
+def iter_search(files, pattern, context=0, max_matches=MAX_SEARCH_MATCHES):
+    """
+    Search files, spread over the process pool when there are many.
+
+    Files are split into chunks searched in parallel; results are yielded in the
+    order of files as soon as each chunk (and every chunk before it) is done, and the
+    remaining chunks are cancelled once max_matches is reached.
+
+    Yields:
+        tuple: (relative path, number of matches, entries as returned by _scan_lines)
+    """
+    remaining = max_matches
+    workers = os.cpu_count() or 1
+    if len(files) < PROCESS_MIN_FILES or workers == 1:
+        for result in search_files(files, pattern, context, remaining):
+            yield result
+        return
+
+    size = chunk_size(len(files), workers)
+    chunks = [files[i:i + size] for i in range(0, len(files), size)]
+    pool = process_pool()
+    futures = [pool.submit(search_files, chunk, pattern, context, max_matches) for chunk in chunks]
+    try:
+        for chunk, future in zip(chunks, futures):
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); search the rest here and
+                # start a new pool next time
+                reset_pool(pool)
+                results = search_files(chunk, pattern, context, remaining)
+            for rel_path, count, entries in results:
+                if count > remaining:
+                    # Chunks are searched independently, so cut the one crossing the limit
+                    entries = _trim(entries, remaining)
+                    count = remaining
+                yield rel_path, count, entries
+                remaining -= count
+                if remaining <= 0:
+                    return
+    finally:
+        for future in futures:
+            future.cancel()
+
+def _list_files(abs_working_dir, abs_dir, include, exclude, use_gitignore):
+    """Files below abs_dir as (path relative to abs_dir, absolute path), in path order."""
+    if WORKSPACE_INDEX and use_gitignore:
+        from .workspace_index import get_index
+        index = get_index(abs_working_dir)
+        prefix = os.path.relpath(abs_dir, abs_working_dir).replace(os.sep, "/")
+        prefix = "" if prefix == "." else prefix
+        files = []
+        for rel_path, _ in index.files(prefix):
+            rel_path = rel_path[len(prefix) + 1:] if prefix else rel_path
+            if exclude and _excluded(exclude, rel_path):
+                continue
+            if include and not matches_any(include, rel_path):
+                continue
+            files.append((rel_path, os.path.join(abs_dir, *rel_path.split("/"))))
+        return files
+    return list(walk_files(abs_dir, abs_working_dir, include, exclude, use_gitignore))
+
+def _excluded(patterns, rel_path):
+    # Exclude patterns also apply to every directory above the file
+    parts = rel_path.split("/")
+    return any(matches_any(patterns, "/".join(parts[:i])) for i in range(1, len(parts) + 1))
+
+def _search_directory(abs_working_dir, abs_dir, dir_path, pattern, include, exclude, context, max_matches,
+                      use_gitignore):
+    files = _list_files(abs_working_dir, abs_dir, include, exclude, use_gitignore)
+    searched = files
+    if SEARCH_INDEX:
+        # Only read the files containing the trigrams of the literals the pattern requires
+        from .trigram_index import narrow_candidates
+        searched = narrow_candidates(abs_working_dir, abs_dir, files, pattern, complete=not (include or exclude))
+    output = []
+    total = 0
+    file_count = 0
+    for rel_path, count, entries in iter_search(searched, pattern, context, max_matches):
+        total += count
+        file_count += 1
+        output.append(f"{rel_path}:")
+        output.extend(f"  {line}" for line in _format_entries(entries, context, MAX_LINE_CHARS))
+
+    if not total:
+        return f'No matches found for pattern "{pattern}" in {len(files)} file(s) under "{dir_path}"'
+    header = f'Found {total} match(es) for pattern "{pattern}" in {file_count} file(s) under "{dir_path}":'
+    if total >= max_matches:
+        output.append(f"[...Stopped after {max_matches} matches; narrow the pattern or the include globs to see more]")
+    return header + "\n" + "\n".join(output)
+
 # Function declaration schema for LLM
 schema_regex_search = {
     "name": "regex_search",
-    "description": "Search for a regex pattern in a file and return matching lines.",
+    "description": "Search for a regex pattern in a file, or in every file below a directory (e.g. \".\" for the whole project), and return matching lines.",
     "parameters": {
         "type": "object",
         "properties": {
             "file_path": {
                 "type": "string",
-                "description": "The path to the file to search in, relative to the working directory.",
+                "description": "The path to the file or directory to search in, relative to the working directory.",
             },
             "pattern": {
                 "type": "string",
                 "description": "The regular expression pattern to search for.",
             },
+            "include": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of the files searched in a directory, such as \"*.py\". Patterns containing \"/\" match the relative path.",
+            },
+            "exclude": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Glob patterns of files and directories skipped in a directory.",
+            },
+            "context": {
+                "type": "integer",
+                "description": "Number of lines shown before and after each match (default: 0).",
+            },
+            "max_matches": {
+                "type": "integer",
+                "description": f"Stop after this many matches (default for directories: {MAX_SEARCH_MATCHES}).",
+            },
+            "use_gitignore": {
+                "type": "boolean",
+                "description": "Skip files ignored by .gitignore when searching a directory (default: true).",
+            },
         },
         "required": ["file_path", "pattern"],
     },
-}
\ No newline at end of file
+}
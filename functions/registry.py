@@ -0,0 +1,224 @@
+import importlib
+import os
+
+from .config import WORKING_DIRECTORY
+from .tool_cache import result_cache
+from .metrics import recorder
+
+
+class ToolArgumentError(Exception):
+    """Raised when the arguments of a function call do not match the tool schema."""
+
+
+class Tool:
+    """
+    A callable tool together with the schema the LLM sees for it.
+
+    The implementation lives in functions/<name>.py as <name>() and schema_<name>.
+    The module is imported on first use, so a process that calls one tool (or none)
+    does not pay for importing all of them.
+    """
+
+    def __init__(self, name, read_only=False, path_params=(), cacheable=False, mutating_params=()):
+        self.name = name
+        self._func = None
+        self._schema = None
+
+        # Side-effect classification used by the scheduler: read-only tools may run
+        # concurrently, mutating tools are ordered against calls touching the same
+        # paths. A mutating tool without path_params may touch anything.
+        self.read_only = read_only
+        self.path_params = path_params
+        # Arguments that make a read-only tool mutating when given (e.g. an arbitrary command)
+        self.mutating_params = mutating_params
+        # Pure function of the files named by path_params and the arguments
+        self.cacheable = cacheable
+
+    def _load(self):
+        module = importlib.import_module(f"{__package__}.{self.name}")
+        if self._func is None:
+            self._func = getattr(module, self.name)
+        schema = getattr(module, f"schema_{self.name}")
+
+        # Pre-compute the parameter table once so binding is a dict walk per call;
+        # _schema is set last because other threads use it as the "loaded" flag
+        parameters = schema.get("parameters", {})
+        self.properties = parameters.get("properties", {})
+        self.required = tuple(parameters.get("required", ()))
+        self._schema = schema
+
+    @property
+    def func(self):
+        if self._func is None:
+            self._load()
+        return self._func
+
+    @func.setter
+    def func(self, func):
+        # Lets benchmarks and tests wrap the implementation
+        self._func = func
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            self._load()
+        return self._schema
+
+    def bind(self, args):
+        """
+        Check the arguments of a function call against the schema and convert them.
+
+        Args:
+            args (Mapping): Arguments as sent by the LLM (may be a proto map)
+
+        Returns:
+            dict: Keyword arguments for the tool function
+        """
+        args = dict(args or {})
+        if self._schema is None:
+            self._load()
+
+        unknown = [key for key in args if key not in self.properties]
+        if unknown:
+            raise ToolArgumentError(f'Unknown argument(s) for "{self.name}": {", ".join(sorted(unknown))}')
+
+        missing = [key for key in self.required if args.get(key) is None]
+        if missing:
+            raise ToolArgumentError(f'Missing required argument(s) for "{self.name}": {", ".join(missing)}')
+
+        kwargs = {}
+        for key, value in args.items():
+            if value is None:
+                continue
+            kwargs[key] = _coerce(value, self.properties[key].get("type"), key)
+        return kwargs
+
+    def is_read_only(self, args):
+        """Whether a function call with these arguments only reads."""
+        if not self.read_only:
+            return False
+        args = args or {}
+        return not any(args.get(param) is not None for param in self.mutating_params)
+
+    def touched_paths(self, working_directory, args):
+        """
+        Get the absolute paths a function call reads or writes.
+
+        Args:
+            working_directory (str): The base working directory
+            args (Mapping): Arguments of the function call
+
+        Returns:
+            list: Absolute paths, or None if the call may touch any path
+        """
+        if not self.path_params:
+            return [os.path.abspath(working_directory)] if self.is_read_only(args) else None
+        args = args or {}
+        paths = []
+        for param in self.path_params:
+            # An omitted path argument defaults to the working directory itself
+            value = args.get(param) or "."
+            paths.append(os.path.abspath(os.path.join(working_directory, str(value))))
+        return paths
+
+    def __call__(self, working_directory, args):
+        return self.func(working_directory, **self.bind(args))
+
+
+def _coerce(value, expected_type, key):
+    """Convert a JSON/proto argument value to the Python type declared in the schema."""
+    try:
+        if expected_type == "integer":
+            # Gemini sends every number as a float
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(value)
+            return int(value)
+        if expected_type == "number":
+            return float(value)
+        if expected_type == "boolean":
+            if isinstance(value, str):
+                return value.strip().lower() in ("1", "true", "yes")
+            return bool(value)
+        if expected_type == "array":
+            if isinstance(value, (str, bytes)):
+                raise ValueError(value)
+            return list(value)
+        if expected_type == "string":
+            return str(value)
+    except (TypeError, ValueError):
+        raise ToolArgumentError(f'Argument "{key}" must be of type {expected_type}, got {value!r}')
+    return value
+
+
+# Every tool available to the LLM, keyed by the name used in its schema
+TOOLS = {
+    tool.name: tool
+    for tool in (
+        Tool("get_files_info", read_only=True, path_params=("directory",)),
+        Tool("get_file_content", read_only=True, path_params=("file_path",), cacheable=True),
+        Tool("run_python_file"),
+        Tool("write_file", path_params=("file_path",)),
+        Tool("search_replace", path_params=("file_path",)),
+        Tool("delete_file", path_params=("file_path",)),
+        Tool("create_directory", path_params=("directory_path",)),
+        Tool("regex_search", read_only=True, path_params=("file_path",), cacheable=True),
+        Tool("git_status", read_only=True, path_params=("repo_path",)),
+        Tool("code_complexity", read_only=True, path_params=("file_path",), cacheable=True),
+        Tool("find_duplicates", read_only=True, path_params=("file_path",), cacheable=True),
+        Tool("find_clones", read_only=True, path_params=("directory",)),
+        Tool("git_commit", path_params=("repo_path",)),
+        Tool("git_diff", read_only=True, path_params=("repo_path",)),
+        Tool("git_log", read_only=True, path_params=("repo_path",)),
+        Tool("count_lines", read_only=True, path_params=("file_path",), cacheable=True),
+        Tool("run_tests"),
+        # A custom lint_command may be a formatter that rewrites the files (black, ruff --fix)
+        Tool("lint_code", read_only=True, path_params=("file_path",), mutating_params=("lint_command",)),
+        Tool("extract_function", path_params=("file_path",)),
+        Tool("rename_symbol", path_params=("file_path",)),
+        Tool("add_dependency"),
+    )
+}
+
+
+def schemas():
+    """Return the function declarations of all registered tools."""
+    return [tool.schema for tool in TOOLS.values()]
+
+
+def dispatch(name, args, working_directory=WORKING_DIRECTORY):
+    """
+    Execute a function call requested by the LLM.
+
+    Args:
+        name (str): Name of the tool to call
+        args (Mapping): Arguments of the function call
+        working_directory (str): The base working directory injected into the tool
+
+    Returns:
+        str: Tool result or error message
+    """
+    tool = TOOLS.get(name)
+    if tool is None:
+        return f'Error: Unknown function "{name}"'
+    try:
+        kwargs = tool.bind(args)
+    except ToolArgumentError as e:
+        return f'Error: {str(e)}'
+
+    paths = tool.touched_paths(working_directory, kwargs)
+
+    with recorder.span("tool", tool=name) as record:
+        # Serve repeated reads of unchanged files from memory
+        key = result_cache.key(name, kwargs, working_directory, paths) if tool.cacheable else None
+        result = result_cache.get(key) if key is not None else None
+        record["cached"] = result is not None
+
+        if result is None:
+            result = tool.func(working_directory, **kwargs)
+            if key is not None:
+                result_cache.put(key, result)
+            elif not tool.is_read_only(kwargs):
+                result_cache.invalidate(paths)
+
+        record["result_bytes"] = len(result.encode("utf-8", errors="replace")) if isinstance(result, str) else 0
+    return result
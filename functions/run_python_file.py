@@ -1,6 +1,13 @@
 import os
 import subprocess
 
+from .config import FORK_SERVER, SANDBOX
+from .sandbox import Sandbox
+from .subprocess_runner import run_command
+
+# Seconds a run may take
+RUN_TIMEOUT = 30
+
 def run_python_file(working_directory, file_path, args=None):
     """
     Run a Python file within a working directory.
@@ -41,15 +48,7 @@ def run_python_file(working_directory, file_path, args=None):
             # Combine the file path and arguments
             cmd = ["python", abs_full_path] + args
             
-            # Run the subprocess with a 30-second timeout
-            completed_process = subprocess.run(
-                cmd,
-                cwd=abs_working_dir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=30,
-                text=True
-            )
+            completed_process = _run(cmd, abs_working_dir)
             
             # Format the output
             result_lines = []
@@ -68,16 +67,40 @@ def run_python_file(working_directory, file_path, args=None):
             if completed_process.returncode != 0:
                 result_lines.append(f"Process exited with code {completed_process.returncode}")
             
+            # Add what the run cost when sandboxed
+            if SANDBOX and completed_process.usage is not None:
+                result_lines.append(f"Resources: {completed_process.usage.format()}")
+            
             return "\n".join(result_lines)
             
         except subprocess.TimeoutExpired:
-            return "Error: Python execution timed out after 30 seconds"
+            return f"Error: Python execution timed out after {RUN_TIMEOUT} seconds"
         except Exception as e:
             return f"Error: executing Python file: {e}"
             
     except Exception as e:
         return f'Error: An unexpected error occurred: {str(e)}'
 
+def _run(cmd, cwd):
+    """Run cmd with a RUN_TIMEOUT, in a sandbox and forked from the pre-initialized interpreter when enabled."""
+    if not SANDBOX:
+        return _start(cmd, cwd, None)
+    with Sandbox(RUN_TIMEOUT) as sandbox:
+        return _start(cmd, cwd, sandbox)
+
+def _start(cmd, cwd, sandbox):
+    if FORK_SERVER:
+        from .fork_server import ForkServerError, run
+        try:
+            if sandbox is None:
+                # No core files from crashing scripts
+                return run(cmd[1:], cwd, RUN_TIMEOUT, rlimits={"RLIMIT_CORE": (0, 0)})
+            return run(cmd[1:], cwd, RUN_TIMEOUT, rlimits=sandbox.rlimits, kill_group=True,
+                       cgroup_procs=sandbox.cgroup.procs_path if sandbox.cgroup is not None else None)
+        except ForkServerError:
+            pass  # Fall back to a new interpreter
+    return run_command(cmd, cwd, RUN_TIMEOUT, sandbox=sandbox)
+
 # Function declaration schema for LLM
 schema_run_python_file = {
     "name": "run_python_file",
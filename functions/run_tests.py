@@ -1,7 +1,11 @@
 import os
 import subprocess
 
-def run_tests(working_directory, test_path=".", test_command=None):
+from .impact import record_green_run, run_impacted, start_green_run
+from .sharding import run_sharded
+from .subprocess_runner import run_command
+
+def run_tests(working_directory, test_path=".", test_command=None, shards=None, test_timeout=None, changed_only=False):
     """
     Execute test suites in a directory.
     
@@ -9,6 +13,9 @@ def run_tests(working_directory, test_path=".", test_command=None):
         working_directory (str): The base working directory
         test_path (str): Relative path to the test directory or file within the working directory
         test_command (str): Specific test command to run (optional)
+        shards (int): Split a pytest or unittest suite over this many parallel processes (optional)
+        test_timeout (float): Seconds allowed for each test; implies a sharded run (optional)
+        changed_only (bool): Run only the tests affected by files changed since the last green run (optional)
         
     Returns:
         str: Test results or error message
@@ -29,7 +36,8 @@ def run_tests(working_directory, test_path=".", test_command=None):
         if not os.path.exists(abs_full_path):
             return f'Error: Path not found: "{test_path}"'
         
-        # Determine the test command to use
+        # Determine the test command to use, and the directory it runs in
+        cwd = abs_full_path
         if test_command:
             # Use the provided test command
             cmd = test_command.split()
@@ -41,7 +49,6 @@ def run_tests(working_directory, test_path=".", test_command=None):
                 cwd = os.path.dirname(abs_full_path)
             elif os.path.isdir(abs_full_path):
                 # Test directory - look for common test patterns
-                cwd = abs_full_path
                 if os.path.exists(os.path.join(abs_full_path, 'pytest.ini')) or \
                    os.path.exists(os.path.join(abs_full_path, 'pyproject.toml')):
                     cmd = ['pytest']
@@ -53,20 +60,28 @@ def run_tests(working_directory, test_path=".", test_command=None):
             else:
                 return f'Error: Unsupported test path: "{test_path}"'
         
+        if shards is not None and shards < 1:
+            return 'Error: shards must be at least 1'
+        if changed_only:
+            return run_impacted(test_path, cmd, cwd, abs_working_dir, shards or 1, 60, test_timeout)
+        # The files as this run sees them, the base of later changed_only runs if it passes
+        fingerprints = start_green_run(abs_working_dir, cwd, cmd)
+        if shards or test_timeout:
+            run = run_sharded(test_path, cmd, cwd, shards or 1, 60, test_timeout)
+            if run.clean:
+                record_green_run(abs_working_dir, cwd, cmd, fingerprints)
+            return run.output
+        
         # Execute the test command
         try:
-            result = subprocess.run(
-                cmd,
-                cwd=cwd if 'cwd' in locals() else abs_full_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=60  # Longer timeout for tests
-            )
+            # Longer timeout for tests; only the head and tail of long output are kept
+            result = run_command(cmd, cwd, 60)
             
             output = f"Test execution results for '{test_path}':\n"
             output += f"Command: {' '.join(cmd)}\n"
             output += f"Exit code: {result.returncode}\n"
+            if result.returncode == 0:
+                record_green_run(abs_working_dir, cwd, cmd, fingerprints)
             
             if result.stdout.strip():
                 output += f"STDOUT:\n{result.stdout}\n"
@@ -100,6 +115,18 @@ schema_run_tests = {
                 "type": "string",
                 "description": "Specific test command to run (e.g., 'pytest -v'). If not provided, auto-detects the test framework.",
             },
+            "shards": {
+                "type": "integer",
+                "description": "Split a pytest or unittest suite into this many shards run in parallel processes, balanced by recorded test durations, and merge the results.",
+            },
+            "test_timeout": {
+                "type": "number",
+                "description": "Seconds allowed for each test in a sharded run; tests running longer are reported as timed out.",
+            },
+            "changed_only": {
+                "type": "boolean",
+                "description": "Run only the tests affected by the files changed since the last passing run, traced through imports; runs everything when there was none or a change cannot be traced. Leave false for the full suite.",
+            },
         },
     },
 }
\ No newline at end of file
@@ -0,0 +1,127 @@
+import itertools
+import os
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from .config import (SANDBOX_CGROUP, SANDBOX_CPU_QUOTA, SANDBOX_FILE_BYTES, SANDBOX_MAX_PROCESSES,
+                     SANDBOX_MEMORY_BYTES, SANDBOX_OPEN_FILES)
+
+_run_ids = itertools.count(1)
+
+
+class Cgroup:
+    """
+    A cgroup v2 group for one run, created below SANDBOX_CGROUP with memory, CPU
+    and process count caps. The parent must be delegated to this user with the
+    memory, cpu and pids controllers enabled in its cgroup.subtree_control.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.procs_path = os.path.join(path, "cgroup.procs")
+
+    @classmethod
+    def create(cls, parent, memory_bytes, cpu_quota, max_processes):
+        """
+        Create the group, or return None if cgroup v2 is not available under parent.
+        """
+        if not parent or not os.path.exists(os.path.join(parent, "cgroup.controllers")):
+            return None
+        path = os.path.join(parent, f"agent-run-{os.getpid()}-{next(_run_ids)}")
+        try:
+            os.mkdir(path)
+        except OSError:
+            return None
+        cgroup = cls(path)
+        try:
+            if memory_bytes:
+                cgroup._write("memory.max", str(memory_bytes))
+                cgroup._write("memory.swap.max", "0")
+            if cpu_quota:
+                period = 100000
+                cgroup._write("cpu.max", f"{int(cpu_quota * period)} {period}")
+            if max_processes:
+                cgroup._write("pids.max", str(max_processes))
+        except OSError:
+            # A controller is not delegated; rlimits still apply
+            cgroup.remove()
+            return None
+        return cgroup
+
+    def _write(self, name, value):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(value)
+
+    def remove(self):
+        """Kill whatever is left in the group and remove it."""
+        try:
+            self._write("cgroup.kill", "1")
+        except OSError:
+            pass
+        for _ in range(100):
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                # Killed processes leave the group asynchronously
+                os.sched_yield()
+
+
+class Sandbox:
+    """
+    Limits for one managed run: rlimits set in the child before it executes, a new
+    session so the whole process group can be killed, and a cgroup v2 group when
+    SANDBOX_CGROUP names a delegated one.
+
+    Use as a context manager; the cgroup is removed on exit.
+    """
+
+    def __init__(self, timeout):
+        if resource is None:
+            raise OSError("sandboxed runs need POSIX resource limits, which this platform lacks")
+        cpu_seconds = int(timeout) + 1
+        self.rlimits = {
+            # SIGXCPU at the soft limit, SIGKILL at the hard one
+            "RLIMIT_CPU": (cpu_seconds, cpu_seconds + 1),
+            "RLIMIT_CORE": (0, 0),
+        }
+        if SANDBOX_MEMORY_BYTES:
+            self.rlimits["RLIMIT_AS"] = (SANDBOX_MEMORY_BYTES, SANDBOX_MEMORY_BYTES)
+        if SANDBOX_FILE_BYTES:
+            self.rlimits["RLIMIT_FSIZE"] = (SANDBOX_FILE_BYTES, SANDBOX_FILE_BYTES)
+        if SANDBOX_OPEN_FILES:
+            self.rlimits["RLIMIT_NOFILE"] = (SANDBOX_OPEN_FILES, SANDBOX_OPEN_FILES)
+        self.cgroup = Cgroup.create(SANDBOX_CGROUP, SANDBOX_MEMORY_BYTES, SANDBOX_CPU_QUOTA, SANDBOX_MAX_PROCESSES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.cgroup is not None:
+            self.cgroup.remove()
+
+    def preexec(self):
+        """Runs in the child between fork and exec: only system calls, no locks."""
+        if self.cgroup is not None:
+            fd = os.open(self.cgroup.procs_path, os.O_WRONLY)
+            try:
+                # "0" moves the writing process
+                os.write(fd, b"0")
+            finally:
+                os.close(fd)
+        apply_rlimits(self.rlimits)
+
+
+def apply_rlimits(rlimits):
+    """Set resource.RLIMIT_* name -> (soft, hard) limits on the current process, within its hard limits."""
+    for name, (soft, hard) in rlimits.items():
+        limit = getattr(resource, name)
+        current = resource.getrlimit(limit)[1]
+        if current != resource.RLIM_INFINITY:
+            hard = min(hard, current)
+        resource.setrlimit(limit, (min(soft, hard), hard))
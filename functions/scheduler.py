@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from . import registry
+from .config import WORKING_DIRECTORY, MAX_PARALLEL_TOOLS
+
+
+def _paths_overlap(paths1, paths2):
+    """Check whether two sets of absolute paths share a file or a directory subtree."""
+    # None means the call may touch any path
+    if paths1 is None or paths2 is None:
+        return True
+    for path1 in paths1:
+        for path2 in paths2:
+            if path1 == path2 or path1.startswith(path2 + os.sep) or path2.startswith(path1 + os.sep):
+                return True
+    return False
+
+
+def _conflicts(call1, call2):
+    """Two calls must keep their order unless both are reads or they touch disjoint paths."""
+    read_only1, paths1 = call1
+    read_only2, paths2 = call2
+    if read_only1 and read_only2:
+        return False
+    return _paths_overlap(paths1, paths2)
+
+
+def execute_function_calls(function_calls, working_directory=WORKING_DIRECTORY, max_workers=MAX_PARALLEL_TOOLS):
+    """
+    Execute the function calls of one model turn, running independent calls concurrently.
+
+    Read-only calls run in parallel on a thread pool. A mutating call waits for every
+    earlier call that touches one of its paths, and later calls touching those paths
+    wait for it, so the outcome is the same as running the calls one after another.
+
+    Args:
+        function_calls (list): (name, args) tuples in the order the model sent them
+        working_directory (str): The base working directory injected into the tools
+        max_workers (int): Maximum number of tools running at the same time
+
+    Returns:
+        list: Tool results, in the same order as function_calls
+    """
+    if len(function_calls) <= 1 or max_workers <= 1:
+        return [registry.dispatch(name, args, working_directory) for name, args in function_calls]
+
+    # Classify every call up front; unknown tools are ordered against nothing and
+    # just return their error from dispatch
+    classified = []
+    for name, args in function_calls:
+        tool = registry.TOOLS.get(name)
+        if tool is None:
+            classified.append(None)
+        else:
+            classified.append((tool.is_read_only(args), tool.touched_paths(working_directory, args)))
+
+    def run(name, args, dependencies):
+        # Dependencies were submitted earlier to the same FIFO pool, so they are
+        # already running or done and waiting here cannot deadlock
+        if dependencies:
+            wait(dependencies)
+        return registry.dispatch(name, args, working_directory)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(function_calls))) as executor:
+        for index, (name, args) in enumerate(function_calls):
+            dependencies = []
+            if classified[index] is not None:
+                for earlier in range(index):
+                    if classified[earlier] is not None and _conflicts(classified[earlier], classified[index]):
+                        dependencies.append(futures[earlier])
+            futures.append(executor.submit(run, name, args, dependencies))
+
+    return [future.result() for future in futures]
+
@@ -0,0 +1,249 @@
+# Lists or runs the tests of one shard for functions/sharding.py.
+#
+#   python shard_worker.py list FRAMEWORK REPORT [ARG...]
+#   python shard_worker.py run FRAMEWORK REPORT IDS TIMEOUT [ARG...]
+#
+# FRAMEWORK is "unittest" (ARGs: start directory, pattern, top-level directory) or
+# "pytest" (ARGs: pytest options). "list" writes the tests to REPORT as a JSON list
+# of [id, absolute path of the file defining the test or null]; "run" runs the ids
+# listed one per line in the file IDS and appends one JSON line per test to REPORT:
+# id, outcome (passed, failed, error, skipped or timeout), duration and details. TIMEOUT is the per-test limit in seconds (0 for none).
+# "run" exits with a non-zero status when a test failed, errored or timed out.
+# Progress goes to stdout, one line per test. Runs as a plain script: standard
+# library (and pytest for pytest suites) only.
+
+import json
+import os
+import signal
+import sys
+import time
+import unittest
+
+# Characters of a failure's traceback kept in the report
+MAX_DETAILS_CHARS = 2000
+
+
+class TestTimeout(Exception):
+    """Raised in a test that ran longer than the per-test timeout."""
+
+
+class _Alarm:
+    """Per-test timeout with SIGALRM; the test is interrupted with TestTimeout."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.fired = False
+        if seconds and not hasattr(signal, "SIGALRM"):
+            sys.exit("Per-test timeouts need SIGALRM, which this platform lacks")
+        if seconds:
+            signal.signal(signal.SIGALRM, self._fire)
+
+    def _fire(self, signum, frame):
+        self.fired = True
+        raise TestTimeout(f"Test exceeded the per-test timeout of {self.seconds} seconds")
+
+    def start(self):
+        self.fired = False
+        if self.seconds:
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+
+    def stop(self):
+        if self.seconds:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class _Report:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self.failed = False
+
+    def write(self, test_id, outcome, duration, details=""):
+        self.failed = self.failed or outcome in ("failed", "error", "timeout")
+        # Flushed per test, so the tests of a shard that gets killed still count
+        self._file.write(json.dumps({"id": test_id, "outcome": outcome, "duration": duration,
+                                     "details": details[-MAX_DETAILS_CHARS:]}) + "\n")
+        self._file.flush()
+        print(f"{outcome.upper()} {test_id} ({duration:.2f}s)", flush=True)
+
+
+class _UnittestResult(unittest.TestResult):
+    """Writes one report line per test, with its outcome and duration."""
+
+    def __init__(self, report, alarm):
+        super().__init__()
+        self.report = report
+        self.alarm = alarm
+        self._current = None
+        self._outcome = None
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._current = test
+        self._outcome = ("passed", "")
+        self._start = time.perf_counter()
+        self.alarm.start()
+
+    def stopTest(self, test):
+        self.alarm.stop()
+        super().stopTest(test)
+        self._current = None
+        outcome, details = self._outcome
+        self.report.write(test.id(), outcome, time.perf_counter() - self._start, details)
+
+    def _fail(self, outcome, err):
+        if self.alarm.fired or err[0] is TestTimeout:
+            outcome = "timeout"
+        self._outcome = (outcome, self._exc_info_to_string(err, self._current))
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._fail("failed", err)
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        if test is not self._current:
+            # setUpClass or setUpModule failed: the error is reported for the class or module
+            self.report.write(test.id(), "error", 0.0, self._exc_info_to_string(err, test))
+            return
+        self._fail("error", err)
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        if err is not None and self._outcome[0] == "passed":
+            self._fail("failed" if issubclass(err[0], test.failureException) else "error", err)
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._outcome = ("skipped", reason)
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._outcome = ("failed", "Unexpected success")
+
+
+def _unittest_suites(start, pattern, top):
+    loader = unittest.TestLoader()
+    suite = loader.discover(start, pattern, top or None)
+    if loader.errors:
+        raise ImportError("\n".join(loader.errors))
+    return suite
+
+
+def _flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _flatten(test)
+        else:
+            yield test
+
+
+def _unittest_file(test):
+    module = sys.modules.get(type(test).__module__)
+    path = getattr(module, "__file__", None)
+    return os.path.abspath(path) if path else None
+
+
+def list_unittest(report, start=".", pattern="test*.py", top=""):
+    tests = _flatten(_unittest_suites(start, pattern, top))
+    with open(report, "w", encoding="utf-8") as f:
+        json.dump([[test.id(), _unittest_file(test)] for test in tests], f)
+
+
+def run_unittest(report, ids, timeout, start=".", pattern="test*.py", top=""):
+    # Discover again rather than load by name, so ids resolve exactly as they were listed
+    wanted = set(ids)
+    tests = [test for test in _flatten(_unittest_suites(start, pattern, top)) if test.id() in wanted]
+    order = {test_id: position for position, test_id in enumerate(ids)}
+    suite = unittest.TestSuite(sorted(tests, key=lambda test: order[test.id()]))
+    results = _Report(report)
+    suite.run(_UnittestResult(results, _Alarm(timeout)))
+    return 1 if results.failed else 0
+
+
+class _PytestCollector:
+    def __init__(self):
+        self.tests = []
+
+    def pytest_collection_finish(self, session):
+        self.tests = [[item.nodeid, str(getattr(item, "path", None) or item.fspath)] for item in session.items]
+
+
+class _PytestSelection:
+    """
+    Collects the listed ids instead of the paths given on the command line, which
+    still choose the rootdir and the conftest files as they did for the listing.
+
+    Node ids are relative to the rootdir while arguments are resolved from the
+    invocation directory, so the file part of every id is made absolute.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def pytest_configure(self, config):
+        args = []
+        for test_id in self.ids:
+            path, separator, rest = test_id.partition("::")
+            args.append(os.path.join(str(config.rootpath), *path.split("/")) + separator + rest)
+        config.args = args
+
+
+class _PytestReporter:
+    def __init__(self, report, alarm):
+        self.report = report
+        self.alarm = alarm
+        self._tests = {}
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self._tests[nodeid] = ["passed", "", 0.0]
+        self.alarm.start()
+
+    def pytest_runtest_logreport(self, report):
+        test = self._tests.setdefault(report.nodeid, ["passed", "", 0.0])
+        test[2] += report.duration
+        if report.failed and test[0] != "timeout":
+            test[0] = "timeout" if self.alarm.fired else ("failed" if report.when == "call" else "error")
+            test[1] = report.longreprtext
+        elif report.skipped and test[0] == "passed":
+            test[0] = "skipped"
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        self.alarm.stop()
+        outcome, details, duration = self._tests.pop(nodeid, ["passed", "", 0.0])
+        self.report.write(nodeid, outcome, duration, details)
+
+
+def list_pytest(report, *args):
+    import pytest
+    collector = _PytestCollector()
+    code = pytest.main([*args, "--collect-only", "-q"], plugins=[collector])
+    if code not in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED):
+        sys.exit(int(code))
+    with open(report, "w", encoding="utf-8") as f:
+        json.dump(collector.tests, f)
+
+
+def run_pytest(report, ids, timeout, *args):
+    import pytest
+    results = _Report(report)
+    code = pytest.main(list(args), plugins=[_PytestSelection(ids), _PytestReporter(results, _Alarm(timeout))])
+    if code != pytest.ExitCode.OK:
+        return int(code)
+    return 1 if results.failed else 0
+
+
+def main(argv):
+    command, framework, report = argv[:3]
+    if command == "list":
+        (list_unittest if framework == "unittest" else list_pytest)(report, *argv[3:])
+    else:
+        with open(argv[3], encoding="utf-8") as f:
+            ids = f.read().splitlines()
+        timeout = float(argv[4])
+        sys.exit((run_unittest if framework == "unittest" else run_pytest)(report, ids, timeout, *argv[5:]))
+
+
+if __name__ == "__main__":
+    # Import the tests from the working directory, as "python -m" would
+    sys.path[0] = ""
+    main(sys.argv[1:])
@@ -0,0 +1,287 @@
+import hashlib
+import heapq
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import CACHE_DIR, MAX_LISTED_TEST_PROBLEMS, STREAM_OUTPUT
+from .subprocess_runner import run_command
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shard_worker.py")
+
+# Seconds assumed for a test that has never been timed (when no test has)
+DEFAULT_TEST_SECONDS = 0.1
+
+# Outcomes in the order they are summarized; "not run" is a test of a shard that
+# was killed or crashed before reaching it
+OUTCOMES = ("passed", "failed", "error", "timeout", "skipped", "not run")
+
+
+# Merged output of a sharded run, and whether every selected test ran and none failed
+ShardedRun = namedtuple("ShardedRun", "output clean")
+
+
+class DurationHistory:
+    """
+    Durations of past test runs, persisted per directory, to balance shards.
+
+    Args:
+        root (str): Directory the tests run in
+        cache_dir (str): Directory where durations are persisted, or None to keep them in memory
+    """
+
+    def __init__(self, root, cache_dir=CACHE_DIR):
+        self.root = os.path.abspath(root)
+        self.durations = {}
+        self._mean = None
+        self._lock = threading.Lock()
+        self.cache_path = None
+        if cache_dir:
+            name = hashlib.sha1(self.root.encode("utf-8", errors="surrogateescape")).hexdigest()[:16]
+            self.cache_path = os.path.join(cache_dir, "test_durations", f"{name}.json")
+            try:
+                with open(self.cache_path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("root") == self.root:
+                    self.durations = data["durations"]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+    def estimate(self, test_id):
+        """Recorded duration of a test, or the mean of the recorded ones for a new test."""
+        duration = self.durations.get(test_id)
+        if duration is not None:
+            return duration
+        if self._mean is None:
+            self._mean = sum(self.durations.values()) / len(self.durations) if self.durations else DEFAULT_TEST_SECONDS
+        return self._mean
+
+    def update(self, records):
+        """Record the durations of tests that ran (records as written by shard_worker.py)."""
+        with self._lock:
+            self._mean = None
+            for record in records:
+                # A timed out test takes at least as long again
+                if record["outcome"] in ("passed", "failed", "error", "timeout"):
+                    self.durations[record["id"]] = record["duration"]
+
+    def save(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {"root": self.root, "durations": dict(self.durations)}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+
+def parse_command(cmd):
+    """
+    Recognize a pytest or unittest command.
+
+    Returns:
+        tuple: ("pytest", pytest options) or ("unittest", [start, pattern, top]),
+            or None for other commands
+    """
+    python = ("python", "python3", sys.executable)
+    if cmd[:1] == ["pytest"]:
+        return "pytest", cmd[1:]
+    if len(cmd) >= 3 and cmd[0] in python and cmd[1:3] == ["-m", "pytest"]:
+        return "pytest", cmd[3:]
+    if len(cmd) == 2 and cmd[0] in python and cmd[1].endswith(".py"):
+        # A single test file, run from its directory
+        return "unittest", [".", cmd[1], ""]
+    if len(cmd) >= 3 and cmd[0] in python and cmd[1:3] == ["-m", "unittest"]:
+        args = cmd[3:]
+        if args[:1] == ["discover"]:
+            args = args[1:]
+        elif args:
+            return None
+        options = {"-s": ".", "-p": "test*.py", "-t": ""}
+        aliases = {"--start-directory": "-s", "--pattern": "-p", "--top-level-directory": "-t"}
+        positional = []
+        args = iter(args)
+        for arg in args:
+            arg = aliases.get(arg, arg)
+            if arg in options:
+                options[arg] = next(args, options[arg])
+            elif arg in ("-v", "--verbose", "-q", "--quiet", "-b", "--buffer"):
+                continue
+            elif arg.startswith("-"):
+                return None
+            else:
+                positional.append(arg)
+        for option, value in zip(("-s", "-p", "-t"), positional):
+            options[option] = value
+        return "unittest", [options["-s"], options["-p"], options["-t"]]
+    return None
+
+
+def plan_shards(test_ids, durations, shards):
+    """
+    Split tests into shards of about equal expected duration.
+
+    Longest processing time first: tests are taken from the slowest down and each
+    goes to the shard with the least work so far. Each shard keeps the discovery
+    order, so tests sharing fixtures still run next to each other.
+
+    Returns:
+        list: Non-empty lists of test ids
+    """
+    plan = [[] for _ in range(shards)]
+    loads = [(0.0, index) for index in range(shards)]
+    for position, test_id in sorted(enumerate(test_ids), key=lambda item: -durations.estimate(item[1])):
+        load, index = heapq.heappop(loads)
+        plan[index].append((position, test_id))
+        heapq.heappush(loads, (load + durations.estimate(test_id), index))
+    return [[test_id for _, test_id in sorted(shard)] for shard in plan if shard]
+
+
+def _progress(index):
+    """Progress callback echoing a shard's per-test lines to stderr, prefixed with the shard number."""
+    carry = {"stdout": b"", "stderr": b""}
+
+    def on_output(name, data):
+        lines = (carry[name] + data).split(b"\n")
+        carry[name] = lines.pop()
+        for line in lines:
+            sys.stderr.write(f"[shard {index}] {line.decode('utf-8', errors='replace')}\n")
+        sys.stderr.flush()
+
+    return on_output
+
+
+def _read_report(path):
+    records = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass  # Last line of a killed shard
+    except OSError:
+        pass
+    return records
+
+
+def run_sharded(test_path, cmd, cwd, shards, timeout, test_timeout=None, cache_dir=CACHE_DIR, select=None):
+    """
+    Run a pytest or unittest suite split over parallel worker processes.
+
+    The test ids are discovered first, then split into shards balanced by the
+    durations recorded on previous runs. Every shard runs in its own process with
+    the whole timeout, and the per-test results are merged into one summary.
+
+    Args:
+        test_path (str): Test path as given to run_tests, for the heading
+        cmd (list): The pytest or unittest command the suite would run with
+        cwd (str): Directory the tests run in
+        shards (int): Number of worker processes
+        timeout (float): Seconds allowed for the discovery and for each shard
+        test_timeout (float): Seconds allowed for each test, or None
+        cache_dir (str): Directory where test durations are persisted, or None
+        select (callable): Takes the discovered tests as (id, absolute file path or None)
+            pairs and returns the ids to run (default: all of them)
+
+    Returns:
+        ShardedRun: The merged test results (or error message), and whether the run
+            was clean: every selected test ran and none failed
+    """
+    parsed = parse_command(cmd)
+    if parsed is None:
+        return ShardedRun(f"Error: Sharded runs support pytest and unittest discovery commands, not: {' '.join(cmd)}",
+                          False)
+    framework, args = parsed
+    if test_timeout and not hasattr(signal, "SIGALRM"):
+        return ShardedRun("Error: test_timeout needs SIGALRM, which this platform lacks; run without it", False)
+    python = sys.executable if cmd[0] == sys.executable else "python"
+    start = time.monotonic()
+
+    with tempfile.TemporaryDirectory(prefix="agent-shards-") as tmp:
+        listing = os.path.join(tmp, "tests.json")
+        try:
+            discovery = run_command([python, WORKER_PATH, "list", framework, listing, *args], cwd, timeout)
+        except subprocess.TimeoutExpired:
+            return ShardedRun(f"Error: Test discovery timed out (exceeded {timeout} seconds)", False)
+        try:
+            with open(listing, encoding="utf-8") as f:
+                tests = json.load(f)
+        except (OSError, ValueError):
+            return ShardedRun(f"Error: Test discovery failed (exit code {discovery.returncode}):\n"
+                              f"{discovery.stdout}{discovery.stderr}", False)
+        test_ids = select(tests) if select is not None else [test_id for test_id, _ in tests]
+        if not test_ids:
+            return ShardedRun(f"No tests {'selected' if tests else 'found'} for '{test_path}'", bool(tests))
+
+        durations = DurationHistory(cwd, cache_dir)
+        plan = plan_shards(test_ids, durations, min(shards, len(test_ids)))
+
+        def run_shard(index):
+            ids_path = os.path.join(tmp, f"shard-{index}.ids")
+            report_path = os.path.join(tmp, f"shard-{index}.jsonl")
+            with open(ids_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(plan[index - 1]) + "\n")
+            shard_cmd = [python, WORKER_PATH, "run", framework, report_path, ids_path, str(test_timeout or 0), *args]
+            shard_start = time.monotonic()
+            try:
+                completed = run_command(shard_cmd, cwd, timeout, _progress(index) if STREAM_OUTPUT else None)
+                returncode, output = completed.returncode, completed.stderr
+            except subprocess.TimeoutExpired as e:
+                returncode, output = None, e.stderr
+            return returncode, time.monotonic() - shard_start, _read_report(report_path), output
+
+        with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+            shard_results = list(executor.map(run_shard, range(1, len(plan) + 1)))
+
+    records = [record for _, _, shard_records, _ in shard_results for record in shard_records]
+    durations.update(records)
+    durations.save()
+    return _summarize(test_path, cmd, timeout, plan, shard_results, records, time.monotonic() - start)
+
+
+def _summarize(test_path, cmd, timeout, plan, shard_results, records, wall_seconds):
+    reported = {record["id"] for record in records}
+    counts = dict.fromkeys(OUTCOMES, 0)
+    for record in records:
+        counts[record["outcome"]] = counts.get(record["outcome"], 0) + 1
+    counts["not run"] = sum(test_id not in reported for shard in plan for test_id in shard)
+    clean = (not any(counts[outcome] for outcome in ("failed", "error", "timeout", "not run"))
+             and all(returncode == 0 for returncode, _, _, _ in shard_results))
+
+    output = f"Test execution results for '{test_path}':\n"
+    output += f"Command: {' '.join(cmd)} (in {len(plan)} shards)\n"
+    output += f"Exit code: {0 if clean else 1}\n"
+    output += (f"Ran {len(records)} tests in {wall_seconds:.1f}s "
+               f"({sum(record['duration'] for record in records):.1f}s of test time): ")
+    output += ", ".join(f"{counts[outcome]} {outcome}" for outcome in OUTCOMES if counts[outcome] or outcome == "passed")
+    output += "\n"
+    for index, (returncode, seconds, shard_records, _) in enumerate(shard_results, 1):
+        status = f"exit code {returncode}" if returncode is not None else f"timed out after {timeout} seconds"
+        output += f"  Shard {index}: {len(shard_records)} of {len(plan[index - 1])} tests in {seconds:.1f}s, {status}\n"
+
+    problems = [record for record in records if record["outcome"] in ("failed", "error", "timeout")]
+    for record in problems[:MAX_LISTED_TEST_PROBLEMS]:
+        output += f"\n{record['outcome'].upper()}: {record['id']} ({record['duration']:.2f}s)\n{record['details']}"
+        if not record["details"].endswith("\n"):
+            output += "\n"
+    if len(problems) > MAX_LISTED_TEST_PROBLEMS:
+        output += f"\n... and {len(problems) - MAX_LISTED_TEST_PROBLEMS} more failing tests\n"
+
+    # Output of shards that did not report every test explains why (crash, import error, ...)
+    for index, (returncode, _, shard_records, stderr) in enumerate(shard_results, 1):
+        if len({record["id"] for record in shard_records}) < len(plan[index - 1]) and stderr and stderr.strip():
+            output += f"\nShard {index} STDERR:\n{stderr}\n"
+    return ShardedRun(output, clean)
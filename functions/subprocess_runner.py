@@ -0,0 +1,288 @@
+import io
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from .config import OUTPUT_HEAD_BYTES, OUTPUT_TAIL_BYTES, STREAM_OUTPUT
+
+# Bytes read from a pipe at a time
+READ_BYTES = 65536
+
+# Seconds between checks that the process exited while its pipes are still open
+EXIT_POLL_SECONDS = 0.05
+
+# wait4() (resource usage) and selectors on pipes; elsewhere (Windows) each pipe
+# gets a reader thread and the process is waited for with Popen.wait()
+POSIX_PIPES = hasattr(os, "wait4") and sys.platform != "win32"
+
+# Appended to stderr when the exit status of a command was lost
+LOST_STATUS_NOTE = b"\n[exit status unknown: the process was reaped elsewhere]\n"
+
+
+class ResourceUsage(namedtuple("ResourceUsage", "wall_seconds user_seconds system_seconds max_rss_bytes")):
+    """Resources used by a run: its process and the children it waited for."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_rusage(cls, wall_seconds, rusage):
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return cls(wall_seconds, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss * scale)
+
+    def format(self):
+        return (f"wall {self.wall_seconds:.2f}s, user {self.user_seconds:.2f}s, sys {self.system_seconds:.2f}s, "
+                f"peak RSS {self.max_rss_bytes / (1024 * 1024):.1f} MB")
+
+
+class CompletedRun(subprocess.CompletedProcess):
+    """CompletedProcess with the ResourceUsage of the run (None if unknown)."""
+
+    def __init__(self, args, returncode, stdout=None, stderr=None, usage=None):
+        super().__init__(args, returncode, stdout, stderr)
+        self.usage = usage
+
+
+class OutputBuffer:
+    """
+    Bounded capture of one output stream: the first head_bytes and the last
+    tail_bytes, with the size of the middle that was left out.
+
+    The tail is a bytearray trimmed once it holds twice tail_bytes, so memory stays
+    within head_bytes + 2 * tail_bytes however much the command writes.
+    """
+
+    def __init__(self, head_bytes=OUTPUT_HEAD_BYTES, tail_bytes=OUTPUT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    def write(self, data):
+        self.total += len(data)
+        room = self.head_bytes - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data:
+            self._tail += data
+            if len(self._tail) > 2 * self.tail_bytes:
+                del self._tail[:-self.tail_bytes]
+
+    @property
+    def omitted(self):
+        """Bytes left out between the head and the tail."""
+        return max(0, self.total - len(self._head) - min(len(self._tail), self.tail_bytes))
+
+    def text(self):
+        """
+        The captured output, decoded as subprocess.run(..., text=True) would decode it.
+
+        Output longer than the buffer is cut at line boundaries where possible, and
+        the middle is replaced by a line saying how many bytes were left out.
+        """
+        head = bytes(self._head)
+        tail = bytes(self._tail[-self.tail_bytes:]) if self.tail_bytes else b""
+        if not self.omitted:
+            return _decode(head + tail)
+        head = head[:head.rfind(b"\n") + 1] or head
+        tail = tail[tail.find(b"\n") + 1:] or tail
+        omitted = self.total - len(head) - len(tail)
+        return f"{_decode(head)}\n[... {omitted} bytes of output omitted ...]\n{_decode(tail)}"
+
+
+def _decode(data):
+    # Locale encoding and universal newlines, as in text mode; a cut character is replaced
+    return io.TextIOWrapper(io.BytesIO(data), errors="replace").read()
+
+
+def echo_output(stream, data):
+    """Progress callback writing the output of a command to this process's stderr as it arrives."""
+    sys.stderr.write(_decode(data))
+    sys.stderr.flush()
+
+
+def read_streams(streams, deadline, on_output=None, exited=None):
+    """
+    Read pipes until they are closed or the deadline passes, without blocking on any one.
+
+    Args:
+        streams (dict): Pipe file descriptor -> (name, OutputBuffer)
+        deadline (float): time.monotonic() after which reading stops
+        on_output (callable): Called as on_output(name, data) for every chunk read
+        exited (callable): Polled while the pipes are open; once it returns True, only
+            what the pipes already hold is read (processes left behind may keep them open)
+
+    Returns:
+        bool: True if every pipe reached end of file or exited() returned True, False on timeout
+    """
+    def read(fd):
+        try:
+            data = os.read(fd, READ_BYTES)
+        except BlockingIOError:
+            return False
+        if not data:
+            selector.unregister(fd)
+            return False
+        name, buffer = streams[fd]
+        buffer.write(data)
+        if on_output is not None:
+            on_output(name, data)
+        return True
+
+    with selectors.DefaultSelector() as selector:
+        for fd in streams:
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            for key, _ in selector.select(min(remaining, EXIT_POLL_SECONDS) if exited is not None else remaining):
+                read(key.fd)
+            if exited is not None and selector.get_map() and exited():
+                for fd in list(selector.get_map()):
+                    while read(fd):
+                        pass
+                break
+    return True
+
+
+def run_command(cmd, cwd, timeout, on_output=None, head_bytes=OUTPUT_HEAD_BYTES, tail_bytes=OUTPUT_TAIL_BYTES,
+                sandbox=None):
+    """
+    Run a command like subprocess.run(cmd, stdout=PIPE, stderr=PIPE, text=True),
+    keeping only the head and tail of each stream.
+
+    Both pipes are read as data arrives, so a command writing hundreds of MB costs
+    a bounded amount of memory, and the caller can watch it through on_output.
+
+    Args:
+        cmd (list): Command and arguments
+        cwd (str): Working directory of the command
+        timeout (float): Seconds before the command is killed
+        on_output (callable): Progress callback on_output(name, data) with name "stdout"
+            or "stderr" and the bytes just read (default: echo_output if STREAM_OUTPUT)
+        head_bytes (int): Bytes kept from the start of each stream
+        tail_bytes (int): Bytes kept from the end of each stream
+        sandbox (Sandbox): Limits applied to the command (functions/sandbox.py); the
+            command then runs in a new session whose process group is killed when the
+            command exits, so background processes holding the pipes open do not keep
+            the run waiting
+
+    Returns:
+        CompletedRun: Return code, the captured text output and the resources used
+
+    Raises:
+        subprocess.TimeoutExpired: If the command ran longer than timeout, with the
+            output captured so far
+        OSError: If the command cannot be started (e.g. FileNotFoundError)
+    """
+    if on_output is None and STREAM_OUTPUT:
+        on_output = echo_output
+    start = time.monotonic()
+    deadline = start + timeout
+    stdout = OutputBuffer(head_bytes, tail_bytes)
+    stderr = OutputBuffer(head_bytes, tail_bytes)
+    if not POSIX_PIPES:
+        return _run_with_threads(cmd, cwd, timeout, on_output, stdout, stderr, start)
+    with subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          start_new_session=sandbox is not None,
+                          preexec_fn=sandbox.preexec if sandbox is not None else None) as process:
+        streams = {process.stdout.fileno(): ("stdout", stdout), process.stderr.fileno(): ("stderr", stderr)}
+        reaped, rusage = False, None
+        exited = None
+        if sandbox is not None:
+            def exited():
+                nonlocal reaped, rusage
+                reaped, rusage = _wait(process, time.monotonic())
+                if reaped:
+                    # Background processes the command left behind; then the pipes close
+                    _kill(process, True)
+                return reaped
+        if read_streams(streams, deadline, on_output, exited) and not reaped:
+            reaped, rusage = _wait(process, deadline)
+        if not reaped:
+            _kill(process, sandbox is not None)
+            _wait(process, None)
+            raise subprocess.TimeoutExpired(cmd, timeout, stdout.text(), stderr.text())
+        if sandbox is not None:
+            # Background processes the command left behind
+            _kill(process, True)
+    if rusage is None:
+        # Only a process reaped elsewhere comes without usage: its status is unknown
+        stderr.write(LOST_STATUS_NOTE)
+        usage = None
+    else:
+        usage = ResourceUsage.from_rusage(time.monotonic() - start, rusage)
+    return CompletedRun(cmd, process.returncode, stdout.text(), stderr.text(), usage)
+
+
+def _run_with_threads(cmd, cwd, timeout, on_output, stdout, stderr, start):
+    """run_command without wait4() and selectors: a reader thread per pipe, and Popen.wait()."""
+    def pump(pipe, name, buffer):
+        for data in iter(lambda: pipe.read1(READ_BYTES), b""):
+            buffer.write(data)
+            if on_output is not None:
+                on_output(name, data)
+
+    with subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        readers = [threading.Thread(target=pump, args=(process.stdout, "stdout", stdout), daemon=True),
+                   threading.Thread(target=pump, args=(process.stderr, "stderr", stderr), daemon=True)]
+        for reader in readers:
+            reader.start()
+        try:
+            process.wait(max(start + timeout - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            for reader in readers:
+                reader.join()
+            raise subprocess.TimeoutExpired(cmd, timeout, stdout.text(), stderr.text())
+        # Processes the command left behind may hold the pipes open until the deadline
+        for reader in readers:
+            reader.join(max(start + timeout - time.monotonic(), 0))
+    return CompletedRun(cmd, process.returncode, stdout.text(), stderr.text())
+
+
+def _wait(process, deadline):
+    """
+    Reap the process with wait4() to get its resource usage, polling until the deadline
+    (or blocking without one; a deadline already passed polls once).
+
+    Returns:
+        tuple: (whether the process was reaped, its resource.struct_rusage or None)
+    """
+    delay = 0.0005
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG if deadline is not None else 0)
+        except ChildProcessError:
+            # Reaped elsewhere; the exit status is lost, which must not pass for success
+            if process.returncode is None:
+                process.returncode = -1
+            return True, None
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return True, rusage
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def _kill(process, group):
+    try:
+        if group:
+            os.killpg(process.pid, signal.SIGKILL)
+        elif process.returncode is None:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
@@ -0,0 +1,123 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from .config import TOOL_CACHE_MAX_BYTES, WORKSPACE_INDEX
+
+
+def file_fingerprint(path):
+    """
+    Get the (mtime, size, inode) fingerprint of a regular file.
+
+    Returns:
+        tuple: The fingerprint, or None if the path is not a regular file
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ToolResultCache:
+    """
+    LRU cache of tool results, bounded by the total size of the cached results.
+
+    Entries are keyed by the tool name, its arguments and the fingerprints of the
+    files it reads, so a file changed behind the agent's back simply misses. Tools
+    that modify files also invalidate the entries for those paths explicitly.
+    """
+
+    def __init__(self, max_bytes=TOOL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def key(self, name, kwargs, working_directory, paths):
+        """
+        Build the cache key of a tool call.
+
+        Args:
+            name (str): Tool name
+            kwargs (dict): Bound tool arguments
+            working_directory (str): The base working directory
+            paths (list): Absolute paths of the files the call reads
+
+        Returns:
+            tuple: The key, or None if the call cannot be cached (e.g. it reads a directory)
+        """
+        if not paths:
+            return None
+        index = None
+        if WORKSPACE_INDEX:
+            from .workspace_index import get_index
+            index = get_index(working_directory)
+        fingerprints = []
+        for path in paths:
+            # With the workspace index, entries are keyed by content, so they survive
+            # touches and checkouts that restore the same content
+            record = index.lookup(path) if index is not None else None
+            fingerprint = (record.sha1, record.size) if record is not None else file_fingerprint(path)
+            if fingerprint is None:
+                return None
+            fingerprints.append((path, fingerprint))
+        return (name, os.path.abspath(working_directory), repr(sorted(kwargs.items())), tuple(fingerprints))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result):
+        size = len(result.encode("utf-8", errors="replace")) if isinstance(result, str) else 0
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, paths=None):
+        """
+        Drop the entries reading any of the given paths (files or directory trees).
+
+        Args:
+            paths (list): Absolute paths that were modified, or None to drop everything
+        """
+        with self._lock:
+            if paths is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            prefixes = [path.rstrip(os.sep) + os.sep for path in paths]
+            for key in list(self._entries):
+                entry_paths = [path for path, _ in key[3]]
+                if any(entry_path in paths or entry_path.startswith(prefix)
+                       for entry_path in entry_paths for prefix in prefixes):
+                    self._bytes -= self._entries.pop(key)[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+
+# Shared cache used by registry.dispatch
+result_cache = ToolResultCache()
@@ -0,0 +1,399 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from .config import CACHE_DIR, SEARCH_INDEX, WORKSPACE_INDEX
+from .worker_pool import map_chunks
+
+# Bumped whenever the persisted format changes
+INDEX_MAGIC = b"TRG1"
+
+# Bytes of a file checked for NUL characters; binary files get no trigrams
+BINARY_SNIFF_BYTES = 8192
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+_GROUPS = {sre_constants.SUBPATTERN}
+if hasattr(sre_constants, "ATOMIC_GROUP"):
+    _GROUPS.add(sre_constants.ATOMIC_GROUP)
+
+
+def _trigrams(data):
+    """Set of the 3-byte windows of data, as integers."""
+    # Big-endian 4-byte words read at the four offsets start at every position; the
+    # words are collected in C and only the distinct ones are cut to their first 3 bytes
+    words = set()
+    for offset in range(4):
+        column = array("I")
+        column.frombytes(data[offset:offset + (len(data) - offset) // 4 * 4])
+        if sys.byteorder == "little":
+            column.byteswap()
+        words.update(column)
+    trigrams = {word >> 8 for word in words}
+    # Windows in the last 3 bytes that start no full word
+    for start in range(max(0, len(data) - 5), len(data) - 2):
+        trigrams.add(int.from_bytes(data[start:start + 3], "big"))
+    return trigrams
+
+
+def file_trigrams(files):
+    """
+    Read files and extract their lowercased trigrams; runs in the worker processes.
+
+    Args:
+        files (list): (path relative to the root, absolute path, fingerprint) tuples
+
+    Returns:
+        list: (relative path, fingerprint, sorted trigrams as an array, empty for
+            binary files) for the files that could be read
+    """
+    results = []
+    for rel_path, abs_path, fingerprint in files:
+        try:
+            with open(abs_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        trigrams = array("I")
+        if b"\0" not in data[:BINARY_SNIFF_BYTES]:
+            trigrams.extend(sorted(_trigrams(data.lower())))
+        results.append((rel_path, fingerprint, trigrams))
+    return results
+
+
+def _literal_key(literal, ignore_case):
+    """Bytes of a literal as they appear in the lowercased index, or None if unusable."""
+    if ignore_case and not literal.isascii():
+        # Unicode case folding can match bytes the ASCII-lowercased index does not contain
+        return None
+    return literal.encode("utf-8").lower()
+
+
+def required_literals(pattern):
+    """
+    Extract the literals every match of a pattern must contain.
+
+    Returns:
+        list: Clauses that must all hold; each is a set of byte strings of which at
+            least one occurs in a matching file. Empty if nothing useful is required.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, TypeError, ValueError):
+        return []
+    state = getattr(parsed, "state", None) or parsed.pattern  # renamed in Python 3.11
+    ignore_case = bool(state.flags & re.IGNORECASE)
+    return [clause for clause in _clauses(parsed, ignore_case) if clause]
+
+
+def _clauses(items, ignore_case):
+    clauses = []
+    run = []
+
+    def flush():
+        literal = "".join(run)
+        run.clear()
+        key = _literal_key(literal, ignore_case) if len(literal) >= 3 else None
+        if key is not None and len(key) >= 3:
+            clauses.append({key})
+
+    for op, value in items:
+        if op == sre_constants.LITERAL and chr(value) not in "\r\n":
+            # Newlines are skipped: files are searched with newlines translated
+            run.append(chr(value))
+        elif op == sre_constants.AT:
+            # Zero-width anchors do not break a literal
+            continue
+        elif op in _GROUPS:
+            # SUBPATTERN is (group, add_flags, del_flags, pattern); ATOMIC_GROUP is the pattern
+            subpattern, flags = (value[3], value[1]) if op == sre_constants.SUBPATTERN else (value, 0)
+            flush()
+            clauses.extend(_clauses(subpattern, ignore_case or bool(flags & re.IGNORECASE)))
+        elif op in _REPEATS:
+            flush()
+            minimum, _, subpattern = value
+            if minimum >= 1:
+                clauses.extend(_clauses(subpattern, ignore_case))
+        elif op == sre_constants.BRANCH:
+            flush()
+            alternatives = [_clauses(alternative, ignore_case) for alternative in value[1]]
+            if alternatives and all(alternatives):
+                # One clause per alternative (its most selective) makes an OR clause
+                clause = set()
+                for alternative in alternatives:
+                    clause |= max(alternative, key=lambda c: min(len(literal) for literal in c))
+                clauses.append(clause)
+        else:
+            flush()
+    flush()
+    return clauses
+
+
+class TrigramIndex:
+    """
+    Lowercased trigram posting lists of the files below a root.
+
+    Every file gets an id; the posting list of a trigram is the array of ids of the
+    files containing it. A changed file gets a new id and its old one is marked
+    deleted (posting lists are only filtered, never edited), and the lists are
+    compacted once half the ids are deleted. Queries intersect the lists of the
+    trigrams of the literals a pattern requires, so only candidate files are read.
+
+    Args:
+        root (str): Directory whose files are indexed (paths are relative to it)
+        cache_dir (str): Directory where the index is persisted, or None to keep it in memory
+    """
+
+    def __init__(self, root, cache_dir=CACHE_DIR):
+        self.root = os.path.abspath(root)
+        # id -> [relative path, size, mtime_ns, ino], or None once deleted
+        self.files = []
+        self.ids = {}
+        self.postings = {}
+        self.deleted = 0
+        self._lock = threading.Lock()
+        self._changed = False
+        self.cache_path = None
+        if cache_dir:
+            name = hashlib.sha1(self.root.encode("utf-8", errors="surrogateescape")).hexdigest()[:16]
+            self.cache_path = os.path.join(cache_dir, "trigram_index", f"{name}.bin")
+
+    def _add(self, rel_path, fingerprint, trigrams):
+        file_id = len(self.files)
+        self.files.append([rel_path, *fingerprint])
+        self.ids[rel_path] = file_id
+        for trigram in trigrams:
+            posting = self.postings.get(trigram)
+            if posting is None:
+                self.postings[trigram] = array("I", (file_id,))
+            else:
+                posting.append(file_id)
+
+    def _remove(self, rel_path):
+        file_id = self.ids.pop(rel_path, None)
+        if file_id is not None:
+            self.files[file_id] = None
+            self.deleted += 1
+
+    def update(self, files):
+        """
+        Bring the entries of some files up to date.
+
+        Changed files are read in the process pool when there are many (e.g. when
+        the index is first built).
+
+        Args:
+            files (list): (path relative to the root, absolute path, (size, mtime_ns, ino)
+                or None to stat the file) tuples
+        """
+        with self._lock:
+            pending = []
+            for rel_path, abs_path, fingerprint in files:
+                if fingerprint is None:
+                    try:
+                        st = os.stat(abs_path)
+                    except OSError:
+                        self._remove(rel_path)
+                        continue
+                    fingerprint = (st.st_size, st.st_mtime_ns, st.st_ino)
+                file_id = self.ids.get(rel_path)
+                if file_id is not None and tuple(self.files[file_id][1:]) == tuple(fingerprint):
+                    continue
+                self._remove(rel_path)
+                self._changed = True
+                pending.append((rel_path, abs_path, tuple(fingerprint)))
+            for chunk in map_chunks(file_trigrams, pending):
+                for rel_path, fingerprint, trigrams in chunk:
+                    self._add(rel_path, fingerprint, trigrams)
+            if self.deleted > max(1024, len(self.files) // 2):
+                self._compact()
+
+    def prune(self, prefix, seen):
+        """Drop the entries below prefix ("" for all) that are not in seen."""
+        with self._lock:
+            start = prefix + "/" if prefix else ""
+            for rel_path in [p for p in self.ids if p.startswith(start) and p not in seen]:
+                self._remove(rel_path)
+                self._changed = True
+
+    def _compact(self):
+        """Renumber the live files and drop deleted ids from the posting lists."""
+        remap = {}
+        files = []
+        for file_id, entry in enumerate(self.files):
+            if entry is not None:
+                remap[file_id] = len(files)
+                files.append(entry)
+        postings = {}
+        for trigram, posting in self.postings.items():
+            live = array("I", (remap[file_id] for file_id in posting if file_id in remap))
+            if live:
+                postings[trigram] = live
+        self.files = files
+        self.ids = {entry[0]: file_id for file_id, entry in enumerate(files)}
+        self.postings = postings
+        self.deleted = 0
+        self._changed = True
+
+    def candidates(self, clauses):
+        """
+        Get the files that may match.
+
+        Args:
+            clauses (list): As returned by required_literals
+
+        Returns:
+            set: Relative paths of the candidate files
+        """
+        with self._lock:
+            result = None
+            for clause in clauses:
+                matching = set()
+                for literal in clause:
+                    ids = None
+                    # Intersect starting from the shortest posting list
+                    for posting in sorted((self.postings.get(t, ()) for t in _trigrams(literal)), key=len):
+                        ids = set(posting) if ids is None else ids.intersection(posting)
+                        if not ids:
+                            break
+                    matching |= ids or set()
+                result = matching if result is None else result & matching
+                if not result:
+                    break
+            if result is None:
+                return set(self.ids)
+            return {self.files[file_id][0] for file_id in result if self.files[file_id] is not None}
+
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                data = f.read()
+            if data[:4] != INDEX_MAGIC:
+                return
+            (header_size,) = struct.unpack_from("<I", data, 4)
+            header = json.loads(data[8:8 + header_size])
+            if header.get("root") != self.root or header.get("itemsize") != array("I").itemsize:
+                return
+            offset = 8 + header_size
+            postings = {}
+            while offset < len(data):
+                trigram, count = struct.unpack_from("<II", data, offset)
+                offset += 8
+                posting = array("I")
+                posting.frombytes(data[offset:offset + count * posting.itemsize])
+                offset += count * posting.itemsize
+                postings[trigram] = posting
+        except (OSError, ValueError, struct.error):
+            return
+        self.files = header["files"]
+        self.ids = {entry[0]: file_id for file_id, entry in enumerate(self.files) if entry is not None}
+        self.deleted = len(self.files) - len(self.ids)
+        self.postings = postings
+
+    def save(self):
+        """Persist the index if it changed, replacing the previous copy atomically."""
+        with self._lock:
+            if not self.cache_path or not self._changed:
+                return
+            header = json.dumps({"root": self.root, "itemsize": array("I").itemsize, "files": self.files}).encode("utf-8")
+            chunks = [INDEX_MAGIC, struct.pack("<I", len(header)), header]
+            for trigram, posting in self.postings.items():
+                chunks.append(struct.pack("<II", trigram, len(posting)))
+                chunks.append(posting.tobytes())
+            self._changed = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.writelines(chunks)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _save_all():
+    for index in list(_indexes.values()):
+        index.save()
+
+
+def get_index(working_directory):
+    """
+    Get the shared trigram index of a working directory, loading it on first use.
+
+    Returns:
+        TrigramIndex: The index, or None when it is disabled (AGENT_SEARCH_INDEX)
+    """
+    if not SEARCH_INDEX:
+        return None
+    root = os.path.abspath(working_directory)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            if not _indexes:
+                atexit.register(_save_all)
+            index = TrigramIndex(root)
+            index.load()
+            _indexes[root] = index
+    return index
+
+
+def narrow_candidates(abs_working_dir, abs_dir, files, pattern, complete=True):
+    """
+    Keep the files that can match pattern, updating the index for them first.
+
+    Args:
+        abs_working_dir (str): Root of the index
+        abs_dir (str): Directory being searched
+        files (list): Files below abs_dir as (path relative to abs_dir, absolute path)
+        pattern (str): Regular expression pattern
+        complete (bool): files lists every file below abs_dir, so entries of other
+            files there are deleted files
+
+    Returns:
+        list: The candidate files, in the same order and format
+    """
+    index = get_index(abs_working_dir)
+    clauses = required_literals(pattern)
+    if index is None or not clauses:
+        return files
+
+    prefix = os.path.relpath(abs_dir, abs_working_dir).replace(os.sep, "/")
+    prefix = "" if prefix == "." else prefix
+    workspace = None
+    if WORKSPACE_INDEX:
+        # The workspace index knows the fingerprints, which saves a stat per file
+        from .workspace_index import get_index as get_workspace_index
+        workspace = get_workspace_index(abs_working_dir)
+
+    entries = []
+    for rel_path, abs_path in files:
+        root_path = f"{prefix}/{rel_path}" if prefix else rel_path
+        record = workspace.lookup(root_path, sync=False) if workspace is not None else None
+        fingerprint = (record.size, record.mtime_ns, record.ino) if record is not None else None
+        entries.append((root_path, abs_path, fingerprint))
+    index.update(entries)
+    if complete:
+        index.prune(prefix, {entry[0] for entry in entries})
+
+    candidates = index.candidates(clauses)
+    return [file for file, entry in zip(files, entries) if entry[0] in candidates]
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .config import PROCESS_MIN_FILES
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def process_pool():
+    """Shared worker pool, started on first use and reused by later calls."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver avoids forking the (multi-threaded) agent process itself
+            method = "forkserver" if sys.platform.startswith("linux") else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def reset_pool(pool):
+    """Drop a broken pool so that the next call starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def chunk_size(item_count, workers=None):
+    """Items per task: several tasks per worker to balance uneven files, but not tiny ones."""
+    workers = workers or os.cpu_count() or 1
+    return max(16, min(256, item_count // (workers * 4) or 1))
+
+
+def map_chunks(func, items, *args, min_items=PROCESS_MIN_FILES):
+    """
+    Run func(chunk, *args) over chunks of items, in the process pool when there are many.
+
+    func must be a module-level function. Results are yielded in the order of the
+    chunks; a chunk whose worker died is redone in this process.
+
+    Yields:
+        The result of func for each chunk
+    """
+    items = list(items)
+    workers = os.cpu_count() or 1
+    if len(items) < min_items or workers == 1:
+        if items:
+            yield func(items, *args)
+        return
+
+    size = chunk_size(len(items), workers)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    pool = process_pool()
+    futures = [pool.submit(func, chunk, *args) for chunk in chunks]
+    try:
+        for chunk, future in zip(chunks, futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                reset_pool(pool)
+                yield func(chunk, *args)
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,461 @@
+import atexit
+import hashlib
+import json
+import os
+import stat
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import CACHE_DIR, WORKSPACE_INDEX, WORKSPACE_INDEX_POLL_SECONDS
+from .gitignore import GitIgnore, load_gitignore
+
+# Bumped whenever the persisted format changes
+INDEX_VERSION = 1
+
+# What the index knows about one regular file; size, mtime_ns and ino are compared
+# with a fresh stat to tell whether sha1, language and lines are still valid
+FileRecord = namedtuple("FileRecord", "size mtime_ns ino sha1 language lines")
+
+LANGUAGES = {
+    ".py": "python", ".pyi": "python",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript",
+    ".java": "java", ".kt": "kotlin", ".scala": "scala",
+    ".c": "c", ".h": "c", ".cc": "cpp", ".cpp": "cpp", ".cxx": "cpp", ".hpp": "cpp",
+    ".cs": "csharp", ".go": "go", ".rs": "rust", ".rb": "ruby", ".php": "php", ".swift": "swift",
+    ".sh": "shell", ".bash": "shell", ".sql": "sql", ".lua": "lua", ".r": "r",
+    ".html": "html", ".htm": "html", ".css": "css", ".scss": "css",
+    ".json": "json", ".yaml": "yaml", ".yml": "yaml", ".toml": "toml", ".ini": "ini", ".cfg": "ini",
+    ".xml": "xml", ".md": "markdown", ".rst": "rst", ".txt": "text",
+}
+FILE_NAMES = {"Makefile": "make", "Dockerfile": "docker", "CMakeLists.txt": "cmake"}
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[len]; }
+_EVENT_HEADER = struct.Struct("iIII")
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+               | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+
+def language_of(path):
+    """Guess the language of a file from its name, or None."""
+    name = os.path.basename(path)
+    return FILE_NAMES.get(name) or LANGUAGES.get(os.path.splitext(name)[1].lower())
+
+
+def _hash_file(path):
+    """Get the sha1 and line count of a file from a single streamed read."""
+    digest = hashlib.sha1()
+    lines = 0
+    last = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            lines += chunk.count(b"\n")
+            last = chunk
+    if last and not last.endswith(b"\n"):
+        lines += 1
+    return digest.hexdigest(), lines
+
+
+def _join(base, name):
+    return f"{base}/{name}" if base else name
+
+
+class _Inotify:
+    """Non-blocking inotify instance watching directories (Linux only)."""
+
+    def __init__(self):
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+
+    def add(self, abs_dir, rel_dir):
+        """Watch a directory; returns False if the watch could not be added (e.g. the watch limit)."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(abs_dir), _WATCH_MASK)
+        if wd < 0:
+            return False
+        self.directories[wd] = rel_dir
+        return True
+
+    def read_events(self):
+        """
+        Read the queued events without blocking.
+
+        Returns:
+            list: (directory relative path, mask, name) tuples, or None if the queue overflowed
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                directory = self.directories.get(wd)
+                if mask & IN_IGNORED:
+                    # The watched directory is gone
+                    self.directories.pop(wd, None)
+                    continue
+                if directory is not None:
+                    events.append((directory, mask, name))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class WorkspaceIndex:
+    """
+    Index of the regular files below a root: size, mtime, inode, sha1, language and
+    line count per file.
+
+    The index is built once with a parallel pass that only re-hashes files whose
+    (size, mtime, inode) changed since the persisted copy, so warm restarts cost one
+    stat per file. Afterwards it stays current from inotify events (drained at the
+    start of every query, so no thread is needed) or, where inotify is unavailable,
+    by re-checking the files a query touches and re-walking at most every
+    WORKSPACE_INDEX_POLL_SECONDS. Files ignored by .gitignore and the .git directory
+    are not indexed.
+
+    Args:
+        root (str): Directory to index
+        cache_dir (str): Directory where the index is persisted, or None to keep it in memory
+        watch (bool): Use inotify when available
+        max_workers (int): Threads hashing files during a (re)build
+    """
+
+    def __init__(self, root, cache_dir=CACHE_DIR, watch=True, max_workers=None):
+        self.root = os.path.abspath(root)
+        self.records = {}
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self._lock = threading.RLock()
+        self._watch = watch
+        self._watcher = None
+        self._last_walk = 0.0
+        self._changed = False
+        self.cache_path = None
+        if cache_dir:
+            name = hashlib.sha1(self.root.encode("utf-8", errors="surrogateescape")).hexdigest()[:16]
+            self.cache_path = os.path.join(cache_dir, "workspace_index", f"{name}.json")
+
+    @property
+    def live(self):
+        """True when inotify keeps the index current, so queries need no stat calls."""
+        return self._watcher is not None
+
+    def build(self):
+        """Load the persisted index, bring it up to date and start watching."""
+        with self._lock:
+            self.load()
+            if self._watch and sys.platform.startswith("linux"):
+                try:
+                    self._watcher = _Inotify()
+                except (OSError, AttributeError):
+                    self._watcher = None
+            if not self._scan("") and self._watcher is not None:
+                # Not every directory could be watched; fall back to polling
+                self._watcher.close()
+                self._watcher = None
+            self.save()
+        return self
+
+    def _relative(self, path):
+        """Path relative to the root with "/" separators, or None if outside it."""
+        abs_path = os.path.abspath(os.path.join(self.root, path))
+        if abs_path == self.root:
+            return ""
+        if not abs_path.startswith(self.root + os.sep):
+            return None
+        return os.path.relpath(abs_path, self.root).replace(os.sep, "/")
+
+    def _abs(self, rel):
+        return os.path.join(self.root, *rel.split("/")) if rel else self.root
+
+    def _walk(self, rel_dir, ignore, found):
+        """Collect (stat) of the files below rel_dir into found; returns False if a watch failed."""
+        abs_dir = self._abs(rel_dir)
+        watched = True
+        if self._watcher is not None:
+            watched = self._watcher.add(abs_dir, rel_dir)
+        try:
+            with os.scandir(abs_dir) as it:
+                entries = list(it)
+        except OSError:
+            return watched
+        for entry in entries:
+            rel = _join(rel_dir, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name == ".git" or ignore.ignored(rel, True):
+                        continue
+                    watched = self._walk(rel, ignore.child(entry.path, rel), found) and watched
+                elif entry.is_file(follow_symlinks=False) and not ignore.ignored(rel, False):
+                    found[rel] = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+        return watched
+
+    def _scan(self, rel_dir):
+        """
+        Re-walk a directory tree and re-hash its new and changed files in parallel.
+
+        Returns:
+            bool: False if some directory could not be watched
+        """
+        found = {}
+        # Rules are collected from the root down to rel_dir, and matched against paths
+        # relative to the root like everything else in the index
+        ignore = GitIgnore(load_gitignore(self._abs(rel_dir), self.root).rules)
+        watched = self._walk(rel_dir, ignore, found)
+
+        prefix = rel_dir + "/" if rel_dir else ""
+        for rel in [rel for rel in self.records if rel.startswith(prefix) and rel not in found]:
+            del self.records[rel]
+            self._changed = True
+
+        stale = [(rel, st) for rel, st in found.items() if not self._fresh(self.records.get(rel), st)]
+        if len(stale) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                records = list(executor.map(lambda item: self._record(*item), stale))
+        else:
+            records = [self._record(rel, st) for rel, st in stale]
+        for (rel, _), record in zip(stale, records):
+            if record is None:
+                self.records.pop(rel, None)
+            else:
+                self.records[rel] = record
+            self._changed = True
+        self._last_walk = time.monotonic()
+        return watched
+
+    @staticmethod
+    def _fresh(record, st):
+        return record is not None and (record.size, record.mtime_ns, record.ino) == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def _record(self, rel, st):
+        try:
+            sha1, lines = _hash_file(self._abs(rel))
+        except OSError:
+            return None
+        return FileRecord(st.st_size, st.st_mtime_ns, st.st_ino, sha1, language_of(rel), lines)
+
+    def _ignored(self, rel):
+        """Whether .gitignore rules exclude a file, or one of its directories, as the walk would."""
+        ignore = load_gitignore(self.root)
+        parts = rel.split("/")
+        for depth in range(1, len(parts)):
+            directory = "/".join(parts[:depth])
+            if ignore.ignored(directory, True):
+                return True
+            ignore = ignore.child(self._abs(directory), directory)
+        return ignore.ignored(rel, False)
+
+    def _check(self, rel, force=False):
+        """
+        Bring the record of one path up to date with a stat.
+
+        Args:
+            rel (str): Path relative to the root
+            force (bool): Re-hash even when size, mtime and inode are unchanged; an
+                inotify write event is proof of a change the stat may not show
+        """
+        if not rel or ".git" in rel.split("/"):
+            return
+        try:
+            st = os.stat(self._abs(rel), follow_symlinks=False)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            if self.records.pop(rel, None) is not None:
+                self._changed = True
+            return
+        record = self.records.get(rel)
+        if not force and self._fresh(record, st):
+            return
+        if record is None and self._ignored(rel):
+            # A new file excluded by .gitignore rules
+            return
+        record = self._record(rel, st)
+        if record is None:
+            self.records.pop(rel, None)
+        else:
+            self.records[rel] = record
+        self._changed = True
+
+    def sync(self):
+        """Apply the changes made since the last query."""
+        with self._lock:
+            if self._watcher is None:
+                if time.monotonic() - self._last_walk >= WORKSPACE_INDEX_POLL_SECONDS:
+                    self._scan("")
+                return
+            events = self._watcher.read_events()
+            if events is None:
+                # The kernel queue overflowed, so some events are lost
+                self._scan("")
+                return
+            rescan = set()
+            changed = set()
+            for directory, mask, name in events:
+                rel = _join(directory, name)
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    rescan.add(directory)
+                elif name == ".gitignore":
+                    rescan.add(directory)
+                elif mask & IN_ISDIR:
+                    # Created, moved or deleted directories are re-walked as a whole
+                    rescan.add(rel)
+                else:
+                    changed.add(rel)
+            done = []
+            for rel in sorted(rescan, key=len):
+                # A directory inside one already re-walked is covered by it
+                if any(not parent or rel.startswith(parent + "/") for parent in done):
+                    continue
+                done.append(rel)
+                if os.path.isdir(self._abs(rel)):
+                    self._scan(rel)
+                else:
+                    self._check(rel)
+                    for path in [path for path in self.records if path.startswith(rel + "/")]:
+                        del self.records[path]
+                        self._changed = True
+            for rel in changed:
+                self._check(rel, force=True)
+
+    def lookup(self, path, sync=True):
+        """
+        Get the current record of a file.
+
+        Args:
+            path (str): Absolute path, or path relative to the root
+            sync (bool): Apply pending changes first; callers looking up many paths
+                call sync() once and pass False
+
+        Returns:
+            FileRecord: The record, or None if the path is not an indexed regular file
+        """
+        rel = self._relative(path)
+        if rel is None:
+            return None
+        with self._lock:
+            if self._watcher is None:
+                self._check(rel)
+            elif sync:
+                self.sync()
+            return self.records.get(rel)
+
+    def files(self, prefix=""):
+        """
+        Get the records below a directory, sorted by path.
+
+        Args:
+            prefix (str): Directory relative to the root ("" for all files)
+
+        Returns:
+            list: (relative path, FileRecord) tuples
+        """
+        self.sync()
+        prefix = prefix.strip("/")
+        with self._lock:
+            if not prefix:
+                return sorted(self.records.items())
+            return sorted((rel, record) for rel, record in self.records.items() if rel.startswith(prefix + "/"))
+
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+            return
+        self.records = {rel: FileRecord(*values) for rel, values in data.get("files", {}).items()}
+
+    def save(self):
+        """Persist the index if it changed, replacing the previous copy atomically."""
+        with self._lock:
+            if not self.cache_path or not self._changed:
+                return
+            data = {"version": INDEX_VERSION, "root": self.root,
+                    "files": {rel: list(record) for rel, record in self.records.items()}}
+            self._changed = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def close(self):
+        self.save()
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _save_all():
+    for index in list(_indexes.values()):
+        index.save()
+
+
+def get_index(working_directory):
+    """
+    Get the shared index of a working directory, building it on first use.
+
+    Returns:
+        WorkspaceIndex: The index, or None when the index is disabled (AGENT_WORKSPACE_INDEX)
+    """
+    if not WORKSPACE_INDEX:
+        return None
+    root = os.path.abspath(working_directory)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            if not _indexes:
+                atexit.register(_save_all)
+            index = WorkspaceIndex(root).build()
+            _indexes[root] = index
+    return index
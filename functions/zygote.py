@@ -0,0 +1,203 @@
+# Pre-initialized Python process that forks a child for every script run.
+#
+# Started by fork_server.py as "python zygote.py SOCKET MODULE...": it imports the
+# given modules once, then accepts one connection per run on the Unix socket. Each
+# connection carries a JSON request and the write ends of the stdout and stderr
+# pipes. A forked runner forks the script process (a new session with its own cwd,
+# argv, environment and rlimits), reports its pid, waits for it and reports its
+# return code and resource usage. The zygote runs as a plain script: standard library only.
+
+import sys
+
+# Modules every interpreter has imported before it runs a script, taken before the
+# zygote's own imports: a module of the script's directory cannot shadow these
+STARTUP_MODULES = frozenset(sys.modules)
+
+import atexit
+import gc
+import importlib.machinery
+import json
+import os
+import resource
+import runpy
+import signal
+import socket
+
+# Largest request accepted (the environment makes up most of it)
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+def _receive(conn):
+    """Read the request line and the two file descriptors sent with it."""
+    data, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk or len(data) > MAX_REQUEST_BYTES:
+            raise ValueError("incomplete request")
+        data += chunk
+    if len(fds) != 2:
+        raise ValueError("expected the stdout and stderr descriptors")
+    return json.loads(data), fds
+
+
+def _send(conn, message):
+    try:
+        conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+    except OSError:
+        pass  # The client gave up (e.g. timed out); the run still gets reaped
+
+
+def _runner(conn, request, fds):
+    """Fork the script process, report its pid, wait for it and report its return code and usage."""
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in (devnull, *fds):
+            os.close(fd)
+        return request
+    for fd in fds:
+        os.close(fd)
+    _send(conn, {"pid": pid})
+
+    # Backstop for clients that disappear without killing a runaway script
+    signal.signal(signal.SIGALRM, lambda signum, frame: os.killpg(pid, signal.SIGKILL))
+    signal.alarm(int(request.get("timeout") or 0) + 5)
+    _, status, rusage = os.wait4(pid, 0)
+    signal.alarm(0)
+    if request.get("kill_group"):
+        # Background processes the script left behind
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _send(conn, {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "user_seconds": rusage.ru_utime,
+        "system_seconds": rusage.ru_stime,
+        "max_rss_kb": rusage.ru_maxrss,
+    })
+    os._exit(0)
+
+
+def serve(socket_path, modules):
+    """Accept runs until terminated; returns the request only in a forked script process."""
+    for name in modules:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    # Keep the preloaded objects out of the collector so forks share their pages
+    gc.freeze()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(64)
+    # Runners are reaped automatically; each runner waits for its own script
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        conn, _ = listener.accept()
+        try:
+            request, fds = _receive(conn)
+        except (OSError, ValueError):
+            conn.close()
+            continue
+        pid = os.fork()
+        if pid == 0:
+            listener.close()
+            return _runner(conn, request, fds)
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+
+
+def run_script(request):
+    """Run the requested script as the __main__ module, as "python script args..." would."""
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    for name, (soft, hard) in request.get("rlimits", {}).items():
+        limit = getattr(resource, name)
+        current = resource.getrlimit(limit)[1]
+        if current != resource.RLIM_INFINITY:
+            hard = min(hard, current)
+        resource.setrlimit(limit, (min(soft, hard), hard))
+    if request.get("cgroup_procs"):
+        # "0" moves the writing process
+        with open(request["cgroup_procs"], "w") as f:
+            f.write("0")
+
+    path = request["argv"][0]
+    sys.argv = list(request["argv"])
+    sys.path[0] = os.path.dirname(path)
+    _unshadow(sys.path[0])
+    try:
+        runpy.run_path(path, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = _exit_code(e)
+    except BaseException as e:
+        # Drop the zygote and runpy frames so the traceback starts in the script
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        e.__traceback__ = tb or e.__traceback__
+        sys.excepthook(type(e), e, e.__traceback__)
+        code = 1
+
+    # Exit without tearing down the preloaded modules, which costs more than the
+    # fork; the script's own objects were released when run_path returned. As at
+    # interpreter exit, non-daemon threads are joined before the atexit handlers run
+    shutdown = getattr(sys.modules.get("threading"), "_shutdown", None)
+    if shutdown is not None:
+        shutdown()
+    atexit._run_exitfuncs()
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+    os._exit(code)
+
+
+def _unshadow(directory):
+    """
+    Drop the preloaded modules that a module of the script's directory shadows.
+
+    The script's directory comes first on sys.path, so "import json" must find a
+    json.py next to the script rather than the zygote's json.
+    """
+    shadowed = {}
+    for name in list(sys.modules):
+        top = name.partition(".")[0]
+        if top in STARTUP_MODULES:
+            continue
+        if top not in shadowed:
+            spec = getattr(sys.modules.get(top), "__spec__", None)
+            if spec is not None and not spec.has_location:
+                # Built-in and frozen modules are found before sys.path is searched
+                shadowed[top] = False
+            else:
+                local = importlib.machinery.PathFinder.find_spec(top, [directory])
+                shadowed[top] = local is not None and local.has_location
+        if shadowed[top]:
+            del sys.modules[name]
+
+
+def _exit_code(e):
+    """Exit status of an uncaught SystemExit, as the interpreter reports it."""
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+if __name__ == "__main__":
+    run_script(serve(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,137 @@
+"""
+Conversation history for the agent loop, compacted to a bounded payload
+"""
+
+import hashlib
+
+from functions.config import HISTORY_MAX_CHARS, HISTORY_KEEP_RECENT_RESULTS, HISTORY_COMPACT_MIN_CHARS
+
+
+def _describe_call(name, args):
+    """Format a function call as name(arg=value, ...)."""
+    args = dict(args or {})
+    formatted = ", ".join(f"{key}={value!r}" for key, value in sorted(args.items()))
+    return f"{name}({formatted})"
+
+
+def _omitted(first_kept):
+    """Marker replacing the messages dropped before first_kept (none when nothing was dropped)."""
+    if first_kept <= 1:
+        return ""
+    return f"[{first_kept - 1} earlier message(s) omitted to stay within the context budget]"
+
+
+def _truncate(text, max_chars):
+    """Cut text to at most max_chars, ending with a note of the original length."""
+    note = f"\n[... cut from {len(text)} characters to stay within the context budget]"
+    if max_chars <= len(note):
+        return text[:max(max_chars, 0)]
+    return text[:max_chars - len(note)] + note
+
+
+class _Entry:
+    __slots__ = ("role", "text", "call", "digest")
+
+    def __init__(self, role, text, call=None):
+        self.role = role
+        self.text = text
+        # (name, args) of the function call that produced a result entry
+        self.call = call
+        self.digest = None
+
+
+class ConversationHistory:
+    """
+    Conversation sent to the model on every iteration.
+
+    The latest function results are kept verbatim. Older results that are large
+    (e.g. a full get_file_content read) are replaced by a digest naming the call, the
+    size and a hash of the output, so the model can re-run the call if it needs the
+    content again. If the conversation is still over budget, the oldest steps are
+    dropped and replaced by a marker, then the latest results are digested too and
+    the longest remaining texts cut, so the payload never exceeds max_chars. The
+    user's prompt is always kept whole.
+    """
+
+    def __init__(self, user_prompt, max_chars=HISTORY_MAX_CHARS,
+                 keep_recent_results=HISTORY_KEEP_RECENT_RESULTS,
+                 compact_min_chars=HISTORY_COMPACT_MIN_CHARS):
+        self.max_chars = max_chars
+        self.keep_recent_results = keep_recent_results
+        self.compact_min_chars = compact_min_chars
+        self._entries = [_Entry("user", user_prompt)]
+
+    def add_model(self, text):
+        """Record the model's response content."""
+        self._entries.append(_Entry("model", text))
+
+    def add_result(self, name, args, result):
+        """Record the result of a function call."""
+        self._entries.append(_Entry("user", f"Function result: {result}", call=(name, dict(args or {}))))
+
+    def _digest(self, entry):
+        if entry.digest is None:
+            name, args = entry.call
+            text = entry.text
+            first_line = text[len("Function result: "):].split("\n", 1)[0][:120]
+            sha = hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()[:12]
+            entry.digest = (
+                f"Function result: [compacted] {_describe_call(name, args)} returned {len(text)} characters "
+                f"(sha1 {sha}), starting with: {first_line!r}. Call the function again if you need the full output."
+            )
+        return entry.digest
+
+    def messages(self):
+        """
+        Build the message list for the next model request.
+
+        Returns:
+            list: Messages in the {"role": ..., "parts": [...]} format used by genai
+        """
+        result_indexes = [i for i, entry in enumerate(self._entries) if entry.call is not None]
+        recent = set(result_indexes[-self.keep_recent_results:]) if self.keep_recent_results > 0 else set()
+
+        texts = []
+        for i, entry in enumerate(self._entries):
+            if entry.call is not None and i not in recent and len(entry.text) > self.compact_min_chars:
+                texts.append(self._digest(entry))
+            else:
+                texts.append(entry.text)
+
+        # Still over budget: drop the oldest steps after the prompt, keeping the
+        # latest results and at least the last model turn
+        total = sum(len(text) for text in texts)
+        first_kept = 1
+        last_droppable = min([len(texts) - 1] + [i for i in recent])
+        while total + len(_omitted(first_kept)) > self.max_chars and first_kept < last_droppable:
+            total -= len(texts[first_kept])
+            first_kept += 1
+        marker = _omitted(first_kept)
+
+        # The latest results alone can exceed the budget: digest them, largest first,
+        # then cut the longest texts
+        excess = total + len(marker) - self.max_chars
+        kept_results = [i for i in recent if i >= first_kept]
+        for i in sorted(kept_results, key=lambda i: -len(texts[i])):
+            if excess <= 0:
+                break
+            digest = self._digest(self._entries[i])
+            if len(digest) < len(texts[i]):
+                excess -= len(texts[i]) - len(digest)
+                texts[i] = digest
+        for i in sorted(range(first_kept, len(texts)), key=lambda i: -len(texts[i])):
+            if excess <= 0:
+                break
+            length = len(texts[i])
+            texts[i] = _truncate(texts[i], length - excess)
+            excess -= length - len(texts[i])
+
+        messages = [{"role": self._entries[0].role, "parts": [texts[0]]}]
+        if marker:
+            messages.append({"role": "user", "parts": [marker]})
+        for i in range(first_kept, len(texts)):
+            messages.append({"role": self._entries[i].role, "parts": [texts[i]]})
+        return messages
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,209 @@
+"""
+JSON-RPC 2.0 server over stdio, used to keep one warm assistant process per editor workspace
+
+Messages are newline-delimited JSON objects (or arrays, for batches). Requests run
+concurrently on a thread pool; "$/cancelRequest" with {"id": ...} cancels a pending
+request, which then completes with error code -32800.
+"""
+
+import inspect
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+REQUEST_CANCELLED = -32800
+
+
+class JsonRpcServer:
+    """
+    Serves the public methods of a target object over JSON-RPC.
+
+    Args:
+        target: Object whose methods are exposed
+        methods (iterable): Names of the methods clients may call
+        max_workers (int): Number of requests executed concurrently
+        param_errors (tuple): Exception types a method raises for arguments it rejects,
+            reported as invalid params like arguments that do not fit its signature
+    """
+
+    def __init__(self, target, methods, max_workers=4, param_errors=()):
+        self.target = target
+        self.methods = set(methods)
+        self.param_errors = tuple(param_errors)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._cancelled = set()
+        self._pending_lock = threading.Lock()
+        self._output = None
+        self._shutdown = False
+        self._batch_threads = []
+
+    def _write(self, message):
+        data = json.dumps(message) + "\n"
+        with self._write_lock:
+            self._output.write(data)
+            self._output.flush()
+
+    @staticmethod
+    def _error(request_id, code, message):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+    def _execute(self, request_id, method, params):
+        """Run one request and build its response."""
+        try:
+            with self._pending_lock:
+                if request_id in self._cancelled:
+                    return self._error(request_id, REQUEST_CANCELLED, "Request cancelled")
+            func = getattr(self.target, method)
+            args, kwargs = (params, {}) if isinstance(params, list) else ((), params or {})
+            # Only arguments that do not fit the signature are invalid params; a
+            # TypeError raised inside the method is an internal error
+            try:
+                inspect.signature(func).bind(*args, **kwargs)
+            except TypeError as e:
+                return self._error(request_id, INVALID_PARAMS, f"Invalid params: {e}")
+            try:
+                result = func(*args, **kwargs)
+            except self.param_errors as e:
+                return self._error(request_id, INVALID_PARAMS, f"Invalid params: {e}")
+            except Exception as e:
+                return self._error(request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+            with self._pending_lock:
+                # A request cancelled while running still completes, but its result is dropped
+                if request_id in self._cancelled:
+                    return self._error(request_id, REQUEST_CANCELLED, "Request cancelled")
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+                self._cancelled.discard(request_id)
+
+    def _submit(self, message):
+        """
+        Validate a request and start it.
+
+        Returns:
+            Future or dict: The future of the response, an immediate response, or None
+        """
+        if not isinstance(message, dict) or message.get("jsonrpc") != "2.0" or not isinstance(message.get("method"), str):
+            return self._error(message.get("id") if isinstance(message, dict) else None, INVALID_REQUEST, "Invalid request")
+
+        method = message["method"]
+        params = message.get("params")
+        request_id = message.get("id")
+        is_notification = "id" not in message
+
+        if method == "$/cancelRequest":
+            self.cancel((params or {}).get("id"))
+            return None
+        if method in ("shutdown", "exit"):
+            self._shutdown = True
+            return None if is_notification else {"jsonrpc": "2.0", "id": request_id, "result": None}
+        if method not in self.methods:
+            return None if is_notification else self._error(request_id, METHOD_NOT_FOUND, f"Method not found: {method}")
+        if params is not None and not isinstance(params, (list, dict)):
+            return None if is_notification else self._error(request_id, INVALID_PARAMS, "params must be an array or object")
+
+        if is_notification:
+            self._executor.submit(self._execute, request_id, method, params)
+            return None
+        # Register before the request can finish, so _execute always finds its entry
+        with self._pending_lock:
+            future = self._executor.submit(self._execute, request_id, method, params)
+            self._pending[request_id] = future
+        return future
+
+    def cancel(self, request_id):
+        """Cancel a pending request; requests already running have their result dropped."""
+        with self._pending_lock:
+            future = self._pending.get(request_id)
+            if future is None:
+                return
+            self._cancelled.add(request_id)
+        if future.cancel():
+            # Never started, so _execute will not send the response
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+                self._cancelled.discard(request_id)
+            self._write(self._error(request_id, REQUEST_CANCELLED, "Request cancelled"))
+
+    def _handle_single(self, message):
+        outcome = self._submit(message)
+        if outcome is None:
+            return
+        if isinstance(outcome, dict):
+            self._write(outcome)
+            return
+
+        def send(future):
+            if not future.cancelled():
+                self._write(future.result())
+
+        outcome.add_done_callback(send)
+
+    def _handle_batch(self, messages):
+        if not messages:
+            self._write(self._error(None, INVALID_REQUEST, "Empty batch"))
+            return
+        outcomes = [self._submit(message) for message in messages]
+
+        def send_batch():
+            responses = []
+            for outcome in outcomes:
+                if outcome is None:
+                    continue
+                if isinstance(outcome, dict):
+                    responses.append(outcome)
+                elif not outcome.cancelled():
+                    responses.append(outcome.result())
+            if responses:
+                self._write(responses)
+
+        # The batch response is sent once every request in it has finished
+        thread = threading.Thread(target=send_batch, daemon=True)
+        self._batch_threads.append(thread)
+        thread.start()
+
+    def handle_line(self, line):
+        """Handle one line of input (a request, notification or batch)."""
+        line = line.strip()
+        if not line:
+            return
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            self._write(self._error(None, PARSE_ERROR, f"Parse error: {e}"))
+            return
+        if isinstance(message, list):
+            self._handle_batch(message)
+        else:
+            self._handle_single(message)
+
+    def serve(self, input_stream=None, output_stream=None):
+        """
+        Serve requests until the input is closed or a shutdown request arrives.
+
+        Anything the target prints goes to stderr so it cannot corrupt the protocol.
+        """
+        input_stream = input_stream or sys.stdin
+        self._output = output_stream or sys.stdout
+        saved_stdout = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            for line in input_stream:
+                self.handle_line(line)
+                if self._shutdown:
+                    break
+        finally:
+            self._executor.shutdown(wait=True)
+            for thread in self._batch_threads:
+                thread.join()
+            sys.stdout = saved_stdout
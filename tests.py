@@ -4,10 +4,37 @@ Test suite for the Coding Assistant project
 """
 
 import unittest
+from unittest import mock
+import asyncio
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
 import os
+import subprocess
 import sys
+import tempfile
+import time
+from types import MappingProxyType, SimpleNamespace
 from functions.get_files_info import get_files_info
 from functions.get_file_content import get_file_content
+from functions import registry
+from functions.scheduler import execute_function_calls
+from functions.tool_cache import result_cache
+from functions.metrics import MetricsRecorder
+from functions.workspace_index import WorkspaceIndex
+from functions.trigram_index import TrigramIndex, required_literals
+from functions.code_complexity import code_complexity
+from functions.ast_cache import ast_cache
+from functions.subprocess_runner import run_command
+from functions.impact import record_green_run, run_impacted, start_green_run
+from functions.sharding import DurationHistory, plan_shards, run_sharded
+from history import ConversationHistory
+from agent import run_agent
+from agent_async import run_agent_async
+from transport import ScriptedTransport, RecordingTransport, ReplayTransport, StubFunctionCall, StubPart, StubResponse
+from rpc_server import JsonRpcServer
 
 class TestCodingAssistant(unittest.TestCase):
     
@@ -19,6 +46,30 @@ class TestCodingAssistant(unittest.TestCase):
         # Check that it contains file information (using a more generic check)
         self.assertIn("file_size", result)
         
+    def test_get_files_info_recursive(self):
+        """Test recursive listing with .gitignore, include patterns, tree output and pagination"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for path in ("a/b/c.py", "a/d.txt", "a/e.log", "build/x.o", "z.py"):
+                os.makedirs(os.path.join(tmp, os.path.dirname(path)), exist_ok=True)
+                with open(os.path.join(tmp, path), "w") as f:
+                    f.write("x")
+            with open(os.path.join(tmp, ".gitignore"), "w") as f:
+                f.write("build/\n*.log\n")
+
+            result = get_files_info(tmp, ".", recursive=True, include=["*.py"], tree=True)
+            self.assertEqual(result, "a/\n  b/\n    c.py\nz.py")
+            first = get_files_info(tmp, ".", recursive=True, page_size=3)
+            self.assertIn('continue with cursor="a/b"', first)
+            second = get_files_info(tmp, ".", recursive=True, page_size=3, cursor="a/b")
+            self.assertEqual([line.split(":")[0] for line in second.splitlines()], ["- a/b/c.py", "- a/d.txt", "- z.py"])
+
+            # Directories without included files are pruned, also below max_depth
+            os.makedirs(os.path.join(tmp, "docs", "deep"))
+            with open(os.path.join(tmp, "docs", "deep", "f.txt"), "w") as f:
+                f.write("x")
+            result = get_files_info(tmp, ".", max_depth=1, include=["*.py"], tree=True)
+            self.assertEqual(result, "a/\nz.py")
+
     def test_get_file_content(self):
         """Test that get_file_content can read a file"""
         # Test reading this test file
@@ -26,5 +77,642 @@ class TestCodingAssistant(unittest.TestCase):
         self.assertIsInstance(result, str)
         self.assertIn("Test suite", result)
 
+    def test_get_file_content_ranges(self):
+        """Test line, around-line and byte range reads"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "big.log"), "w") as f:
+                f.writelines(f"line {i}\n" for i in range(1, 5001))
+
+            result = get_file_content(tmp, "big.log", start_line=4999)
+            self.assertEqual(result, 'Lines 4999-5000 of "big.log" (5000 lines):\nline 4999\nline 5000\n')
+            result = get_file_content(tmp, "big.log", around_line=100, context=1)
+            self.assertTrue(result.endswith("line 99\nline 100\nline 101\n"))
+            result = get_file_content(tmp, "big.log", offset=7, length=14)
+            self.assertTrue(result.endswith("\nline 2\nline 3\n"))
+            self.assertIn("continue with start_line=", get_file_content(tmp, "big.log", start_line=1))
+            self.assertTrue(get_file_content(tmp, "big.log", start_line=6000).startswith("Error:"))
+            open(os.path.join(tmp, "empty.txt"), "w").close()
+            self.assertEqual(get_file_content(tmp, "empty.txt", start_line=1), 'No lines in "empty.txt" (0 lines)')
+
+    def test_regex_search_directory(self):
+        """Test searching a directory with include globs, context lines and a match cap"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("a.py", "b.py", "c.txt"):
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write("x = 1\nneedle = 2\ny = 3\nneedle = 4\n")
+
+            result = registry.dispatch("regex_search", {"file_path": ".", "pattern": "^needle", "include": ["*.py"],
+                                                        "context": 1, "max_matches": 3}, tmp)
+            self.assertTrue(result.startswith('Found 3 match(es) for pattern "^needle" in 2 file(s) under ".":'))
+            self.assertIn("a.py:\n  Line 1- x = 1\n  Line 2: needle = 2\n  Line 3- y = 3\n  Line 4: needle = 4\nb.py:", result)
+            self.assertNotIn("c.txt", result)
+            self.assertIn("Stopped after 3 matches", result)
+
+            # Mapped ASCII files and files read as text (CRLF, non-ASCII) give the same lines
+            with open(os.path.join(tmp, "d.txt"), "wb") as f:
+                f.write("x = 1\r\nneedle = 2\r\n".encode() + "é = 3\nneedle = 4\n".encode("utf-8"))
+            result = registry.dispatch("regex_search", {"file_path": ".", "pattern": "needle", "include": ["*.txt"],
+                                                        "context": 1}, tmp)
+            self.assertIn("c.txt:\n  Line 1- x = 1\n  Line 2: needle = 2\n  Line 3- y = 3\n  Line 4: needle = 4\n"
+                          "d.txt:\n  Line 1- x = 1\n  Line 2: needle = 2\n  Line 3- é = 3\n  Line 4: needle = 4", result)
+
+    def test_trigram_index_candidates(self):
+        """Test literal extraction and candidate narrowing with the trigram index"""
+        self.assertEqual(required_literals(r"def helper_\d+\("), [{b"def helper_"}])
+        self.assertEqual(required_literals(r"(?i)Foo|barbaz"), [{b"foo", b"barbaz"}])
+        self.assertEqual(required_literals(r"a.*b"), [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, content in (("a.py", "def helper_1(): pass\n"), ("b.py", "FOO = 1\n"), ("c.py", "x = 2\n")):
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(content)
+            index = TrigramIndex(tmp, cache_dir=None)
+            files = [(name, os.path.join(tmp, name), None) for name in ("a.py", "b.py", "c.py")]
+            index.update(files)
+            self.assertEqual(index.candidates(required_literals(r"def helper_\d")), {"a.py"})
+            self.assertEqual(index.candidates(required_literals(r"(?i)foo|helper")), {"a.py", "b.py"})
+
+            with open(os.path.join(tmp, "c.py"), "w") as f:
+                f.write("def helper_2(): pass\n")
+            index.update(files)
+            self.assertEqual(index.candidates(required_literals(r"helper")), {"a.py", "c.py"})
+
+    def test_find_duplicates_maximal_runs(self):
+        """Test that a long duplicate is reported once, as its maximal run"""
+        with tempfile.TemporaryDirectory() as tmp:
+            block = [f"value_{i} = {i}\n" for i in range(40)]
+            with open(os.path.join(tmp, "dup.py"), "w") as f:
+                f.writelines(block + ["other()\n"] * 2 + block)
+
+            result = registry.dispatch("find_duplicates", {"file_path": "dup.py"}, tmp)
+            self.assertTrue(result.startswith("Found 1 duplicate code blocks"))
+            self.assertIn("Lines 1-40 and 43-82", result)
+
+    def test_find_clones_across_files(self):
+        """Test that copies differing in names, literals and layout are grouped into one clone class"""
+        original = (
+            "def total(items, rate):\n"
+            "    result = {}\n"
+            "    for key, value in items.items():\n"
+            "        if value is None or key.startswith('_'):\n"
+            "            continue\n"
+            "        result[key] = round(value * rate, 2)\n"
+            "    return sorted(result.items(), key=lambda item: item[1])\n"
+        )
+        renamed = original.replace("items, rate", "rows,  factor").replace("'_'", "'#'").replace(", 2)", ", 4)")
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, content in (("a.py", original), ("b.py", "# copy\n\n" + renamed), ("c.py", "x = 1\n")):
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(content)
+
+            result = registry.dispatch("find_clones", {"directory": ".", "min_tokens": 30}, tmp)
+            self.assertTrue(result.startswith('Found 1 clone class(es) of 30+ tokens in 3 file(s) under ".":'))
+            self.assertIn("a.py:1-7", result)
+            self.assertIn("b.py:3-9", result)
+            self.assertNotIn("c.py", result)
+
+    def test_code_complexity_per_function(self):
+        """Test AST-based per-function metrics that ignore keywords in strings and comments"""
+        source = (
+            "def check(x):\n"
+            "    \"\"\"if x and y or z while for\"\"\"\n"
+            "    if x and x > 1:  # or while\n"
+            "        for i in range(x):\n"
+            "            if i:\n"
+            "                return i\n"
+            "    return 0\n"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "check.py"), "w") as f:
+                f.write(source)
+
+            result = code_complexity(tmp, "check.py")
+            self.assertIn("Cyclomatic complexity: 5", result)
+            self.assertIn("function check (lines 1-7): cyclomatic 5, cognitive 7, nesting 3, 7 lines", result)
+            self.assertIs(ast_cache.parse(source), ast_cache.parse(source))
+
+    def test_directory_metrics(self):
+        """Test the directory mode of code_complexity and count_lines, including reuse after a change"""
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "pkg"))
+            with open(os.path.join(tmp, "main.py"), "w") as f:
+                f.write("# entry\ndef main(x):\n    if x:\n        return 1\n    return 0\n")
+            with open(os.path.join(tmp, "pkg", "util.py"), "w") as f:
+                f.write("def helper():\n    return 2\n")
+
+            result = registry.dispatch("code_complexity", {"file_path": ".", "top_n": 1}, tmp)
+            self.assertIn("(2 Python files)", result)
+            self.assertIn("main.py: function main (lines 2-5): cyclomatic 2", result)
+            self.assertIn("... and 1 more functions", result)
+            self.assertIn("./: cyclomatic 2, 1 functions, 6 lines in 1 files\n  ... and 1 more packages", result)
+
+            result = registry.dispatch("count_lines", {"file_path": "."}, tmp)
+            self.assertIn("Line count for '.' (2 files):\n  Total lines: 7\n", result)
+            self.assertIn("main.py: 4 code, 1 comment, 5 total", result)
+
+            with open(os.path.join(tmp, "pkg", "util.py"), "a") as f:
+                f.write("\n\ndef other(y):\n    return y or 3\n")
+            result = registry.dispatch("count_lines", {"file_path": "pkg"}, tmp)
+            self.assertIn("Total lines: 6\n", result)
+            result = registry.dispatch("code_complexity", {"file_path": "pkg"}, tmp)
+            self.assertIn("Functions: 2\n", result)
+
+    def test_count_lines_comment_syntax(self):
+        """Test per-language comment syntax, chunk boundaries and files that are not valid UTF-8"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "app.js"), "wb") as f:
+                f.write(b"// header\n/* block\n   end */\ncall(); /* open\nclose */\n\nx = 1; // note\n")
+            with open(os.path.join(tmp, "latin.txt"), "wb") as f:
+                f.write(b"caf\xe9\n# note\n\n" * 1000)
+
+            result = registry.dispatch("count_lines", {"file_path": "app.js"}, tmp)
+            self.assertIn("Total lines: 7\n  Non-empty lines: 6\n  Comment lines: 4\n  Code lines: 2\n", result)
+            with mock.patch("functions.count_lines.COUNT_CHUNK_BYTES", 7):
+                result = registry.dispatch("count_lines", {"file_path": "latin.txt"}, tmp)
+            self.assertIn("Total lines: 3000\n  Non-empty lines: 2000\n  Comment lines: 1000\n", result)
+
+            # Lines longer than a chunk keep their comment state across chunks
+            with open(os.path.join(tmp, "long.js"), "wb") as f:
+                f.write(b"/* " + b"c" * 50 + b" */ /*\n" + b"x */ y(); /" * 20 + b"/ z\n" + b"  " * 30 + b"// c */ d\n")
+            with mock.patch("functions.count_lines.COUNT_CHUNK_BYTES", 7):
+                result = registry.dispatch("count_lines", {"file_path": "long.js"}, tmp)
+            self.assertIn("Total lines: 3\n  Non-empty lines: 3\n  Comment lines: 2\n  Code lines: 1\n", result)
+
+    def test_run_python_file_fork_server(self):
+        """Test that runs forked from the pre-initialized interpreter match a new interpreter"""
+        scripts = {
+            "args.py": "import os, sys\nprint(sys.argv[1:], os.getcwd())\nprint('warning', file=sys.stderr)\n",
+            "fails.py": "def f():\n    return 1 / 0\nprint('before')\nf()\n",
+            "exits.py": "import sys\nsys.exit('bad input')\n",
+            # Shadows the json module the zygote has preloaded
+            "json.py": "VALUE = 'local json'\n",
+            "shadow.py": "import json\nprint(json.VALUE)\n",
+            "threads.py": "import threading, time\n"
+                          "def work():\n    time.sleep(0.2)\n    print('thread done')\n"
+                          "threading.Thread(target=work).start()\n",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, source in scripts.items():
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(source)
+            results = {}
+            for name in scripts:
+                args = {"file_path": name, "args": ["a", "b c"]}
+                with mock.patch("functions.run_python_file.FORK_SERVER", False):
+                    cold = registry.dispatch("run_python_file", args, tmp)
+                with mock.patch("functions.run_python_file.FORK_SERVER", True):
+                    results[name] = registry.dispatch("run_python_file", args, tmp)
+                self.assertEqual(cold, results[name])
+            self.assertIn(f"STDOUT: ['a', 'b c'] {tmp}", results["args.py"])
+            self.assertIn('fails.py", line 2, in f\n', results["fails.py"])
+            self.assertNotIn("runpy", results["fails.py"])
+            self.assertTrue(results["exits.py"].endswith("STDERR: bad input\n\nProcess exited with code 1"))
+            self.assertIn("STDOUT: local json", results["shadow.py"])
+            self.assertIn("STDOUT: thread done", results["threads.py"])
+
+    def test_bounded_output_capture(self):
+        """Test that long output keeps its head and tail and that progress callbacks see every byte"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "chatty.py"), "w") as f:
+                f.write("import sys\nfor i in range(100000):\n    print('line', i)\nsys.stderr.write('done\\n')\n")
+
+            result = registry.dispatch("run_python_file", {"file_path": "chatty.py"}, tmp)
+            self.assertLess(len(result), 100000)
+            self.assertTrue(result.startswith("STDOUT: line 0\nline 1\n"))
+            self.assertIn("bytes of output omitted ...]\nline ", result)
+            self.assertTrue(result.endswith("line 99999\n\nSTDERR: done\n"))
+
+            def on_output(name, data):
+                seen[name] += len(data)
+            for posix_pipes in (True, False):
+                seen = {"stdout": 0, "stderr": 0}
+                with mock.patch("functions.subprocess_runner.POSIX_PIPES", posix_pipes):
+                    completed = run_command([sys.executable, "chatty.py"], tmp, 30, on_output, head_bytes=10,
+                                            tail_bytes=16)
+                self.assertEqual(seen, {"stdout": sum(len(f"line {i}\n") for i in range(100000)), "stderr": 5})
+                self.assertEqual(completed.stdout.splitlines()[-1], "line 99999")
+                self.assertEqual(completed.returncode, 0)
+
+            # An exit status lost to another waiter is not reported as success
+            with mock.patch("os.wait4", side_effect=ChildProcessError):
+                completed = run_command([sys.executable, "-c", "pass"], tmp, 30)
+            self.assertEqual(completed.returncode, -1)
+            self.assertIn("exit status unknown", completed.stderr)
+
+    def test_sandboxed_run(self):
+        """Test that sandboxed runs hit the memory limit and report the resources they used"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "alloc.py"), "w") as f:
+                f.write("import sys\ndata = bytearray(int(sys.argv[1]) * 1024 * 1024)\nprint('allocated')\n")
+
+            for fork_server in (False, True):
+                with mock.patch("functions.run_python_file.SANDBOX", True), \
+                     mock.patch("functions.run_python_file.FORK_SERVER", fork_server), \
+                     mock.patch("functions.sandbox.SANDBOX_MEMORY_BYTES", 512 * 1024 * 1024):
+                    small = registry.dispatch("run_python_file", {"file_path": "alloc.py", "args": ["64"]}, tmp)
+                    large = registry.dispatch("run_python_file", {"file_path": "alloc.py", "args": ["1024"]}, tmp)
+                self.assertRegex(small, r"^STDOUT: allocated\n\nResources: wall [\d.]+s, user [\d.]+s, sys [\d.]+s, "
+                                        r"peak RSS [\d.]+ MB$")
+                self.assertGreater(float(small.rsplit("peak RSS ", 1)[1].split()[0]), 64)
+                self.assertIn("MemoryError\n\nProcess exited with code 1\nResources: ", large)
+
+            # A background child holding the pipes open does not keep the run waiting
+            with open(os.path.join(tmp, "spawn.py"), "w") as f:
+                f.write("import subprocess\nsubprocess.Popen(['sleep', '100'])\nprint('spawned')\n")
+            with mock.patch("functions.run_python_file.SANDBOX", True), \
+                 mock.patch("functions.run_python_file.FORK_SERVER", False):
+                start = time.monotonic()
+                result = registry.dispatch("run_python_file", {"file_path": "spawn.py"}, tmp)
+            self.assertTrue(result.startswith("STDOUT: spawned\n"), result)
+            self.assertLess(time.monotonic() - start, 10)
+
+    def test_sharded_test_run(self):
+        """Test duration-balanced shards and the merged results of a sharded unittest run"""
+        durations = DurationHistory(".", cache_dir=None)
+        durations.durations = {"a": 4.0, "b": 3.0, "c": 2.0, "d": 2.0, "e": 1.0}
+        self.assertEqual(plan_shards(["a", "b", "c", "d", "e", "new"], durations, 2), [["a", "c", "e"], ["b", "d", "new"]])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "tests"))
+            for i in range(3):
+                with open(os.path.join(tmp, "tests", f"test_m{i}.py"), "w") as f:
+                    f.write("import time, unittest\n"
+                            f"class T{i}(unittest.TestCase):\n"
+                            "    def test_ok(self): pass\n"
+                            f"    def test_value(self): self.assertEqual({i}, 1)\n"
+                            f"    def test_wait(self): time.sleep({i} * 2)\n")
+
+            result = run_sharded("tests", ["python", "-m", "unittest", "discover", "-s", "tests"], tmp, 2, 60,
+                                 test_timeout=1, cache_dir=None).output
+            self.assertIn("Command: python -m unittest discover -s tests (in 2 shards)\nExit code: 1\n", result)
+            self.assertIn("9 tests in ", result)
+            self.assertIn(": 5 passed, 2 failed, 2 timeout\n", result)
+            self.assertIn("FAILED: test_m2.T2.test_value", result)
+            self.assertIn("TIMEOUT: test_m2.T2.test_wait", result)
+            self.assertIn("AssertionError: 0 != 1", result)
+            # Workers exit with a failing status when one of their tests did not pass
+            self.assertIn(", exit code 1\n", result)
+
+            # Per-test timeouts are refused where SIGALRM is missing (Windows)
+            with mock.patch("functions.sharding.signal", SimpleNamespace()):
+                result = run_sharded("tests", ["python", "-m", "unittest", "discover", "-s", "tests"], tmp, 2, 60,
+                                     test_timeout=1, cache_dir=None).output
+            self.assertTrue(result.startswith("Error: test_timeout needs SIGALRM"))
+
+    @unittest.skipUnless(importlib.util.find_spec("pytest"), "pytest is not installed")
+    def test_sharded_pytest_run_below_rootdir(self):
+        """Test that shards find their pytest ids when the rootdir is above the directory the tests run in"""
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "tests"))
+            with open(os.path.join(tmp, "pytest.ini"), "w") as f:
+                f.write("[pytest]\n")
+            with open(os.path.join(tmp, "tests", "test_x.py"), "w") as f:
+                f.write("def test_one(): pass\ndef test_two(): pass\ndef test_three(): assert False\n")
+
+            result = run_sharded("tests", [sys.executable, "-m", "pytest"], os.path.join(tmp, "tests"), 2, 60,
+                                 cache_dir=None).output
+            self.assertIn(": 2 passed, 1 failed\n", result)
+            self.assertIn("FAILED: tests/test_x.py::test_three", result)
+
+    def test_changed_only_test_run(self):
+        """Test that changed_only runs the tests importing the files changed since the last green run"""
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as cache_dir:
+            sources = {
+                "pkg/__init__.py": "",
+                "tests/__init__.py": "",
+                "pkg/shapes.py": "def area(w, h): return w * h\n",
+                "pkg/money.py": "def cents(x): return round(x * 100)\n",
+                "tests/test_shapes.py": "import unittest\nfrom pkg.shapes import area\n"
+                                        "class Shapes(unittest.TestCase):\n"
+                                        "    def test_area(self): self.assertEqual(area(2, 3), 6)\n",
+                "tests/test_money.py": "import unittest\nfrom pkg import money\n"
+                                       "class Money(unittest.TestCase):\n"
+                                       "    def test_cents(self): self.assertEqual(money.cents(1.5), 150)\n",
+            }
+            for path, source in sources.items():
+                os.makedirs(os.path.join(tmp, os.path.dirname(path)), exist_ok=True)
+                with open(os.path.join(tmp, path), "w") as f:
+                    f.write(source)
+            cmd = ["python", "-m", "unittest", "discover", "-s", "tests", "-t", "."]
+
+            result = run_impacted("tests", cmd, tmp, tmp, 1, 60, cache_dir=cache_dir)
+            self.assertIn("no green run recorded yet; running every test", result)
+            self.assertIn(": 2 passed\n", result)
+
+            result = run_impacted("tests", cmd, tmp, tmp, 1, 60, cache_dir=cache_dir)
+            self.assertIn("no files changed since the last green run", result)
+
+            with open(os.path.join(tmp, "pkg", "money.py"), "w") as f:
+                f.write("def cents(x): return int(x * 100) + 1\n")
+            result = run_impacted("tests", cmd, tmp, tmp, 1, 60, cache_dir=cache_dir)
+            self.assertIn("selected 1 of 2 tests; 1 file(s) changed since the last green run: pkg/money.py", result)
+            self.assertIn("FAILED: tests.test_money.Money.test_cents", result)
+
+            # Still failing, so the change is still run against; a data file change runs everything
+            with open(os.path.join(tmp, "tests", "data.json"), "w") as f:
+                f.write("{}")
+            result = run_impacted("tests", cmd, tmp, tmp, 1, 60, cache_dir=cache_dir)
+            self.assertIn("tests/data.json changed since the last green run; running every test", result)
+            self.assertIn(": 1 passed, 1 failed\n", result)
+
+            # A full run records the files as they were when it started, for commands with changed_only runs only
+            self.assertIsNone(start_green_run(tmp, tmp, ["pytest"], cache_dir))
+            with open(os.path.join(tmp, "pkg", "money.py"), "w") as f:
+                f.write(sources["pkg/money.py"])
+            fingerprints = start_green_run(tmp, tmp, cmd, cache_dir)
+            with open(os.path.join(tmp, "pkg", "shapes.py"), "a") as f:
+                f.write("# edited while the tests ran\n")
+            record_green_run(tmp, tmp, cmd, fingerprints, cache_dir)
+            result = run_impacted("tests", cmd, tmp, tmp, 1, 60, cache_dir=cache_dir)
+            self.assertIn("selected 1 of 2 tests; 1 file(s) changed since the last green run: pkg/shapes.py", result)
+
+    def test_workspace_index(self):
+        """Test that the workspace index follows file changes with and without inotify"""
+        for watch in (True, False):
+            with tempfile.TemporaryDirectory() as tmp:
+                for path in ("a/b.py", "c.txt", "skip.log", "build/gen/out.py"):
+                    os.makedirs(os.path.join(tmp, os.path.dirname(path)), exist_ok=True)
+                    with open(os.path.join(tmp, path), "w") as f:
+                        f.write("one\ntwo")
+                with open(os.path.join(tmp, ".gitignore"), "w") as f:
+                    f.write("*.log\nbuild/\n")
+
+                index = WorkspaceIndex(tmp, cache_dir=None, watch=watch).build()
+                record = index.lookup("a/b.py")
+                self.assertEqual((record.language, record.lines, record.size), ("python", 2, 7))
+                self.assertIsNone(index.lookup("skip.log"))
+                self.assertIsNone(index.lookup("build/gen/out.py"))
+
+                with open(os.path.join(tmp, "a", "b.py"), "w") as f:
+                    f.write("one\n")
+                os.remove(os.path.join(tmp, "c.txt"))
+                self.assertEqual(index.lookup("a/b.py").lines, 1)
+                self.assertIsNone(index.lookup("c.txt"))
+
+                if index.live:
+                    # A same-size rewrite within one mtime tick is still seen from its event
+                    path = os.path.join(tmp, "a", "b.py")
+                    before = os.stat(path)
+                    with open(path, "w") as f:
+                        f.write("two\n")
+                    os.utime(path, ns=(before.st_atime_ns, before.st_mtime_ns))
+                    self.assertEqual(index.lookup("a/b.py").sha1, hashlib.sha1(b"two\n").hexdigest())
+                index.close()
+
+    def test_registry_dispatch(self):
+        """Test that the registry binds arguments from the schema and dispatches"""
+        result = registry.dispatch("get_file_content", {"file_path": "tests.py"}, ".")
+        self.assertIn("Test suite", result)
+        # Numbers arrive from the LLM as floats and are coerced to the schema type
+        kwargs = registry.TOOLS["git_log"].bind({"max_commits": 3.0})
+        self.assertEqual(kwargs, {"max_commits": 3})
+        # A custom lint command may rewrite the files it lints
+        lint = registry.TOOLS["lint_code"]
+        self.assertTrue(lint.is_read_only({"file_path": "a.py"}))
+        self.assertFalse(lint.is_read_only({"file_path": "a.py", "lint_command": "black a.py"}))
+
+    def test_registry_rejects_bad_calls(self):
+        """Test that unknown tools and missing arguments return error messages"""
+        self.assertTrue(registry.dispatch("no_such_tool", {}, ".").startswith("Error:"))
+        self.assertIn("Missing required", registry.dispatch("get_file_content", {}, "."))
+        self.assertIn("Unknown argument", registry.dispatch("get_files_info", {"path": "."}, "."))
+
+    def test_execute_function_calls_keeps_order(self):
+        """Test that concurrent execution returns results in call order and orders writes before reads"""
+        with tempfile.TemporaryDirectory() as tmp:
+            calls = [
+                ("write_file", {"file_path": "a.txt", "content": "first"}),
+                ("get_file_content", {"file_path": "a.txt"}),
+                ("write_file", {"file_path": "a.txt", "content": "second"}),
+                ("get_file_content", {"file_path": "a.txt"}),
+                ("get_files_info", {}),
+            ]
+            results = execute_function_calls(calls, tmp)
+            self.assertTrue(results[0].startswith("Successfully wrote"))
+            self.assertEqual(results[1], "first")
+            self.assertEqual(results[3], "second")
+            self.assertIn("a.txt", results[4])
+
+    def test_tool_result_cache(self):
+        """Test that repeated reads are cached and writes invalidate them"""
+        with tempfile.TemporaryDirectory() as tmp:
+            registry.dispatch("write_file", {"file_path": "a.py", "content": "x = 1\n"}, tmp)
+            hits = result_cache.hits
+            first = registry.dispatch("count_lines", {"file_path": "a.py"}, tmp)
+            self.assertEqual(registry.dispatch("count_lines", {"file_path": "a.py"}, tmp), first)
+            self.assertEqual(result_cache.hits, hits + 1)
+            registry.dispatch("write_file", {"file_path": "a.py", "content": "x = 1\ny = 2\n"}, tmp)
+            self.assertIn("Total lines: 2", registry.dispatch("count_lines", {"file_path": "a.py"}, tmp))
+
+    def test_metrics_recorder(self):
+        """Test that spans record timings, subprocess spawns and export to both formats"""
+        metrics = MetricsRecorder()
+        with metrics.span("tool", tool="noop"):
+            pass
+        self.assertEqual(metrics.records, [])
+        metrics.enable()
+        with metrics.span("tool", tool="git_log") as record:
+            subprocess.run([sys.executable, "-c", "pass"])
+            record["result_bytes"] = 10
+        self.assertEqual(metrics.records[0]["subprocesses"], 1)
+        self.assertGreaterEqual(metrics.records[0]["wall_s"], 0)
+        self.assertIn('agent_tool_total{tool="git_log"} 1', metrics.to_prometheus())
+        self.assertIn('"result_bytes": 10', metrics.to_json_lines())
+
+    def test_history_compacts_old_results(self):
+        """Test that old large results are digested and the payload stays within budget"""
+        history = ConversationHistory("prompt", max_chars=5000, keep_recent_results=1)
+        for i in range(20):
+            history.add_model(f"call {i}")
+            history.add_result("get_file_content", {"file_path": f"f{i}.py"}, "x" * 2000)
+        messages = history.messages()
+        texts = [part for message in messages for part in message["parts"]]
+        self.assertEqual(texts[0], "prompt")
+        self.assertEqual(texts[-1], "Function result: " + "x" * 2000)
+        self.assertIn("[compacted] get_file_content(file_path='f18.py')", texts[-3])
+        self.assertLessEqual(sum(len(text) for text in texts), 5000)
+
+    def test_history_bounds_recent_results(self):
+        """Test that the payload stays within max_chars when the latest results alone exceed it"""
+        history = ConversationHistory("prompt", max_chars=3000, keep_recent_results=4)
+        for i in range(6):
+            history.add_model(f"call {i}")
+            history.add_result("get_file_content", {"file_path": f"f{i}.py"}, "x" * (1000 * (i + 1)))
+        texts = [part for message in history.messages() for part in message["parts"]]
+        self.assertLessEqual(sum(len(text) for text in texts), 3000)
+        self.assertEqual(texts[0], "prompt")
+        self.assertIn("[compacted] get_file_content(file_path='f5.py')", "".join(texts))
+
+        history = ConversationHistory("prompt", max_chars=300, keep_recent_results=1)
+        history.add_model("call " + "y" * 1000)
+        history.add_result("get_file_content", {"file_path": "f.py"}, "x" * 5000)
+        texts = [part for message in history.messages() for part in message["parts"]]
+        self.assertLessEqual(sum(len(text) for text in texts), 300)
+
+    def test_agent_loop_with_scripted_transport(self):
+        """Test that the agent loop runs offline against a scripted model and replays recordings"""
+        # Shaped like a live proto response: replayed stubs must render the same in the history
+        call = SimpleNamespace(name="get_file_content", args=MappingProxyType({"file_path": "tests.py"}))
+        live = SimpleNamespace(text="", candidates=[
+            SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text="", function_call=call)]))])
+        script = [live, "All done"]
+        with tempfile.TemporaryDirectory() as tmp:
+            recording = os.path.join(tmp, "session.jsonl")
+            model = RecordingTransport(ScriptedTransport(script), recording)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                history = run_agent(model, "read the tests", working_directory=".")
+            self.assertIn("Final response:\nAll done", out.getvalue())
+            self.assertIn("Test suite", history.messages()[2]["parts"][0])
+            self.assertEqual(history.messages()[1]["parts"][0], 'function_call: get_file_content {"file_path": "tests.py"}')
+
+            replay = ReplayTransport(recording, strict=True)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                run_agent(replay, "read the tests", working_directory=".")
+            self.assertIn("Final response:\nAll done", out.getvalue())
+
+
+    def test_async_agent_loop_schedules_streamed_calls(self):
+        """Test that streamed calls overlap unless they conflict, with results in submission order"""
+        spans = []
+        tools = [registry.TOOLS["write_file"], registry.TOOLS["get_file_content"]]
+        originals = [tool.func for tool in tools]
+
+        def slow(func):
+            def wrapper(working_directory, **kwargs):
+                start = time.perf_counter()
+                time.sleep(0.2)
+                result = func(working_directory, **kwargs)
+                spans.append((func.__name__, kwargs["file_path"], start, time.perf_counter()))
+                return result
+            return wrapper
+
+        script = [
+            {"function_calls": [
+                {"name": "write_file", "args": {"file_path": "a.txt", "content": "first"}},
+                {"name": "get_file_content", "args": {"file_path": "a.txt"}},
+                {"name": "get_file_content", "args": {"file_path": "b.txt"}},
+                {"name": "get_file_content", "args": {"file_path": "c.txt"}},
+            ]},
+            "Done",
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("b.txt", "c.txt"):
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(name)
+            try:
+                for tool, func in zip(tools, originals):
+                    tool.func = slow(func)
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    history = asyncio.run(run_agent_async(ScriptedTransport(script), "edit", working_directory=tmp))
+            finally:
+                for tool, func in zip(tools, originals):
+                    tool.func = func
+
+        self.assertIn("Final response:\nDone", out.getvalue())
+        texts = [message["parts"][0] for message in history.messages()]
+        self.assertTrue(texts[2].startswith("Function result: Successfully wrote"))
+        self.assertEqual(texts[3:6], ["Function result: first", "Function result: b.txt", "Function result: c.txt"])
+
+        spans = {(name, path): (start, end) for name, path, start, end in spans}
+        # The read of a.txt waits for the write; reads of other files run alongside it
+        self.assertGreaterEqual(spans["get_file_content", "a.txt"][0], spans["write_file", "a.txt"][1])
+        for first, second in ((("write_file", "a.txt"), ("get_file_content", "b.txt")),
+                              (("get_file_content", "b.txt"), ("get_file_content", "c.txt"))):
+            self.assertLess(spans[first][0], spans[second][1])
+            self.assertLess(spans[second][0], spans[first][1])
+
+    def test_async_agent_loop_settles_calls_on_stream_error(self):
+        """Test that a stream failing midway waits for started calls and cancels the rest"""
+        write_file = registry.TOOLS["write_file"]
+        original = write_file.func
+
+        def slow(working_directory, **kwargs):
+            time.sleep(0.2)
+            return original(working_directory, **kwargs)
+
+        class FailingResponse(StubResponse):
+            async def __aiter__(self):
+                async for chunk in super().__aiter__():
+                    yield chunk
+                # Let the first call start before the stream fails
+                await asyncio.sleep(0.05)
+                raise RuntimeError("429 Resource exhausted")
+
+        calls = [StubPart(function_call=StubFunctionCall("write_file", {"file_path": "a.txt", "content": content}))
+                 for content in ("first", "second")]
+
+        async def run(tmp):
+            await run_agent_async(ScriptedTransport([FailingResponse(calls)]), "edit", working_directory=tmp)
+            # Nothing is left running once the loop has returned
+            with open(os.path.join(tmp, "a.txt")) as f:
+                written = f.read()
+            await asyncio.sleep(0.4)
+            return written
+
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                write_file.func = slow
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    written = asyncio.run(run(tmp))
+            finally:
+                write_file.func = original
+            with open(os.path.join(tmp, "a.txt")) as f:
+                self.assertEqual((written, f.read()), ("first", "first"))
+        self.assertIn("rate limit exceeded", out.getvalue())
+
+    def test_json_rpc_server(self):
+        """Test requests, batches, errors and notifications over the JSON-RPC server"""
+        class Target:
+            def read_file(self, file_path):
+                return get_file_content(".", file_path)
+
+            def broken(self):
+                return len(None)
+
+        requests = [
+            {"jsonrpc": "2.0", "id": 1, "method": "read_file", "params": {"file_path": "tests.py"}},
+            [
+                {"jsonrpc": "2.0", "id": 2, "method": "read_file", "params": ["missing.py"]},
+                {"jsonrpc": "2.0", "id": 3, "method": "delete_everything"},
+                {"jsonrpc": "2.0", "method": "read_file", "params": ["tests.py"]},
+            ],
+            {"jsonrpc": "2.0", "id": 4, "method": "read_file", "params": {"wrong": 1}},
+            {"jsonrpc": "2.0", "id": 5, "method": "broken"},
+        ]
+        output = io.StringIO()
+        server = JsonRpcServer(Target(), ["read_file", "broken"])
+        server.serve(io.StringIO("\n".join(json.dumps(r) for r in requests) + "\nnot json\n"), output)
+
+        responses = {}
+        for line in output.getvalue().splitlines():
+            message = json.loads(line)
+            for response in message if isinstance(message, list) else [message]:
+                responses[response["id"]] = response
+        self.assertIn("Test suite", responses[1]["result"])
+        self.assertIn("File not found", responses[2]["result"])
+        self.assertEqual(responses[3]["error"]["code"], -32601)
+        self.assertEqual(responses[4]["error"]["code"], -32602)
+        # A TypeError raised inside the method is not a params error
+        self.assertEqual(responses[5]["error"]["code"], -32603)
+        self.assertEqual(responses[None]["error"]["code"], -32700)
+        self.assertEqual(len(responses), 6)
+
+        # Arguments are converted to the tool's schema types, as for command-line strings
+        from api_wrapper import CodingAssistantAPI
+        api = CodingAssistantAPI(".", transport=ScriptedTransport(["unused"]))
+        self.assertIn("of 4+ lines", api.find_duplicates("tests.py", "4"))
+
+    def test_entry_points_import_lazily(self):
+        """Test that importing the entry points loads neither the SDK nor the tool modules"""
+        code = (
+            "import sys, main, api_wrapper; "
+            "print(sorted(m for m in sys.modules if m.startswith(('google', 'dotenv', 'functions.get_', 'functions.git_'))))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
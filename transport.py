@@ -0,0 +1,255 @@
+"""
+Model transports: record, replay or script the model side of the agent loop
+
+Every transport exposes generate_content(messages) and
+generate_content_async(messages, stream=False) like genai.GenerativeModel, so the
+agent loops can run against any of them unchanged.
+"""
+
+import json
+import threading
+import time
+from collections.abc import Mapping, Sequence
+
+
+class ReplayError(Exception):
+    """Raised when a replayed session does not match the requests being made."""
+
+
+class StubFunctionCall:
+    def __init__(self, name, args=None):
+        self.name = name
+        self.args = dict(args or {})
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"function_call {{ name: {self.name!r} args: {self.args!r} }}"
+
+
+class StubPart:
+    def __init__(self, text=None, function_call=None):
+        self.text = text
+        self.function_call = function_call
+
+    def __repr__(self):
+        if self.function_call:
+            return repr(self.function_call)
+        return f"text: {self.text!r}"
+
+
+class StubContent:
+    def __init__(self, parts, role="model"):
+        self.parts = parts
+        self.role = role
+
+
+class StubCandidate:
+    def __init__(self, content):
+        self.content = content
+
+
+class StubResponse:
+    """Response object shaped like genai's GenerateContentResponse."""
+
+    def __init__(self, parts):
+        self.candidates = [StubCandidate(StubContent(parts))]
+
+    @property
+    def text(self):
+        return "".join(part.text for part in self.candidates[0].content.parts if part.text)
+
+    def _chunks(self):
+        # Streams one part per chunk, the granularity Gemini streams function calls at
+        for part in self.candidates[0].content.parts:
+            yield StubResponse([part])
+
+    def __iter__(self):
+        return self._chunks()
+
+    async def __aiter__(self):
+        for chunk in self._chunks():
+            yield chunk
+
+
+def _to_json(value):
+    """Convert proto maps and repeated fields in function call arguments to plain JSON values."""
+    if isinstance(value, Mapping):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def _content_to_dicts(content):
+    parts = []
+    for part in (content.parts if content else None) or []:
+        if getattr(part, 'function_call', None):
+            parts.append({"function_call": {"name": part.function_call.name, "args": _to_json(part.function_call.args)}})
+        elif getattr(part, 'text', None):
+            parts.append({"text": part.text})
+    return parts
+
+
+def response_to_dict(response):
+    """Serialize the parts of a model response (text and function calls)."""
+    return {"parts": _content_to_dicts(response.candidates[0].content) if response.candidates else []}
+
+
+def content_to_text(content):
+    """
+    Render the content of a model response for the conversation history.
+
+    Rendered from the same dict form as response_to_dict, so live proto content and
+    the stubs a replay returns give the same text, and a strict replay matches the
+    requests of the recorded session.
+    """
+    lines = []
+    for part in _content_to_dicts(content):
+        if "function_call" in part:
+            call = part["function_call"]
+            lines.append(f"function_call: {call['name']} {json.dumps(call['args'], sort_keys=True)}")
+        else:
+            lines.append(part["text"])
+    return "\n".join(lines)
+
+
+def response_from_dict(data):
+    """Build a StubResponse from the output of response_to_dict."""
+    parts = []
+    for part in data.get("parts", []):
+        if "function_call" in part:
+            call = part["function_call"]
+            parts.append(StubPart(function_call=StubFunctionCall(call["name"], call.get("args"))))
+        else:
+            parts.append(StubPart(text=part.get("text", "")))
+    return StubResponse(parts)
+
+
+class _Transport:
+    """Base class deriving the async API from generate_content."""
+
+    def generate_content(self, messages):
+        raise NotImplementedError
+
+    async def generate_content_async(self, messages, stream=False):
+        return self.generate_content(messages)
+
+
+class ScriptedTransport(_Transport):
+    """
+    Stub model returning a fixed script of responses, one per request.
+
+    Each script item is a string (a text answer), a dict with a "function_calls" list
+    of {"name": ..., "args": ...} (and optional "text"), or a ready-made response.
+    After the script runs out, the last item is repeated.
+    """
+
+    def __init__(self, script, latency=0.0):
+        self.script = list(script)
+        self.latency = latency
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def _build(self, item):
+        if isinstance(item, str):
+            return StubResponse([StubPart(text=item)])
+        if isinstance(item, Mapping):
+            parts = [StubPart(text=item["text"])] if item.get("text") else []
+            parts.extend(
+                StubPart(function_call=StubFunctionCall(call["name"], call.get("args")))
+                for call in item.get("function_calls", [])
+            )
+            return StubResponse(parts)
+        return item
+
+    def generate_content(self, messages):
+        with self._lock:
+            index = min(len(self.requests), len(self.script) - 1)
+            self.requests.append(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        return self._build(self.script[index])
+
+
+class RecordingTransport(_Transport):
+    """Forwards requests to a live model and appends each request/response pair to a JSON lines file."""
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, messages, response, elapsed):
+        record = {"request": _to_json(messages), "response": response_to_dict(response), "latency": elapsed}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def generate_content(self, messages):
+        start = time.perf_counter()
+        response = self.model.generate_content(messages)
+        self._record(messages, response, time.perf_counter() - start)
+        return response
+
+    async def generate_content_async(self, messages, stream=False):
+        # Recording needs the complete response, so the live request is not streamed;
+        # the replayed stub can still be consumed as a stream
+        start = time.perf_counter()
+        response = await self.model.generate_content_async(messages)
+        self._record(messages, response, time.perf_counter() - start)
+        return response_from_dict(response_to_dict(response)) if stream else response
+
+
+class ReplayTransport(_Transport):
+    """
+    Serves responses from a file written by RecordingTransport, in order.
+
+    Args:
+        path (str): Recording file
+        strict (bool): Raise ReplayError when a request differs from the recorded one
+        replay_latency (bool): Sleep for the recorded model latency before answering
+    """
+
+    def __init__(self, path, strict=False, replay_latency=False):
+        with open(path, "r", encoding="utf-8") as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self.strict = strict
+        self.replay_latency = replay_latency
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, messages):
+        with self._lock:
+            if self._next >= len(self.records):
+                raise ReplayError(f"Recording exhausted after {len(self.records)} responses")
+            record = self.records[self._next]
+            self._next += 1
+        if self.strict and _to_json(messages) != record["request"]:
+            raise ReplayError(f"Request {self._next} does not match the recording")
+        if self.replay_latency and record.get("latency"):
+            time.sleep(record["latency"])
+        return response_from_dict(record["response"])
+
+
+def make_transport(spec, live_model_factory):
+    """
+    Create the model transport selected by spec.
+
+    Args:
+        spec (str): None or "live" for the live model, "record:<path>" to record the
+            live session, "replay:<path>" to replay a recording offline
+        live_model_factory (callable): Returns the live model; only called if needed
+
+    Returns:
+        The model or transport to pass to the agent loop
+    """
+    if not spec or spec == "live":
+        return live_model_factory()
+    kind, _, path = spec.partition(":")
+    if kind == "record" and path:
+        return RecordingTransport(live_model_factory(), path)
+    if kind == "replay" and path:
+        return ReplayTransport(path)
+    raise ValueError(f'Unknown transport "{spec}" (expected "live", "record:<path>" or "replay:<path>")')
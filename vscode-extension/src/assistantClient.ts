@@ -0,0 +1,116 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import * as readline from 'readline';
+
+interface PendingRequest {
+    resolve: (result: any) => void;
+    reject: (error: Error) => void;
+}
+
+/**
+ * Client for the JSON-RPC server started with `api_wrapper.py --serve`.
+ *
+ * One long-lived Python process is kept per workspace folder, so commands do not
+ * pay interpreter startup and SDK import on every invocation. The process is
+ * started lazily and restarted on the next request if it exits.
+ */
+export class AssistantClient {
+    private process: ChildProcessWithoutNullStreams | undefined;
+    private nextId = 1;
+    private pending = new Map<number, PendingRequest>();
+    private stderr = '';
+
+    constructor(
+        private readonly pythonPath: string,
+        private readonly scriptPath: string,
+        private readonly cwd: string
+    ) {}
+
+    private start(): ChildProcessWithoutNullStreams {
+        const child = spawn(this.pythonPath, [this.scriptPath, '--serve'], { cwd: this.cwd });
+        this.stderr = '';
+
+        const lines = readline.createInterface({ input: child.stdout });
+        lines.on('line', (line) => this.handleLine(line));
+
+        child.stderr.on('data', (data) => {
+            // Keep the tail of stderr for error reports
+            this.stderr = (this.stderr + data.toString()).slice(-4000);
+        });
+
+        child.on('exit', (code) => {
+            if (this.process === child) {
+                this.process = undefined;
+            }
+            const error = new Error(`Assistant process exited with code ${code}: ${this.stderr}`);
+            for (const request of this.pending.values()) {
+                request.reject(error);
+            }
+            this.pending.clear();
+        });
+
+        child.on('error', (error) => {
+            if (this.process === child) {
+                this.process = undefined;
+            }
+            for (const request of this.pending.values()) {
+                request.reject(error);
+            }
+            this.pending.clear();
+        });
+
+        return child;
+    }
+
+    private handleLine(line: string) {
+        let message: any;
+        try {
+            message = JSON.parse(line);
+        } catch {
+            return;
+        }
+        for (const response of Array.isArray(message) ? message : [message]) {
+            const request = this.pending.get(response.id);
+            if (!request) {
+                continue;
+            }
+            this.pending.delete(response.id);
+            if (response.error) {
+                request.reject(new Error(response.error.message));
+            } else {
+                request.resolve(response.result);
+            }
+        }
+    }
+
+    private send(message: object) {
+        if (!this.process) {
+            this.process = this.start();
+        }
+        this.process.stdin.write(JSON.stringify(message) + '\n');
+    }
+
+    /**
+     * Call a CodingAssistantAPI method. Cancelling the token sends `$/cancelRequest`.
+     */
+    request<T = string>(method: string, params: object, token?: { onCancellationRequested: (listener: () => void) => any }): Promise<T> {
+        const id = this.nextId++;
+        const promise = new Promise<T>((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+        });
+        this.send({ jsonrpc: '2.0', id, method, params });
+        token?.onCancellationRequested(() => {
+            if (this.pending.has(id)) {
+                this.send({ jsonrpc: '2.0', method: '$/cancelRequest', params: { id } });
+            }
+        });
+        return promise;
+    }
+
+    dispose() {
+        if (this.process) {
+            this.process.stdin.write(JSON.stringify({ jsonrpc: '2.0', method: 'exit' }) + '\n');
+            this.process.stdin.end();
+            this.process = undefined;
+        }
+    }
+}
@@ -1,73 +1,69 @@
 import * as vscode from 'vscode';
-import { spawn } from 'child_process';
 import * as path from 'path';
+import { AssistantClient } from './assistantClient';
+
+// One warm assistant process per workspace folder
+const clients = new Map<string, AssistantClient>();
 
 export function activate(context: vscode.ExtensionContext) {
     console.log('Coding Assist with Gemini extension is now active!');
 
-    // Command to list files
-    let listFilesDisposable = vscode.commands.registerCommand('coding-assist-gemini.listFiles', () => {
+    const scriptPath = path.join(context.extensionPath, '..', 'api_wrapper.py');
+
+    function getClient(folder: vscode.WorkspaceFolder): AssistantClient {
+        const key = folder.uri.fsPath;
+        let client = clients.get(key);
+        if (!client) {
+            client = new AssistantClient(getPythonPath(), scriptPath, key);
+            clients.set(key, client);
+        }
+        return client;
+    }
+
+    function getWorkspaceFolder(): vscode.WorkspaceFolder | undefined {
         const workspaceFolders = vscode.workspace.workspaceFolders;
         if (!workspaceFolders) {
             vscode.window.showErrorMessage('No workspace folder open');
-            return;
+            return undefined;
         }
+        return workspaceFolders[0];
+    }
 
-        const pythonPath = getPythonPath();
-        const scriptPath = path.join(context.extensionPath, '..', 'api_wrapper.py');
-
-        const process = spawn(pythonPath, [scriptPath, 'list_files'], {
-            cwd: workspaceFolders[0].uri.fsPath
-        });
-
-        let output = '';
-        process.stdout.on('data', (data) => {
-            output += data.toString();
-        });
+    // Command to list files
+    let listFilesDisposable = vscode.commands.registerCommand('coding-assist-gemini.listFiles', async () => {
+        const folder = getWorkspaceFolder();
+        if (!folder) {
+            return;
+        }
 
-        process.on('close', (code) => {
-            if (code === 0) {
-                vscode.window.showInformationMessage(output);
-            } else {
-                vscode.window.showErrorMessage(`Error listing files: ${output}`);
-            }
-        });
+        try {
+            const output = await getClient(folder).request('list_files', {});
+            vscode.window.showInformationMessage(output);
+        } catch (error) {
+            vscode.window.showErrorMessage(`Error listing files: ${errorMessage(error)}`);
+        }
     });
 
     // Command to read file
-    let readFileDisposable = vscode.commands.registerCommand('coding-assist-gemini.readFile', (uri: vscode.Uri) => {
-        const workspaceFolders = vscode.workspace.workspaceFolders;
-        if (!workspaceFolders) {
-            vscode.window.showErrorMessage('No workspace folder open');
+    let readFileDisposable = vscode.commands.registerCommand('coding-assist-gemini.readFile', async (uri: vscode.Uri) => {
+        const folder = getWorkspaceFolder();
+        if (!folder) {
             return;
         }
 
-        const filePath = path.relative(workspaceFolders[0].uri.fsPath, uri.fsPath);
-        const pythonPath = getPythonPath();
-        const scriptPath = path.join(context.extensionPath, '..', 'api_wrapper.py');
-
-        const process = spawn(pythonPath, [scriptPath, 'read_file', filePath], {
-            cwd: workspaceFolders[0].uri.fsPath
-        });
-
-        let output = '';
-        process.stdout.on('data', (data) => {
-            output += data.toString();
-        });
-
-        process.on('close', (code) => {
-            if (code === 0) {
-                const panel = vscode.window.createWebviewPanel(
-                    'fileContent',
-                    `Content of ${filePath}`,
-                    vscode.ViewColumn.One,
-                    {}
-                );
-                panel.webview.html = getWebviewContent(output);
-            } else {
-                vscode.window.showErrorMessage(`Error reading file: ${output}`);
-            }
-        });
+        const filePath = path.relative(folder.uri.fsPath, uri.fsPath);
+        try {
+            const output = await getClient(folder).request('read_file', { file_path: filePath });
+            const panel = vscode.window.createWebviewPanel(
+                'fileContent',
+                `Content of ${filePath}`,
+                vscode.ViewColumn.One,
+                {}
+            );
+            panel.webview.html = getWebviewContent(output);
+        } catch (error) {
+            vscode.window.showErrorMessage(`Error reading file: ${errorMessage(error)}`);
+        }
     });
 
     // Command to ask AI
@@ -77,110 +73,79 @@ export function activate(context: vscode.ExtensionContext) {
         });
 
         if (question) {
-            const workspaceFolders = vscode.workspace.workspaceFolders;
-            if (!workspaceFolders) {
-                vscode.window.showErrorMessage('No workspace folder open');
+            const folder = getWorkspaceFolder();
+            if (!folder) {
                 return;
             }
 
-            const pythonPath = getPythonPath();
-            const scriptPath = path.join(context.extensionPath, '..', 'api_wrapper.py');
-
-            const process = spawn(pythonPath, [scriptPath, 'ask_ai', question], {
-                cwd: workspaceFolders[0].uri.fsPath
-            });
-
-            let output = '';
-            process.stdout.on('data', (data) => {
-                output += data.toString();
-            });
-
-            process.on('close', (code) => {
-                if (code === 0) {
-                    const panel = vscode.window.createWebviewPanel(
-                        'aiResponse',
-                        'AI Response',
-                        vscode.ViewColumn.One,
-                        {}
-                    );
-                    panel.webview.html = getWebviewContent(output);
-                } else {
-                    vscode.window.showErrorMessage(`Error asking AI: ${output}`);
-                }
-            });
-        }
-    });
-
-    // Command to analyze code complexity
-    let analyzeCodeDisposable = vscode.commands.registerCommand('coding-assist-gemini.analyzeCode', (uri: vscode.Uri) => {
-        const workspaceFolders = vscode.workspace.workspaceFolders;
-        if (!workspaceFolders) {
-            vscode.window.showErrorMessage('No workspace folder open');
-            return;
-        }
-
-        const filePath = path.relative(workspaceFolders[0].uri.fsPath, uri.fsPath);
-        const pythonPath = getPythonPath();
-        const scriptPath = path.join(context.extensionPath, '..', 'api_wrapper.py');
-
-        const process = spawn(pythonPath, [scriptPath, 'analyze_complexity', filePath], {
-            cwd: workspaceFolders[0].uri.fsPath
-        });
-
-        let output = '';
-        process.stdout.on('data', (data) => {
-            output += data.toString();
-        });
-
-        process.on('close', (code) => {
-            if (code === 0) {
+            try {
+                const output = await vscode.window.withProgress(
+                    { location: vscode.ProgressLocation.Notification, title: 'Asking AI...', cancellable: true },
+                    (_progress, token) => getClient(folder).request('ask_ai', { prompt: question }, token)
+                );
                 const panel = vscode.window.createWebviewPanel(
-                    'complexityAnalysis',
-                    `Complexity Analysis of ${filePath}`,
+                    'aiResponse',
+                    'AI Response',
                     vscode.ViewColumn.One,
                     {}
                 );
                 panel.webview.html = getWebviewContent(output);
-            } else {
-                vscode.window.showErrorMessage(`Error analyzing code: ${output}`);
+            } catch (error) {
+                vscode.window.showErrorMessage(`Error asking AI: ${errorMessage(error)}`);
             }
-        });
+        }
     });
 
-    // Command to find duplicates
-    let findDuplicatesDisposable = vscode.commands.registerCommand('coding-assist-gemini.findDuplicates', (uri: vscode.Uri) => {
-        const workspaceFolders = vscode.workspace.workspaceFolders;
-        if (!workspaceFolders) {
-            vscode.window.showErrorMessage('No workspace folder open');
+    // Command to analyze code complexity
+    let analyzeCodeDisposable = vscode.commands.registerCommand('coding-assist-gemini.analyzeCode', async (uri: vscode.Uri) => {
+        const folder = getWorkspaceFolder();
+        if (!folder) {
             return;
         }
 
-        const filePath = path.relative(workspaceFolders[0].uri.fsPath, uri.fsPath);
-        const pythonPath = getPythonPath();
-        const scriptPath = path.join(context.extensionPath, '..', 'api_wrapper.py');
+        const filePath = path.relative(folder.uri.fsPath, uri.fsPath);
+        try {
+            const output = await getClient(folder).request('analyze_complexity', { file_path: filePath });
+            const panel = vscode.window.createWebviewPanel(
+                'complexityAnalysis',
+                `Complexity Analysis of ${filePath}`,
+                vscode.ViewColumn.One,
+                {}
+            );
+            panel.webview.html = getWebviewContent(output);
+        } catch (error) {
+            vscode.window.showErrorMessage(`Error analyzing code: ${errorMessage(error)}`);
+        }
+    });
 
-        const process = spawn(pythonPath, [scriptPath, 'find_duplicates', filePath], {
-            cwd: workspaceFolders[0].uri.fsPath
-        });
+    // Command to find duplicates
+    let findDuplicatesDisposable = vscode.commands.registerCommand('coding-assist-gemini.findDuplicates', async (uri: vscode.Uri) => {
+        const folder = getWorkspaceFolder();
+        if (!folder) {
+            return;
+        }
 
-        let output = '';
-        process.stdout.on('data', (data) => {
-            output += data.toString();
-        });
+        const filePath = path.relative(folder.uri.fsPath, uri.fsPath);
+        try {
+            const output = await getClient(folder).request('find_duplicates', { file_path: filePath });
+            const panel = vscode.window.createWebviewPanel(
+                'duplicateCode',
+                `Duplicate Code in ${filePath}`,
+                vscode.ViewColumn.One,
+                {}
+            );
+            panel.webview.html = getWebviewContent(output);
+        } catch (error) {
+            vscode.window.showErrorMessage(`Error finding duplicates: ${errorMessage(error)}`);
+        }
+    });
 
-        process.on('close', (code) => {
-            if (code === 0) {
-                const panel = vscode.window.createWebviewPanel(
-                    'duplicateCode',
-                    `Duplicate Code in ${filePath}`,
-                    vscode.ViewColumn.One,
-                    {}
-                );
-                panel.webview.html = getWebviewContent(output);
-            } else {
-                vscode.window.showErrorMessage(`Error finding duplicates: ${output}`);
-            }
-        });
+    // Stop the assistant process of a folder removed from the workspace
+    let workspaceFoldersDisposable = vscode.workspace.onDidChangeWorkspaceFolders((event) => {
+        for (const folder of event.removed) {
+            clients.get(folder.uri.fsPath)?.dispose();
+            clients.delete(folder.uri.fsPath);
+        }
     });
 
     context.subscriptions.push(listFilesDisposable);
@@ -188,6 +153,7 @@ export function activate(context: vscode.ExtensionContext) {
     context.subscriptions.push(askAIDisposable);
     context.subscriptions.push(analyzeCodeDisposable);
     context.subscriptions.push(findDuplicatesDisposable);
+    context.subscriptions.push(workspaceFoldersDisposable);
 }
 
 function getPythonPath(): string {
@@ -195,6 +161,10 @@ function getPythonPath(): string {
     return config.get('pythonPath', 'python');
 }
 
+function errorMessage(error: unknown): string {
+    return error instanceof Error ? error.message : String(error);
+}
+
 function getWebviewContent(content: string): string {
     return `<!DOCTYPE html>
 <html lang="en">
@@ -209,4 +179,9 @@ function getWebviewContent(content: string): string {
 </html>`;
 }
 
-export function deactivate() {}
\ No newline at end of file
+export function deactivate() {
+    for (const client of clients.values()) {
+        client.dispose();
+    }
+    clients.clear();
+}